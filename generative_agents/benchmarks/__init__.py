@@ -0,0 +1 @@
+"""generative_agents.benchmarks"""
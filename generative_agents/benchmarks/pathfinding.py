@@ -0,0 +1,131 @@
+"""generative_agents.benchmarks.pathfinding
+
+寻路基准测试：在经典地图上对比原BFS寻路与基于碰撞位图的A*寻路、一次多目标搜索与逐个目标搜索，以及地址流场的建立与查询
+运行方式（在generative_agents目录下）：python -m benchmarks.pathfinding --pairs 200
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules import utils
+from modules.maze import Maze
+
+
+def bfs_path(maze, src_coord, dst_coord):
+    """The original breadth first search of Maze.find_path, kept for comparison"""
+
+    map = [[0 for _ in range(maze.maze_width)] for _ in range(maze.maze_height)]
+    frontier, visited = [src_coord], set()
+    map[src_coord[1]][src_coord[0]] = 1
+    while map[dst_coord[1]][dst_coord[0]] == 0:
+        new_frontier = []
+        for f in frontier:
+            for c in maze.get_around(f):
+                if (
+                    0 < c[0] < maze.maze_width - 1
+                    and 0 < c[1] < maze.maze_height - 1
+                    and map[c[1]][c[0]] == 0
+                    and c not in visited
+                ):
+                    map[c[1]][c[0]] = map[f[1]][f[0]] + 1
+                    new_frontier.append(c)
+                    visited.add(c)
+        frontier = new_frontier
+    step = map[dst_coord[1]][dst_coord[0]]
+    path = [dst_coord]
+    while step > 1:
+        for c in maze.get_around(path[-1]):
+            if map[c[1]][c[0]] == step - 1:
+                path.append(c)
+                break
+        step -= 1
+    return path[::-1]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def summarize(costs):
+    costs = sorted(costs)
+    return {
+        "total_ms": round(sum(costs) * 1000, 2),
+        "p50_ms": round(costs[len(costs) // 2] * 1000, 4),
+        "max_ms": round(costs[-1] * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="path finding benchmark")
+    parser.add_argument("--maze", type=str, default="frontend/static/assets/village/maze.json", help="maze config")
+    parser.add_argument("--pairs", type=int, default=200, help="random reachable pairs to search")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    maze = Maze(utils.load_dict(args.maze), None)
+    walkable = [tuple(c) for c in zip(*maze.path_finder.walkable.nonzero()[::-1])]
+
+    # 单目标：原BFS与A*
+    bfs_costs, astar_costs, pairs = [], [], []
+    while len(pairs) < args.pairs:
+        src, dst = random.sample(walkable, 2)
+        path, cost = timed(maze.find_path, src, dst)
+        if not path:
+            continue
+        expected, bfs_cost = timed(bfs_path, maze, src, dst)
+        assert len(path) == len(expected), "A* path is not the shortest"
+        pairs.append((src, dst))
+        astar_costs.append(cost)
+        bfs_costs.append(bfs_cost)
+
+    # 多目标：Agent前往某个地址的所有瓦片
+    addresses = [a for a, tiles in maze.address_tiles.items() if len(tiles) > 1]
+    sample_costs, any_costs, shorter = [], [], 0
+    for src, _ in pairs:
+        tiles = list(maze.address_tiles[random.choice(addresses)])
+        targets = random.sample(tiles, min(len(tiles), 4))
+        start = time.perf_counter()
+        pathes = [bfs_path(maze, src, t) for t in targets if maze.find_path(src, t)]
+        sample_costs.append(time.perf_counter() - start)
+        path, cost = timed(maze.find_path_any, src, tiles)
+        any_costs.append(cost)
+        if pathes and path and len(path) < min(len(p) for p in pathes):
+            shorter += 1
+
+    # 流场：每个地址建立一次，之后的查询只沿着下一步前进
+    field_costs, flow_costs = [], []
+    for src, _ in pairs:
+        address = random.choice(addresses)
+        if address not in maze._flow_fields:
+            _, cost = timed(maze.get_flow_field, address)
+            field_costs.append(cost)
+        path, cost = timed(maze.find_path_to_address, src, address)
+        flow_costs.append(cost)
+        assert len(path) == len(maze.find_path_any(src, maze.address_tiles[address]))
+
+    report = {
+        "pairs": len(pairs),
+        "avg_path": round(sum(len(maze.find_path(*p)) for p in pairs) / len(pairs), 1),
+        "bfs": summarize(bfs_costs),
+        "astar": summarize(astar_costs),
+        "bfs_4_targets": summarize(sample_costs),
+        "astar_any_target": summarize(any_costs),
+        "shorter_paths": shorter,
+        "flow_field_build": summarize(field_costs),
+        "flow_field_path": summarize(flow_costs),
+        "path_finder": maze.path_finder.get_summary(),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""generative_agents.benchmarks.prompt_build
+
+对比每次读取模板文件与模板注册表+base_desc缓存的prompt构建开销
+运行方式（在generative_agents目录下）：python -m benchmarks.prompt_build
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from string import Template
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules import utils
+from modules.prompt.template import get_template_registry
+
+
+AGENT_CONFIG = {
+    "age": 25,
+    "innate": "友好, 好奇",
+    "learned": "喜欢画画",
+    "lifestyle": "早睡早起",
+    "daily_plan": "上午画画，下午散步",
+}
+
+
+def _base_data(currently):
+    return {
+        "name": "测试",
+        "date": utils.get_timer().daily_format_cn(),
+        "currently": currently,
+        **AGENT_CONFIG,
+    }
+
+
+def legacy_build(template, data, folder="data/prompts"):
+    with open(f"{folder}/{template}.txt", "r", encoding="utf-8") as file:
+        file_content = file.read()
+    return Template(file_content).substitute(data)
+
+
+def run_legacy(rounds):
+    for _ in range(rounds):
+        base_desc = legacy_build("base_desc", _base_data("在画画"))
+        legacy_build("poignancy_event", {"base_desc": base_desc, "agent": "测试", "event": "测试 正在 画画"})
+
+
+def run_registry(rounds):
+    registry = get_template_registry("data/prompts")
+    cache = (None, "")
+    for _ in range(rounds):
+        key = (utils.get_timer().daily_format_cn(), "在画画", registry.version("base_desc"))
+        if cache[0] != key:
+            cache = (key, registry.render("base_desc", _base_data("在画画")))
+        registry.render(
+            "poignancy_event", {"base_desc": cache[1], "agent": "测试", "event": "测试 正在 画画"}
+        )
+
+
+def measure(func, rounds):
+    start = time.perf_counter()
+    func(rounds)
+    cost = time.perf_counter() - start
+    return {"total_ms": round(cost * 1000, 3), "per_prompt_us": round(cost * 1e6 / rounds, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="prompt construction benchmark")
+    parser.add_argument("--rounds", type=int, default=20000, help="prompts to build")
+    args = parser.parse_args()
+
+    utils.set_timer("20240213-09:30")
+    report = {
+        "rounds": args.rounds,
+        "legacy": measure(run_legacy, args.rounds),
+        "registry": measure(run_registry, args.rounds),
+    }
+    report["speedup"] = round(
+        report["legacy"]["total_ms"] / max(report["registry"]["total_ms"], 1e-6), 2
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""generative_agents.benchmarks.quantize
+
+记忆向量量化评估：读取检查点中各Agent的记忆索引，统计float16/int8存储节省的内存以及与float32检索排名的一致程度
+检查点只会被读取，不会被修改
+运行方式（在generative_agents目录下）：python -m benchmarks.quantize --checkpoint results/checkpoints/<name>
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules.storage.index import LlamaIndex
+
+
+def find_associates(checkpoint):
+    storage = os.path.join(checkpoint, "storage")
+    if not os.path.isdir(storage):
+        return {}
+    folders = {}
+    for name in sorted(os.listdir(storage)):
+        path = os.path.join(storage, name, "associate")
+        if os.path.isdir(path):
+            folders[name] = path
+    return folders
+
+
+def matrix_bytes(index):
+    size = index.nodes_num
+    if index._dim is None:
+        return 0
+    nbytes = size * index._dim * index._dtype.itemsize
+    if index._dtype == np.int8:
+        nbytes += index._columns["scale"][:size].nbytes
+    return nbytes
+
+
+def top_ids(index, queries, k):
+    return [[n.id_ for n in index.search_vector(q, k)] for q in queries]
+
+
+def compare(base, index, queries, k):
+    expected, retrieved = top_ids(base, queries, k), top_ids(index, queries, k)
+    recall = [len(set(r) & set(e)) / max(len(e), 1) for r, e in zip(retrieved, expected)]
+    top1 = [r[:1] == e[:1] for r, e in zip(retrieved, expected)]
+    return {
+        "recall": float(np.mean(recall)) if recall else 1.0,
+        "top1": float(np.mean(top1)) if top1 else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="embedding quantization report")
+    parser.add_argument("--checkpoint", type=str, required=True, help="checkpoint folder, results/checkpoints/<name>")
+    parser.add_argument("--embedding", type=str, default="hash", help="embedding provider for nodes stored without vectors")
+    parser.add_argument("--queries", type=int, default=200, help="stored memories used as queries per agent")
+    parser.add_argument("--k", type=int, default=30, help="k of recall@k")
+    args = parser.parse_args()
+
+    associates = find_associates(args.checkpoint)
+    if not associates:
+        print("No associate storage found in " + args.checkpoint)
+        return
+
+    rng = np.random.default_rng(0)
+    embedding = {"provider": args.embedding}
+    report = {"checkpoint": args.checkpoint, "agents": len(associates), "k": args.k}
+    totals = {d: {"bytes": 0, "recall": [], "top1": []} for d in LlamaIndex.dtypes}
+    nodes = 0
+    for name, path in associates.items():
+        base = LlamaIndex(embedding, path)
+        nodes += base.nodes_num
+        totals["float32"]["bytes"] += matrix_bytes(base)
+        if not base.nodes_num:
+            continue
+        vectors = base.get_vectors()
+        count = min(args.queries, len(vectors))
+        queries = vectors[rng.choice(len(vectors), count, replace=False)]
+        for dtype in LlamaIndex.dtypes[1:]:
+            index = LlamaIndex(embedding, path, dtype=dtype)
+            totals[dtype]["bytes"] += matrix_bytes(index)
+            agreement = compare(base, index, queries, args.k)
+            totals[dtype]["recall"].append(agreement["recall"])
+            totals[dtype]["top1"].append(agreement["top1"])
+
+    report["nodes"] = nodes
+    base_bytes = totals["float32"]["bytes"]
+    for dtype, total in totals.items():
+        report[dtype] = {
+            "mb": round(total["bytes"] / 2**20, 3),
+            "ratio": round(total["bytes"] / base_bytes, 4) if base_bytes else 1.0,
+        }
+        if dtype != "float32":
+            report[dtype]["recall"] = round(float(np.mean(total["recall"] or [1.0])), 4)
+            report[dtype]["top1"] = round(float(np.mean(total["top1"] or [1.0])), 4)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""generative_agents.benchmarks.retrieval
+
+记忆检索延迟基准测试：在单个Agent的向量索引中写入大量记忆后测量检索耗时
+运行方式（在generative_agents目录下）：python -m benchmarks.retrieval --memories 10000
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from modules import utils
+from modules.memory.associate import Associate
+from modules.memory.event import Event
+from modules.storage.index import LlamaIndex
+
+
+SUBJECTS = ["简", "汤姆", "梅", "约翰", "埃迪", "克劳斯", "玛丽亚"]
+PREDICATES = ["正在", "觉得", "计划", "讨论"]
+OBJECTS = ["做早餐", "卖菜", "画画", "散步", "读书", "写诗", "整理店铺", "喝咖啡"]
+
+
+def measure(func, rounds):
+    costs = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        costs.append(time.perf_counter() - start)
+    costs.sort()
+    return {
+        "p50_ms": round(costs[len(costs) // 2] * 1000, 4),
+        "p95_ms": round(costs[int(len(costs) * 0.95) - 1] * 1000, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="memory retrieval benchmark")
+    parser.add_argument("--memories", type=int, default=10000, help="memories of the agent")
+    parser.add_argument("--rounds", type=int, default=200, help="retrievals to measure")
+    parser.add_argument("--embedding", type=str, default="hash", help="embedding provider")
+    args = parser.parse_args()
+
+    utils.set_timer("20240213-09:30")
+    random.seed(0)
+    associate = Associate(tempfile.mkdtemp(prefix="retrieval-"), {"provider": args.embedding})
+    start = time.perf_counter()
+    for _ in range(args.memories):
+        event = Event(
+            random.choice(SUBJECTS),
+            random.choice(PREDICATES),
+            random.choice(OBJECTS),
+            address=["the Ville", "咖啡馆"],
+        )
+        node_type = random.choice(["event", "event", "thought", "chat"])
+        associate.add_node(node_type, event, random.randint(1, 10))
+    insert_cost = time.perf_counter() - start
+
+    index = associate.index
+    report = {
+        "memories": index.nodes_num,
+        "insert_us": round(insert_cost * 1e6 / args.memories, 2),
+        "embed_query": measure(lambda: index._embed("简 正在 做早餐"), args.rounds),
+        "retrieve_events": measure(lambda: associate.retrieve_events("简 正在 做早餐"), args.rounds),
+        "retrieve_focus": measure(
+            lambda: associate.retrieve_focus(["简 的计划", "在 简 的生活中，重要的近期事件。"]),
+            max(args.rounds // 10, 1),
+        ),
+    }
+    report["abstract"] = measure(associate.abstract, max(args.rounds // 10, 1))
+    report["embedding_cache"] = index._embed_model._cache.get_summary()
+    report["search_events"] = measure(
+        lambda: index.search(
+            "简 正在 做早餐", 5, filters=associate._type_filters("event")
+        ),
+        args.rounds,
+    )
+
+    # 持久化：首次保存写快照，之后每步只追加新增记忆
+    start = time.perf_counter()
+    associate.to_dict()
+    report["snapshot_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    step_costs = []
+    for i in range(10):
+        associate.add_node("event", Event("简", "正在", "记录 {}".format(i), address=["家"]), 3)
+        start = time.perf_counter()
+        associate.to_dict()
+        step_costs.append(time.perf_counter() - start)
+    report["checkpoint_ms"] = round(max(step_costs) * 1000, 3)
+    start = time.perf_counter()
+    reloaded = LlamaIndex({"provider": args.embedding}, index._path)
+    report["reload_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    assert reloaded.nodes_num == index.nodes_num
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""generative_agents.benchmarks.simulate
+
+端到端模拟吞吐量基准测试：使用离线LLM无界面运行SimulateServer，输出可在提交之间对比的JSON报告
+运行方式（在generative_agents目录下）：
+    python -m benchmarks.simulate --agents 25 --step 10 --map_type classic --output results/bench.json
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from start import SimulateServer, get_config
+from modules import utils
+from modules.storage.embedding_cache import get_embedding_cache
+
+agents_root = os.path.join(
+    os.path.dirname(__file__), "..", "frontend", "static", "assets", "village", "agents"
+)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, math.ceil(p / 100.0 * len(values)) - 1))
+    return values[idx]
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux返回KB，macOS返回字节
+    if sys.platform == "darwin":
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+def git_commit():
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10
+        )
+        return output.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def find_agents():
+    """Names of the agent folders whose agent.json can be placed on the classic map"""
+
+    agents = []
+    for name in sorted(os.listdir(agents_root)):
+        path = os.path.join(agents_root, name, "agent.json")
+        if os.path.isfile(path) and "spatial" in utils.load_dict(path):
+            agents.append(name)
+    return agents
+
+
+def llm_calls(game):
+    return sum(
+        a._llm._summary["total"][0] for a in game.agents.values() if a._llm
+    )
+
+
+def create_config(args):
+    config = get_config(args.start, args.stride, find_agents()[: args.agents])
+    config["map_type"] = args.map_type
+    config["workers"] = args.workers
+    llm_config = {
+        "provider": "replay",
+        "mode": "replay" if args.llm_cassette else "synthetic",
+        "cassette": args.llm_cassette,
+        "latency": args.llm_latency,
+    }
+    config["agent_base"].setdefault("think", {})["llm"] = llm_config
+    if args.embedding:
+        config["agent_base"].setdefault("associate", {})["embedding"] = {"provider": args.embedding}
+    return config
+
+
+def run_benchmark(args):
+    checkpoints_folder = tempfile.mkdtemp(prefix="benchmark-")
+    try:
+        config = create_config(args)
+        # 记忆存储也放在临时目录中，每次运行都从空的记忆开始
+        config["storage_root"] = os.path.join(checkpoints_folder, "storage")
+        start = time.perf_counter()
+        server = SimulateServer(
+            os.path.basename(checkpoints_folder),
+            "frontend/static",
+            checkpoints_folder,
+            config,
+            0,
+            args.verbose,
+        )
+        setup_cost = time.perf_counter() - start
+
+        latencies, calls = [], []
+        for i in range(args.step):
+            server.start_step = i
+            before = llm_calls(server.game)
+            start = time.perf_counter()
+            server.simulate(1, args.stride)
+            latencies.append(time.perf_counter() - start)
+            calls.append(llm_calls(server.game) - before)
+
+        elapsed = sum(latencies)
+        return {
+            "commit": git_commit(),
+            "config": {
+                "agents": len(config["agents"]),
+                "step": args.step,
+                "stride": args.stride,
+                "map_type": args.map_type,
+                "workers": args.workers,
+                "llm_mode": config["agent_base"]["think"]["llm"]["mode"],
+                "llm_latency": args.llm_latency,
+                "embedding": config["agent_base"]["associate"]["embedding"]["provider"],
+            },
+            "setup_s": round(setup_cost, 3),
+            "elapsed_s": round(elapsed, 3),
+            "steps_per_sec": round(args.step / elapsed, 4) if elapsed else 0.0,
+            "step_latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p95": round(percentile(latencies, 95) * 1000, 2),
+                "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+            },
+            "llm_calls": sum(calls),
+            "llm_calls_per_step": round(sum(calls) / max(len(calls), 1), 2),
+            "peak_rss_mb": peak_rss_mb(),
+            "world_ticks": server.game.scheduler.get_summary()["systems"],
+            "embedding_cache": get_embedding_cache().get_summary(),
+        }
+    finally:
+        shutil.rmtree(checkpoints_folder, ignore_errors=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="simulation throughput benchmark")
+    parser.add_argument("--agents", type=int, default=len(find_agents()), help="Number of agents")
+    parser.add_argument("--step", type=int, default=10, help="The simulate step")
+    parser.add_argument("--stride", type=int, default=10, help="The step stride in minute")
+    parser.add_argument("--start", type=str, default="20240213-09:30", help="The starting time of the simulated ville")
+    parser.add_argument("--map_type", type=str, default="classic", choices=["classic", "infinite"], help="The map type")
+    parser.add_argument("--workers", type=int, default=1, help="Number of agents thinking in parallel")
+    parser.add_argument("--llm_cassette", type=str, default="", help="Replay this recorded cassette instead of synthetic outputs")
+    parser.add_argument("--llm_latency", type=float, default=0.0, help="Artificial latency in seconds of every llm call")
+    parser.add_argument("--embedding", type=str, default="hash", help="Embedding provider, empty to use data/config.json")
+    parser.add_argument("--verbose", type=str, default="error", help="The verbose level")
+    parser.add_argument("--output", type=str, default="", help="Path of the json report")
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    report = run_benchmark(args)
+    content = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.output:
+        folder = os.path.dirname(args.output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(content + "\n")
+    print(content)
+
+
+if __name__ == "__main__":
+    main()
@@ -93,11 +93,9 @@ def generate_movement(checkpoints_folder, compressed_folder, compressed_file):
 
     last_location = dict()
 
-    # 加载地图数据，用于计算Agent移动路径
+    # 加载地图数据，用于计算Agent移动路径，优先读取二进制缓存
     json_path = "frontend/static/assets/village/maze.json"
-    with open(json_path, "r", encoding="utf-8") as f:
-        json_data = json.load(f)
-        maze = Maze(json_data, None)
+    maze = Maze.load(json_path)
 
     for file_name in json_files:
         # 依次读取所有存档文件
@@ -124,7 +122,12 @@ def generate_movement(checkpoints_folder, compressed_folder, compressed_file):
                     location = last_location.get(agent_name, all_movement["0"][agent_name])["location"]
                     path = [source_coord]
                 else:
-                    path = maze.find_path(source_coord, target_coord)
+                    # 与模拟时Agent一样使用地址的流场，终点不一致时再单独寻路
+                    path = maze.find_path_to_address(
+                        source_coord, agent_data["action"]["event"]["address"]
+                    )
+                    if not path or list(path[-1]) != list(target_coord):
+                        path = maze.find_path(source_coord, target_coord)
 
                 had_conversation = False
                 step_conversation = ""
@@ -2,7 +2,7 @@
 
 import os
 import math
-import random
+import time
 import datetime
 
 from modules import memory, prompt, utils
@@ -18,10 +18,12 @@ class Agent:
         self.name = config["name"]
         self.maze = maze
         self.conversation = conversation
+        self._pending_conversation = []
         self._llm = None
         self._image_model = None
         self.logger = logger
         self.game = game  # 游戏实例，用于访问环境管理器
+        self.timer = utils.PhaseTimer()  # 认知阶段耗时统计
 
         # agent config
         self.percept_config = config["percept"]
@@ -35,9 +37,15 @@ class Agent:
             os.path.join(config["storage_root"], "associate"), **config["associate"]
         )
         self.concepts, self.chats = [], config.get("chats", [])
+        # events gathered by the last percept, reused while its scope is unchanged
+        self._percepted = None
 
         # prompt
         self.scratch = prompt.Scratch(self.name, config["currently"], config["scratch"])
+        # 每个Agent独立的随机数生成器，思考时不使用全局random，保证并行结果可复现
+        self.rng = self.scratch.rng
+        # move decided during think, applied in the serial commit phase
+        self._pending_move = None
 
         # status
         status = {"poignancy": 0}
@@ -54,8 +62,8 @@ class Agent:
         # action and events
         if "action" in config:
             self.action = memory.Action.from_dict(config["action"])
-            tiles = self.maze.get_address_tiles(self.get_event().address)
-            config["coord"] = random.choice(list(tiles))
+            tiles = self.maze.get_address_tiles(self.get_event().address, rng=self.rng)
+            config["coord"] = self.rng.choice(sorted(tiles))
         else:
             tile = self.maze.tile_at(config["coord"])
             address = tile.get_address("game_object", as_list=True)
@@ -109,7 +117,9 @@ class Agent:
         title, msg = "{}.{}".format(self.name, func_hint), {}
         if self.llm_available():
             self.logger.info("{} -> {}".format(self.name, func_hint))
+            start = time.perf_counter()
             output = self._llm.completion(**prompt, caller=func_hint)
+            self.timer.add_llm(time.perf_counter() - start)
             responses = self._llm.meta_responses
             msg = {"<PROMPT>": "\n" + prompt["prompt"] + "\n"}
             msg.update(
@@ -124,9 +134,18 @@ class Agent:
         self.logger.debug(utils.block_msg(title, msg))
         return output
 
-    def think(self, status, agents):
-        events = self.move(status["coord"], status.get("path"))
-        plan, _ = self.make_schedule()
+    def reseed(self, seed, step):
+        """Reset the random generator of the agent for a simulate step"""
+
+        self.rng.seed("{}:{}:{}".format(seed, step, self.name))
+
+    def think(self, status, agents, events=None):
+        if events is None:
+            self.timer.begin()
+            with self.timer.phase("move"), self.maze.lock:
+                events = self.move(status["coord"], status.get("path"))
+        with self.timer.phase("make_schedule"):
+            plan, _ = self.make_schedule()
 
         # 获取天气数据和影响
         weather_data = self.get_weather_data()
@@ -135,9 +154,9 @@ class Agent:
         if (plan["describe"] == "sleeping" or "睡" in plan["describe"]) and self.is_awake():
             self.logger.info("{} is going to sleep...".format(self.name))
             address = self.spatial.find_address("睡觉", as_list=True)
-            tiles = self.maze.get_address_tiles(address)
-            coord = random.choice(list(tiles))
-            events = self.move(coord)
+            tiles = self.maze.get_address_tiles(address, rng=self.rng)
+            # 瓦片可能属于其他并行分组，移动推迟到提交阶段
+            self._pending_move = self.rng.choice(sorted(tiles))
             self.action = memory.Action(
                 memory.Event(self.name, "正在", "睡觉", address=address, emoji="😴"),
                 memory.Event(
@@ -151,14 +170,40 @@ class Agent:
                 start=utils.get_timer().daily_time(plan["start"]),
             )
         if self.is_awake():
-            self.percept()
+            with self.timer.phase("percept"):
+                self.percept()
             # 在制定计划时考虑天气因素
-            self.make_plan(agents, weather_data=weather_data, weather_effects=weather_effects)
-            self.reflect()
+            with self.timer.phase("make_plan"):
+                self.make_plan(agents, weather_data=weather_data, weather_effects=weather_effects)
+            with self.timer.phase("reflect"):
+                self.reflect()
         else:
             if self.action.finished():
-                self.action = self._determine_action(weather_data=weather_data, weather_effects=weather_effects)
+                with self.timer.phase("determine_action"):
+                    self.action = self._determine_action(weather_data=weather_data, weather_effects=weather_effects)
+
+        with self.timer.phase("find_path"):
+            # 推迟的移动会直接到达目标地址，不需要寻路
+            path = [] if self._pending_move else self.find_path(agents)
+        self.plan = {
+            "name": self.name,
+            "path": path,
+            "emojis": self._get_emojis(events, agents),
+        }
+        return self.plan
 
+    def commit(self, agents):
+        """Apply the move deferred by think, return True if the agent moved"""
+
+        if self._pending_move is None:
+            return False
+        coord, self._pending_move = self._pending_move, None
+        with self.maze.lock:
+            events = self.move(coord)
+        self.plan["emojis"] = self._get_emojis(events, agents)
+        return True
+
+    def _get_emojis(self, events, agents):
         emojis = {}
         if self.action:
             emojis[self.name] = {"emoji": self.get_event().emoji, "coord": self.coord}
@@ -166,12 +211,7 @@ class Agent:
             if eve.subject in agents:
                 continue
             emojis[":".join(eve.address)] = {"emoji": eve.emoji, "coord": coord}
-        self.plan = {
-            "name": self.name,
-            "path": self.find_path(agents),
-            "emojis": emojis,
-        }
-        return self.plan
+        return emojis
 
     def move(self, coord, path=None):
         events = {}
@@ -304,39 +344,46 @@ class Agent:
             )
 
     def percept(self):
-        scope = self.maze.get_scope(self.coord, self.percept_config)
-        # add spatial memory
-        for tile in scope:
-            if tile.has_address("game_object"):
-                self.spatial.add_leaf(tile.address)
-        events, arena = {}, self.get_tile().get_address("arena")
-        # gather events in scope
-        for tile in scope:
-            if not tile.events or tile.get_address("arena") != arena:
-                continue
-            dist = math.dist(tile.coord, self.coord)
-            for event in tile.get_events():
-                if dist < events.get(event, float("inf")):
-                    events[event] = dist
-        events = list(sorted(events.keys(), key=lambda k: events[k]))
-        # get concepts
-        self.concepts, valid_num = [], 0
+        with self.maze.lock:
+            version = self.maze.scope_version(self.coord, self.percept_config)
+            cached = self._percepted
+            if version is None or not cached or cached[:2] != (self.coord, version):
+                # add spatial memory
+                for address in self.maze.get_scope_objects(self.coord, self.percept_config):
+                    self.spatial.add_leaf(address)
+                events, arena = {}, self.get_tile().get_address("arena")
+                # gather events of the arena in scope from the event index
+                scope_events = self.maze.get_scope_events(
+                    self.coord, self.percept_config, arena=arena
+                )
+                for coord, tile_events in scope_events.items():
+                    dist = math.dist(coord, self.coord)
+                    for event in tile_events.values():
+                        if dist < events.get(event, float("inf")):
+                            events[event] = dist
+                events = list(sorted(events.keys(), key=lambda k: events[k]))
+                self._percepted = (self.coord, version, events)
+            events = self._percepted[2]
+        # get concepts, new events are scored in one batch before adding to associate
+        recent_nodes = self.associate.recent_describes("event", "chat")
+        self.concepts, pending = [], []
         for idx, event in enumerate(events[: self.percept_config["att_bandwidth"]]):
-            recent_nodes = (
-                self.associate.retrieve_events() + self.associate.retrieve_chats()
-            )
-            recent_nodes = set(n.describe for n in recent_nodes)
             if event.get_describe() not in recent_nodes:
                 if event.object == "idle" or event.object == "空闲":
                     node = Concept.from_event(
                         "idle_" + str(idx), "event", event, poignancy=1
                     )
                 else:
-                    valid_num += 1
+                    recent_nodes.add(event.get_describe())
                     node_type = "chat" if event.fit(self.name, "对话") else "event"
-                    node = self._add_concept(node_type, event)
-                    self.status["poignancy"] += node.poignancy
+                    pending.append((len(self.concepts), node_type, event))
+                    node = None
                 self.concepts.append(node)
+        nodes = self._add_concepts([(n_type, event) for _, n_type, event in pending])
+        for (pos, _, _), node in zip(pending, nodes):
+            self.status["poignancy"] += node.poignancy
+            self.concepts[pos] = node
+        valid_num = len(pending)
         self.concepts = [c for c in self.concepts if c.event.subject != self.name]
         self.logger.info(
             "{} percept {}/{} concepts".format(self.name, valid_num, len(self.concepts))
@@ -430,7 +477,7 @@ class Agent:
         if address[0] == "<persona>":
             target_tiles = self.maze.get_around(agents[address[1]].coord)
         else:
-            target_tiles = self.maze.get_address_tiles(address)
+            target_tiles = self.maze.get_address_tiles(address, rng=self.rng)
         if tuple(self.coord) in target_tiles:
             return []
 
@@ -443,14 +490,17 @@ class Agent:
                 return True
             return False
 
-        target_tiles = [t for t in target_tiles if not _ignore_target(t)]
+        with self.maze.lock:
+            target_tiles = [t for t in target_tiles if not _ignore_target(t)]
         if not target_tiles:
             return []
-        if len(target_tiles) >= 4:
-            target_tiles = random.sample(target_tiles, 4)
-        pathes = {t: self.maze.find_path(self.coord, t) for t in target_tiles}
-        target = min(pathes, key=lambda p: len(pathes[p]))
-        return pathes[target][1:]
+        if address[0] != "<persona>":
+            # 地址的流场在所有Agent之间共享，终点未被占用时直接使用
+            path = self.maze.find_path_to_address(self.coord, address)
+            if path and path[-1] in target_tiles:
+                return path[1:]
+        # 一次搜索得到到最近目标的路径
+        return self.maze.find_path_any(self.coord, target_tiles)[1:]
 
     def _determine_action(self, weather_data=None, weather_effects=None):
         self.logger.info("{} is determining action...".format(self.name))
@@ -506,7 +556,7 @@ class Agent:
             social_modifier = weather_effects.get("social_activity_modifier", 1.0)
             if social_modifier < 0.8:
                 # 天气不好时，减少社交反应
-                if random.random() > social_modifier:
+                if self.rng.random() > social_modifier:
                     return False
 
         def _focus(concept):
@@ -518,11 +568,11 @@ class Agent:
         if agents:
             priority = [i for i in self.concepts if _focus(i)]
             if priority:
-                focus = random.choice(priority)
+                focus = self.rng.choice(priority)
         if not focus:
             priority = [i for i in self.concepts if not _ignore(i)]
             if priority:
-                focus = random.choice(priority)
+                focus = self.rng.choice(priority)
         if not focus or focus.event.subject not in agents:
             return
         other, focus = agents[focus.event.subject], self.associate.get_relation(focus)
@@ -623,9 +673,9 @@ class Agent:
                 break
 
         key = utils.get_timer().get_date("%Y%m%d-%H:%M")
-        if key not in self.conversation.keys():
-            self.conversation[key] = []
-        self.conversation[key].append({f"{self.name} -> {other.name} @ {'，'.join(self.get_event().address)}": chats})
+        self._pending_conversation.append(
+            (key, {f"{self.name} -> {other.name} @ {'，'.join(self.get_event().address)}": chats})
+        )
 
         self.logger.info(
             "{} and {} has chats\n  {}".format(
@@ -666,6 +716,12 @@ class Agent:
         )
         self.revise_schedule(event, start, duration)
 
+    def flush_conversation(self):
+        """将缓存的对话写入共享的对话记录"""
+        for key, record in self._pending_conversation:
+            self.conversation.setdefault(key, []).append(record)
+        self._pending_conversation = []
+
     def schedule_chat(self, chats, chats_summary, start, duration, other, address=None):
         self.chats.extend(chats)
         event = memory.Event(
@@ -678,6 +734,37 @@ class Agent:
         )
         self.revise_schedule(event, start, duration)
 
+    def _add_concepts(self, items):
+        """Score the poignancy of (e_type, event) items in one completion, then add them"""
+
+        # 先批量计算所有事件的embedding，写入共享缓存
+        self.associate.index.prefetch([event.get_describe() for _, event in items])
+        poignancies, batch = {}, []
+        for idx, (_, event) in enumerate(items):
+            if not self._is_idle(event):
+                batch.append(idx)
+        if len(batch) > 1:
+            scores = self.completion("poignancy_batch", [items[i] for i in batch])
+            self.logger.debug(
+                "{} scored {}/{} events in batch".format(self.name, len(scores), len(batch))
+            )
+            # items missing from the batch response fall back to single scoring
+            poignancies = {batch[pos]: score for pos, score in scores.items()}
+        return [
+            self._add_concept(e_type, event, poignancy=poignancies.get(idx))
+            for idx, (e_type, event) in enumerate(items)
+        ]
+
+    def _is_idle(self, event):
+        return event.fit(None, "is", "idle") or event.fit(None, "此时", "空闲")
+
+    def _score_poignancy(self, e_type, event):
+        if self._is_idle(event):
+            return 1
+        if e_type == "chat":
+            return self.completion("poignancy_chat", event)
+        return self.completion("poignancy_event", event)
+
     def _add_concept(
         self,
         e_type,
@@ -685,15 +772,10 @@ class Agent:
         create=None,
         expire=None,
         filling=None,
+        poignancy=None,
     ):
-        if event.fit(None, "is", "idle"):
-            poignancy = 1
-        elif event.fit(None, "此时", "空闲"):
-            poignancy = 1
-        elif e_type == "chat":
-            poignancy = self.completion("poignancy_chat", event)
-        else:
-            poignancy = self.completion("poignancy_event", event)
+        if poignancy is None:
+            poignancy = self._score_poignancy(e_type, event)
         self.logger.debug("{} add associate {}".format(self.name, event))
         return self.associate.add_node(
             e_type,
@@ -1086,7 +1168,7 @@ class Agent:
         for resource_type, amount in tile.resources.items():
             if amount > 0:
                 # 采集一小部分资源（1-5%）
-                gather_amount = amount * random.uniform(0.01, 0.05)
+                gather_amount = amount * self.rng.uniform(0.01, 0.05)
                 gathered[resource_type] = gather_amount
                 
                 # 添加到Agent的库存
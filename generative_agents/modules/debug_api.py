@@ -253,6 +253,55 @@ def get_map_info():
     })
 
 
+@api_blueprint.route('/api/system/world_ticks', methods=['GET'])
+def get_world_ticks():
+    """获取世界子系统的调度节奏和耗时统计"""
+    game = get_game()
+    if not game:
+        return jsonify({"error": "游戏未初始化"}), 500
+    
+    return jsonify(game.scheduler.get_summary())
+
+
+@api_blueprint.route('/api/system/agent_phases', methods=['GET'])
+def get_agent_phases():
+    """获取各Agent认知阶段（移动、日程、感知、计划、反思、寻路）的耗时统计"""
+    game = get_game()
+    if not game:
+        return jsonify({"error": "游戏未初始化"}), 500
+    
+    latest = request.args.get('scope', 'latest') != 'total'
+    phases = {
+        name: agent.timer.get_summary(latest=latest)
+        for name, agent in game.agents.items()
+    }
+    
+    # 汇总所有Agent的阶段耗时
+    overall = {}
+    for agent_phases in phases.values():
+        for phase, record in agent_phases.items():
+            merged = overall.setdefault(
+                phase, {"calls": 0, "wall_ms": 0.0, "llm_ms": 0.0, "llm_calls": 0}
+            )
+            for key, value in record.items():
+                merged[key] = round(merged[key] + value, 3)
+    
+    return jsonify({"scope": "latest" if latest else "total", "overall": overall, "agents": phases})
+
+
+@api_blueprint.route('/api/system/embedding_cache', methods=['GET'])
+def get_embedding_cache_stats():
+    """获取共享embedding缓存的命中率以及批处理队列统计"""
+    from modules.storage.embedding_cache import get_embedding_caches
+    from modules.storage.embedding_batcher import get_embedding_batchers
+    
+    batchers = {
+        "/".join(key): batcher.get_summary()
+        for key, batcher in get_embedding_batchers().items()
+    }
+    return jsonify({"caches": [c.get_summary() for c in get_embedding_caches()], "batchers": batchers})
+
+
 @api_blueprint.route('/api/system/status', methods=['GET'])
 def get_system_status():
     """获取系统状态"""
@@ -233,7 +233,7 @@ class AIBuildingDecisionEngine:
             "district": district_info,
             "urban_metrics": {
                 "traffic_density": tile.traffic_density if tile else 0,
-                "pollution_level": tile.pollution if tile else 0,
+                "pollution_level": tile.pollution_level if tile else 0,
                 "crime_rate": tile.crime_rate if tile else 0,
                 "happiness_index": tile.happiness_index if tile else 0,
                 "land_value": tile.land_value if tile else 0
@@ -466,7 +466,7 @@ class AIBuildingDecisionEngine:
                         district_bonus += 10  # 高幸福度区域奖励
                     if tile.crime_rate < 0.2:
                         district_bonus += 10  # 低犯罪率区域奖励
-                    if tile.pollution < 0.3:
+                    if tile.pollution_level < 0.3:
                         district_bonus += 10  # 低污染区域奖励
                 else:
                     # 如果在不适宜分区，给予惩罚
@@ -0,0 +1,95 @@
+"""generative_agents.executor"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StepExecutor:
+    """Run the cognition of all agents in one simulate step concurrently.
+
+    A step has three phases: all agents are moved in the serial prepare phase,
+    then they think, then the moves decided while thinking and the buffered
+    conversations are committed in agent order. The serial run goes through
+    the same phases, so the results do not depend on the number of workers.
+
+    Agents that can perceive each other (and therefore chat, wait or otherwise
+    mutate each other) are put into the same group. Groups run in parallel,
+    agents inside a group run one after another in the original order. Every
+    agent draws from its own random generator, seeded per step by the game.
+    """
+
+    def __init__(self, game, workers=1):
+        self._game = game
+        self.workers = max(int(workers or 1), 1)
+        self._pool = None
+
+    def run(self, agent_status):
+        """Think all agents, return {name: {"plan": plan, "info": info}}"""
+
+        names = list(agent_status.keys())
+
+        # 串行阶段：移动、建造和经济决策
+        events = {n: self._game.prepare_think(n, agent_status[n]) for n in names}
+
+        # 思考阶段：按感知范围分组，组内按顺序思考，组间并行
+        def _think_group(group):
+            return [
+                (n, self._game.think_agent(n, agent_status[n], events[n]))
+                for n in group
+            ]
+
+        if self.workers <= 1 or len(names) <= 1:
+            results = dict(_think_group(names))
+        else:
+            groups = self.group_agents(names)
+            if len(groups) == 1:
+                results = dict(_think_group(groups[0]))
+            else:
+                results = {}
+                for group_results in self._get_pool().map(_think_group, groups):
+                    results.update(group_results)
+
+        # 提交阶段：按Agent顺序执行推迟的移动并合并对话记录
+        for n in names:
+            self._game.commit_think(n, results[n])
+        return {n: results[n] for n in names}
+
+    def group_agents(self, names):
+        """Group agents that are within the vision range of each other"""
+
+        parent = {n: n for n in names}
+
+        def _find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+
+        agents = [(n, self._game.get_agent(n)) for n in names]
+        for i, (name, agent) in enumerate(agents):
+            for o_name, other in agents[i + 1:]:
+                radius = max(
+                    agent.percept_config["vision_r"], other.percept_config["vision_r"]
+                )
+                dist = max(
+                    abs(agent.coord[0] - other.coord[0]),
+                    abs(agent.coord[1] - other.coord[1]),
+                )
+                if dist <= radius:
+                    parent[_find(o_name)] = _find(name)
+
+        groups = {}
+        for n in names:
+            groups.setdefault(_find(n), []).append(n)
+        return list(groups.values())
+
+    def _get_pool(self):
+        if not self._pool:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="agent_think"
+            )
+        return self._pool
+
+    def shutdown(self):
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
@@ -8,6 +8,8 @@ from modules import utils
 from .maze import Maze
 from .infinite_maze import InfiniteMaze
 from .agent import Agent
+from .executor import StepExecutor
+from .scheduler import WorldScheduler
 from .environment.environment_manager import EnvironmentManager
 from .terrain.terrain_development import TerrainDevelopmentEngine
 from .economy.economy import EconomyEngine
@@ -43,10 +45,15 @@ class Game:
             self.logger.info("使用无限扩展地图系统")
         else:
             # 使用经典固定地图
-            self.maze = Maze(self.load_static(config["maze"]["path"]), self.logger)
+            self.maze = Maze.load(
+                os.path.join(self.static_root, config["maze"]["path"]), self.logger
+            )
             self.logger.info("使用经典固定地图")
         
         self.conversation = conversation
+        # 随机种子与已推进的世界tick数，Agent每一步的随机数生成器由它们决定
+        self.seed = config.get("seed", 0)
+        self.step = config.get("step", 0)
         
         # 初始化环境管理器
         self.environment_manager = EnvironmentManager()
@@ -69,7 +76,9 @@ class Game:
             agent_base = config["agent_base"]
         else:
             agent_base = {}
-        storage_root = os.path.join(f"results/checkpoints/{name}", "storage")
+        storage_root = config.get("storage_root") or os.path.join(
+            f"results/checkpoints/{name}", "storage"
+        )
         if not os.path.isdir(storage_root):
             os.makedirs(storage_root)
         for name, agent in config["agents"].items():
@@ -84,6 +93,13 @@ class Game:
         # 现在agents创建完成，初始化AI决策引擎
         self._initialize_ai_systems()
 
+        # 世界系统调度器：每个子系统按自己的节奏每个tick最多运行一次
+        self.scheduler = WorldScheduler()
+        self._register_world_systems()
+
+        # 每一步中Agent思考的执行器
+        self.executor = StepExecutor(self, workers=config.get("workers", 1))
+
     def _initialize_ai_systems(self):
         """初始化AI决策系统"""
         # 初始化建造决策引擎
@@ -215,13 +231,25 @@ class Game:
         return self.agents[name]
 
     def agent_think(self, name, status):
-        # 更新环境管理器
-        self.environment_manager.update()
-        
-        # 更新地形和经济系统
-        self._update_ai_systems()
-        
+        events = self.prepare_think(name, status)
+        result = self.think_agent(name, status, events)
+        self.commit_think(name, result)
+        return result
+
+    def agents_think(self, agent_status):
+        """推进一个世界tick，然后所有Agent执行一步思考（worker数量大于1时并行执行）"""
+        self.tick()
+        return self.executor.run(agent_status)
+
+    def tick(self):
+        """推进一个世界tick，每一步模拟调用一次（与Agent数量无关）"""
+        self.step += 1
+        return self.scheduler.tick()
+
+    def prepare_think(self, name, status):
+        """思考前的串行阶段：移动Agent，并处理建造和经济决策"""
         agent = self.get_agent(name)
+        agent.reseed(self.seed, self.step)
         
         # 如果使用无限地图，更新agent位置
         if isinstance(self.maze, InfiniteMaze):
@@ -229,14 +257,24 @@ class Game:
             if coord:
                 self.maze.update_agent_position(name, coord[0], coord[1])
         
+        # 移动Agent，保证共享瓦片事件的写入顺序与Agent顺序一致
+        agent.timer.begin()
+        with agent.timer.phase("move"), self.maze.lock:
+            events = agent.move(status["coord"], status.get("path"))
+        
         # AI建造决策
         self._process_agent_building_decision(agent)
         
         # AI经济决策
         self._process_agent_economic_decision(agent)
-        
+        return events
+
+    def think_agent(self, name, status, events=None):
+        """Agent的认知阶段，可在不同线程中并行执行"""
+        agent = self.get_agent(name)
+
         # 执行常规思考
-        plan = agent.think(status, self.agents)
+        plan = agent.think(status, self.agents, events=events)
         info = {
             "currently": agent.scratch.currently,
             "associate": agent.associate.abstract(),
@@ -258,40 +296,53 @@ class Game:
             info["record"] = False
         if agent.llm_available():
             info["llm"] = agent._llm.get_summary()
+        info["phases"] = agent.timer.get_summary()
         title = "{}.summary @ {}".format(
             name, utils.get_timer().get_date("%Y%m%d-%H:%M:%S")
         )
         self.logger.info("\n{}\n{}\n".format(utils.split_line(title), agent))
         return {"plan": plan, "info": info}
 
+    def commit_think(self, name, result):
+        """思考后的串行阶段：执行思考中推迟的移动，并合并缓存的对话记录"""
+        agent = self.get_agent(name)
+        if agent.commit(self.agents):
+            result["info"]["address"] = agent.get_tile().get_address(as_list=False)
+        agent.flush_conversation()
+
     def load_static(self, path):
         return utils.load_dict(os.path.join(self.static_root, path))
 
-    def _update_ai_systems(self):
-        """更新AI系统"""
-        # 更新地形系统
-        self.terrain_engine.simulate_daily_operations()
+    def _register_world_systems(self):
+        """注册世界子系统及其运行节奏"""
+        # 更新环境管理器（内部按真实时间间隔更新）
+        self.scheduler.register("environment", self.environment_manager.update, "step")
         
-        # 更新经济价格
-        self.economy_engine.update_prices(self.terrain_engine)
+        # 地形系统的日常运营（生产、建造推进、城市指标）每个模拟日一次
+        self.scheduler.register("terrain", self.terrain_engine.simulate_daily_operations, "day")
+        
+        # 经济价格每个模拟小时调整一次
+        self.scheduler.register(
+            "economy_prices", lambda: self.economy_engine.update_prices(self.terrain_engine), "hour"
+        )
         
         # 协调Agent协作
-        if self.collaboration_coordinator:
-            agent_ids = list(self.agents.keys())
-            self.collaboration_coordinator.auto_coordinate_agents(agent_ids)
+        self.scheduler.register("collaboration", self._coordinate_agents, "step")
         
         # 更新地图上的建筑进度
-        self.update_building_progress_on_map()
+        self.scheduler.register("building_progress", self.update_building_progress_on_map, "step")
         
         # 如果使用无限地图，定期清理不活跃的chunks
         if isinstance(self.maze, InfiniteMaze):
-            # 每100次更新清理一次
-            if not hasattr(self, '_cleanup_counter'):
-                self._cleanup_counter = 0
-            self._cleanup_counter += 1
-            if self._cleanup_counter >= 100:
-                self.maze.cleanup_inactive_chunks(keep_distance=5)
-                self._cleanup_counter = 0
+            self.scheduler.register(
+                "chunk_cleanup", lambda: self.maze.cleanup_inactive_chunks(keep_distance=5), "hour"
+            )
+
+    def _coordinate_agents(self):
+        """协调Agent协作"""
+        if self.collaboration_coordinator:
+            agent_ids = list(self.agents.keys())
+            self.collaboration_coordinator.auto_coordinate_agents(agent_ids)
     
     def _process_agent_building_decision(self, agent):
         """处理Agent的建造决策"""
@@ -91,7 +91,6 @@ class InfiniteMaze:
             # 复制属性以保持兼容
             self.maze_width = self._fallback_maze.maze_width
             self.maze_height = self._fallback_maze.maze_height
-            self.tiles = self._fallback_maze.tiles
             self.address_tiles = self._fallback_maze.address_tiles
     
     def _initialize_spawn_area(self):
@@ -264,6 +263,37 @@ class InfiniteMaze:
         
         return [self.tile_at(c) for c in coords]
     
+    def get_scope_events(self, coord: Tuple[int, int], config: dict, arena=None) -> dict:
+        """获取视野范围内持有事件的瓦片，arena不为空时只返回该区域的瓦片"""
+        if not self.use_infinite:
+            return self._fallback_maze.get_scope_events(coord, config, arena=arena)
+        
+        scope_events = {}
+        for tile in self.get_scope(coord, config):
+            if not tile or not tile.events:
+                continue
+            if arena is not None and tile.get_address("arena") != arena:
+                continue
+            scope_events[tile.coord] = tile.events
+        return scope_events
+    
+    def get_scope_objects(self, coord: Tuple[int, int], config: dict) -> List[List[str]]:
+        """获取视野范围内游戏物体的地址"""
+        if not self.use_infinite:
+            return self._fallback_maze.get_scope_objects(coord, config)
+        
+        return [
+            tile.address
+            for tile in self.get_scope(coord, config)
+            if tile and tile.has_address("game_object")
+        ]
+    
+    def scope_version(self, coord: Tuple[int, int], config: dict) -> Optional[int]:
+        """获取视野范围的版本，无限地图不记录版本，返回None"""
+        if not self.use_infinite:
+            return self._fallback_maze.scope_version(coord, config)
+        return None
+    
     def update_obj(self, coord: Tuple[int, int], obj_event: Event):
         """更新对象事件"""
         if not self.use_infinite:
@@ -282,17 +312,18 @@ class InfiniteMaze:
         for c in self.address_tiles[addr]:
             self.tile_at(c).update_events(obj_event)
     
-    def get_address_tiles(self, address: List[str]) -> Set[Tuple[int, int]]:
+    def get_address_tiles(self, address: List[str], rng=None) -> Set[Tuple[int, int]]:
         """获取指定地址的所有瓦片坐标"""
         if not self.use_infinite:
-            return self._fallback_maze.get_address_tiles(address)
+            return self._fallback_maze.get_address_tiles(address, rng=rng)
         
         addr = ":".join(address)
         if addr in self.address_tiles:
             return self.address_tiles[addr]
         
         # 如果没有，返回出生点附近的一个随机位置
-        return {(random.randint(-10, 10), random.randint(-10, 10))}
+        rng = rng or random
+        return {(rng.randint(-10, 10), rng.randint(-10, 10))}
     
     def preload_area_around(self, coord: Tuple[int, int], radius: int = 5):
         """
@@ -5,6 +5,7 @@
 
 import random
 import math
+import threading
 from collections import defaultdict
 from typing import Dict, Tuple, Set, List, Optional
 from dataclasses import dataclass
@@ -167,6 +168,9 @@ class InfiniteMaze:
         self.buildings: Dict[Tuple[int, int], dict] = {}  # 坐标 -> 建筑信息
         self.special_zones: Dict[str, dict] = {}  # 特殊区域（城镇、村庄等）
         
+        # 并行思考时保护瓦片缓存、chunk生成和瓦片事件
+        self.lock = threading.RLock()
+        
         # 初始化起始区域
         self._initialize_spawn_area()
         
@@ -340,9 +344,15 @@ class InfiniteMaze:
         x, y = coord if isinstance(coord, tuple) else (coord[0], coord[1])
         
         # 先检查缓存
-        if (x, y) in self.tile_cache:
-            return self.tile_cache[(x, y)]
+        tile = self.tile_cache.get((x, y))
+        if tile:
+            return tile
         
+        with self.lock:
+            return self._load_tile(x, y)
+    
+    def _load_tile(self, x: int, y: int) -> Optional[InfiniteTile]:
+        """从chunk中加载瓦片并写入缓存"""
         # 确定所属chunk
         chunk_coord = self._world_to_chunk_coord(x, y)
         local_coord = self._world_to_local_coord(x, y)
@@ -481,6 +491,21 @@ class InfiniteMaze:
         
         return path
     
+    def find_path_any(self, src_coord, dst_coords, max_targets=4):
+        """
+        寻找到多个目标中最近一个的路径（只搜索直线距离最近的max_targets个目标）
+        """
+        dst_coords = sorted(
+            dst_coords, key=lambda c: (math.dist(src_coord, c), tuple(c))
+        )[:max_targets]
+        pathes = [self.find_path(src_coord, c) for c in dst_coords]
+        pathes = [p for p in pathes if p]
+        return min(pathes, key=len) if pathes else []
+    
+    def find_path_to_address(self, src_coord, address):
+        """寻找到指定地址最近瓦片的路径"""
+        return self.find_path_any(src_coord, self.get_address_tiles(address))
+    
     def get_around(self, coord, radius=1):
         """获取周围的坐标"""
         x, y = coord if isinstance(coord, tuple) else (coord[0], coord[1])
@@ -492,7 +517,7 @@ class InfiniteMaze:
                 around.append((x + dx, y + dy))
         return around
     
-    def get_address_tiles(self, address):
+    def get_address_tiles(self, address, rng=None):
         """获取指定地址的所有瓦片坐标"""
         # 简化实现：搜索活跃区域
         if isinstance(address, str):
@@ -1,33 +1,30 @@
 """generative_agents.maze"""
 
+import os
+import json
 import random
+import hashlib
+import zipfile
+import itertools
+import threading
 from itertools import product
+from collections import OrderedDict
+
+import numpy as np
 
 from modules import utils
 from modules.memory.event import Event
+from modules.pathfinding import GridPathFinder, FlowField
 
 
-class Tile:
-    def __init__(
-        self,
-        coord,
-        world,
-        address_keys,
-        address=None,
-        collision=False,
-    ):
-        # in order: world, sector, arena, game_object
-        self.coord = coord
-        self.address = [world]
-        if address:
-            self.address += address
-        self.address_keys = address_keys
-        self.address_map = dict(zip(address_keys[: len(self.address)], self.address))
-        self.collision = collision
-        self.event_cnt = 0
-        self._events = {}
-        if len(self.address) == 4:
-            self.add_event(Event(self.address[-1], address=self.address))
+class TileBase:
+    """The address and event methods shared by Tile and MazeTile.
+
+    Subclasses provide coord, address, address_keys, address_map, collision
+    and _events.
+    """
+
+    __slots__ = ()
 
     def abstract(self):
         address = ":".join(self.address)
@@ -42,32 +39,13 @@ class Tile:
         return utils.dump_dict(self.abstract())
 
     def __eq__(self, other):
-        if isinstance(other, Tile):
+        if isinstance(other, TileBase):
             return hash(self.coord) == hash(other.coord)
         return False
 
     def get_events(self):
         return self.events.values()
 
-    def add_event(self, event):
-        if isinstance(event, (tuple, list)):
-            event = Event.from_list(event)
-        if all(e != event for e in self._events.values()):
-            self._events["e_" + str(self.event_cnt)] = event
-            self.event_cnt += 1
-        return event
-
-    def remove_events(self, subject=None, event=None):
-        r_events = {}
-        for tag, eve in self._events.items():
-            if subject and eve.subject == subject:
-                r_events[tag] = eve
-            if event and eve == event:
-                r_events[tag] = eve
-        for r_eve in r_events:
-            self._events.pop(r_eve)
-        return r_events
-
     def update_events(self, event, match="subject"):
         u_events = {}
         for tag, eve in self._events.items():
@@ -106,62 +84,376 @@ class Tile:
         return len(self.address) == 1 and not self._events
 
 
+class Tile(TileBase):
+    def __init__(
+        self,
+        coord,
+        world,
+        address_keys,
+        address=None,
+        collision=False,
+    ):
+        # in order: world, sector, arena, game_object
+        self.coord = coord
+        self.address = [world]
+        if address:
+            self.address += address
+        self.address_keys = address_keys
+        self.address_map = dict(zip(address_keys[: len(self.address)], self.address))
+        self.collision = collision
+        self.event_cnt = 0
+        self._events = {}
+        if len(self.address) == 4:
+            self.add_event(Event(self.address[-1], address=self.address))
+
+    def add_event(self, event):
+        if isinstance(event, (tuple, list)):
+            event = Event.from_list(event)
+        if all(e != event for e in self._events.values()):
+            self._events["e_" + str(self.event_cnt)] = event
+            self.event_cnt += 1
+        return event
+
+    def remove_events(self, subject=None, event=None):
+        r_events = {}
+        for tag, eve in self._events.items():
+            if subject and eve.subject == subject:
+                r_events[tag] = eve
+            if event and eve == event:
+                r_events[tag] = eve
+        for r_eve in r_events:
+            self._events.pop(r_eve)
+        return r_events
+
+
+class MazeTile(TileBase):
+    """A view of one tile of Maze, created on demand by Maze.tile_at.
+
+    The view holds only the maze and the coord: collision and address are read
+    from the arrays of the maze, and the events live in Maze.tile_events, which
+    has entries only for the tiles holding events. Changing the events keeps
+    Maze.event_index and Maze.tile_versions up to date.
+    """
+
+    __slots__ = ("maze", "coord")
+
+    def __init__(self, maze, coord):
+        self.maze = maze
+        self.coord = coord
+
+    @property
+    def address(self):
+        return self.maze.address_of(self.coord)
+
+    @property
+    def address_keys(self):
+        return self.maze.address_keys
+
+    @property
+    def address_map(self):
+        return dict(zip(self.address_keys[: len(self.address)], self.address))
+
+    def has_address(self, key):
+        if key not in self.maze.address_keys:
+            return False
+        level = self.maze.address_keys.index(key)
+        if not level:
+            return True
+        return self.maze.address_ids.item(level - 1, self.coord[1], self.coord[0]) != 0
+
+    @property
+    def collision(self):
+        return bool(self.maze.collision[self.coord[1], self.coord[0]])
+
+    @collision.setter
+    def collision(self, collision):
+        self.maze.set_collision(self.coord, collision)
+
+    @property
+    def events(self):
+        return self.maze.tile_events.get(self.coord, {})
+
+    _events = events
+
+    def add_event(self, event):
+        if isinstance(event, (tuple, list)):
+            event = Event.from_list(event)
+        events = self.maze.tile_events.get(self.coord)
+        if events is None:
+            events = self.maze.tile_events[self.coord] = {}
+            self.maze._index_event_tile(self.coord)
+        if all(e != event for e in events.values()):
+            events["e_" + str(next(self.maze.event_tags))] = event
+            self._touch()
+        return event
+
+    def remove_events(self, subject=None, event=None):
+        events = self.maze.tile_events.get(self.coord)
+        if not events:
+            return {}
+        r_events = {}
+        for tag, eve in events.items():
+            if subject and eve.subject == subject:
+                r_events[tag] = eve
+            if event and eve == event:
+                r_events[tag] = eve
+        for r_eve in r_events:
+            events.pop(r_eve)
+        if r_events:
+            self._touch()
+        # 没有事件的瓦片不保留条目
+        if not events:
+            self.maze.tile_events.pop(self.coord, None)
+            self.maze._index_event_tile(self.coord, holding=False)
+        return r_events
+
+    def update_events(self, event, match="subject"):
+        u_events = super().update_events(event, match)
+        if u_events:
+            self._touch()
+        return u_events
+
+    def _touch(self):
+        self.maze.tile_versions[self.coord[1], self.coord[0]] += 1
+
+
 class Maze:
-    def __init__(self, config, logger):
-        # define tiles
+    """The classic fixed map, see Maze.load for the cached loading of maze.json"""
+
+    # version of the binary cache written by save_cache
+    cache_version = 1
+    # side of the coarse cells bucketing the tiles holding events
+    event_cell = 8
+    # flow fields kept at most, in LRU order, 8 bytes a tile each
+    max_flow_fields = 64
+
+    def __init__(self, config, logger, cache=None):
+        # define tiles as arrays: collision, and the interned address ids of
+        # sector, arena and game_object, 0 for no address at the level
         self.maze_height, self.maze_width = config["size"]
         self.tile_size = config["tile_size"]
-        address_keys = config["tile_address_keys"]
-        self.tiles = [
-            [
-                Tile((x, y), config["world"], address_keys)
-                for x in range(self.maze_width)
-            ]
-            for y in range(self.maze_height)
-        ]
-        for tile in config["tiles"]:
-            x, y = tile.pop("coord")
-            self.tiles[y][x] = Tile((x, y), config["world"], address_keys, **tile)
+        self.world = config["world"]
+        self.address_keys = config["tile_address_keys"]
+        if cache is None:
+            self._parse_tiles(config["tiles"])
+        else:
+            self._restore_cache(cache)
 
-        # define address
-        self.address_tiles = dict()
-        for i in range(self.maze_height):
-            for j in range(self.maze_width):
-                for add in self.tile_at([j, i]).get_addresses():
-                    self.address_tiles.setdefault(add, set()).add((j, i))
+        # events of the tiles holding any, {coord: {tag: event}}, indexed as
+        # {arena: {cell: coords}}; the version of a tile is bumped whenever
+        # its events change
+        self.tile_events = {}
+        self.event_tags = itertools.count()
+        self.event_index = {}
+        self.tile_versions = np.zeros((self.maze_height, self.maze_width), dtype=np.int64)
+        ys, xs = np.nonzero(self.address_ids[-1])
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            address = self.address_of((x, y))
+            self.tile_at((x, y)).add_event(Event(address[-1], address=address))
+
+        # collision bitmap for path finding, the border tiles are never walked on
+        self._flow_lock = threading.Lock()
+        self._update_walkable(None if cache is None else cache["components"])
 
+        # guard the tile events shared by agents thinking in parallel
+        self.lock = threading.RLock()
         self.logger = logger
 
+    def _parse_tiles(self, tiles):
+        levels = len(self.address_keys) - 1
+        self.collision = np.zeros((self.maze_height, self.maze_width), dtype=bool)
+        self.address_ids = np.zeros(
+            (levels, self.maze_height, self.maze_width), dtype=np.int32
+        )
+        self.address_names = [[None] for _ in range(levels)]
+        name_ids = [{} for _ in range(levels)]
+        self.address_tiles = dict()
+        for tile in tiles:
+            x, y = tile["coord"]
+            self.collision[y, x] = tile.get("collision", False)
+            address = [self.world] + list(tile.get("address") or [])
+            for level, name in enumerate(address[1:]):
+                if name not in name_ids[level]:
+                    name_ids[level][name] = len(self.address_names[level])
+                    self.address_names[level].append(name)
+                self.address_ids[level, y, x] = name_ids[level][name]
+            for i in range(2, len(address) + 1):
+                self.address_tiles.setdefault(":".join(address[:i]), set()).add((x, y))
+
+    def _restore_cache(self, cache):
+        self.collision = cache["collision"]
+        self.address_ids = cache["address_ids"]
+        self.address_names = [[None] + names for names in cache["address_names"]]
+        offsets = cache["address_offsets"].tolist()
+        coords = list(map(tuple, cache["address_coords"].tolist()))
+        self.address_tiles = {
+            addr: set(coords[offsets[i] : offsets[i + 1]])
+            for i, addr in enumerate(cache["addresses"])
+        }
+
+    @staticmethod
+    def cache_path(path):
+        return os.path.splitext(path)[0] + ".cache.npz"
+
+    @staticmethod
+    def _source_stamp(path, digest=True):
+        stat = os.stat(path)
+        stamp = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+        if digest:
+            with open(path, "rb") as f:
+                stamp["sha1"] = hashlib.sha1(f.read()).hexdigest()
+        return stamp
+
+    @classmethod
+    def read_cache(cls, path):
+        """Read the binary cache of the maze config at path, None if missing or stale.
+
+        The cache is valid when its version matches and the config has the
+        recorded mtime and size, or else the recorded sha1.
+        """
+
+        cache_path = cls.cache_path(path)
+        if not os.path.exists(cache_path):
+            return None
+        try:
+            with np.load(cache_path, allow_pickle=False) as data:
+                cache = {k: data[k] for k in data.files}
+            meta = json.loads(str(cache.pop("meta")))
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return None
+        if meta.get("version") != cls.cache_version:
+            return None
+        source, stamp = meta["source"], cls._source_stamp(path, digest=False)
+        if (source["mtime_ns"], source["size"]) != (stamp["mtime_ns"], stamp["size"]):
+            # 修改时间变化但内容未变时仍然有效
+            if cls._source_stamp(path)["sha1"] != source["sha1"]:
+                return None
+        cache.update(
+            config=meta["config"],
+            address_names=meta["address_names"],
+            addresses=meta["addresses"],
+        )
+        return cache
+
+    def save_cache(self, path):
+        """Write the binary cache of the maze parsed from the config at path"""
+
+        addresses = list(self.address_tiles.keys())
+        coords = [sorted(self.address_tiles[a]) for a in addresses]
+        offsets = np.cumsum([0] + [len(c) for c in coords])
+        meta = {
+            "version": self.cache_version,
+            "source": self._source_stamp(path),
+            "config": {
+                "world": self.world,
+                "tile_size": self.tile_size,
+                "size": [self.maze_height, self.maze_width],
+                "tile_address_keys": self.address_keys,
+            },
+            "address_names": [names[1:] for names in self.address_names],
+            "addresses": addresses,
+        }
+        cache_path = self.cache_path(path)
+        with open(cache_path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta, ensure_ascii=False)),
+                collision=self.collision,
+                address_ids=self.address_ids,
+                address_offsets=offsets.astype(np.int32),
+                address_coords=np.array(
+                    [c for cs in coords for c in cs], dtype=np.int32
+                ).reshape(-1, 2),
+                components=self.path_finder.components,
+            )
+        os.replace(cache_path + ".tmp", cache_path)
+        return cache_path
+
+    @classmethod
+    def load(cls, path, logger=None, cache=True):
+        """Load the maze from the config at path, through its binary cache.
+
+        The cache is written next to the config on the first load, and every
+        later process restores the arrays from it instead of parsing the json.
+        """
+
+        if cache:
+            data = cls.read_cache(path)
+            if data is not None:
+                return cls(data["config"], logger, cache=data)
+        maze = cls(utils.load_dict(path), logger)
+        if cache:
+            try:
+                maze.save_cache(path)
+            except OSError as e:
+                if logger:
+                    logger.warning("Failed to write maze cache of {}: {}".format(path, e))
+        return maze
+
     def find_path(self, src_coord, dst_coord):
-        map = [[0 for _ in range(self.maze_width)] for _ in range(self.maze_height)]
-        frontier, visited = [src_coord], set()
-        map[src_coord[1]][src_coord[0]] = 1
-        while map[dst_coord[1]][dst_coord[0]] == 0:
-            new_frontier = []
-            for f in frontier:
-                for c in self.get_around(f):
-                    if (
-                        0 < c[0] < self.maze_width - 1
-                        and 0 < c[1] < self.maze_height - 1
-                        and map[c[1]][c[0]] == 0
-                        and c not in visited
-                    ):
-                        map[c[1]][c[0]] = map[f[1]][f[0]] + 1
-                        new_frontier.append(c)
-                        visited.add(c)
-            frontier = new_frontier
-        step = map[dst_coord[1]][dst_coord[0]]
-        path = [dst_coord]
-        while step > 1:
-            for c in self.get_around(path[-1]):
-                if map[c[1]][c[0]] == step - 1:
-                    path.append(c)
-                    break
-            step -= 1
-        return path[::-1]
+        return self.path_finder.find_path(src_coord, [dst_coord])
+
+    def find_path_any(self, src_coord, dst_coords):
+        """Find the shortest path to the nearest of dst_coords in one search"""
+
+        return self.path_finder.find_path(src_coord, dst_coords)
+
+    def _update_walkable(self, components=None):
+        walkable = ~self.collision
+        walkable[[0, -1], :] = False
+        walkable[:, [0, -1]] = False
+        self.path_finder = GridPathFinder(walkable, components)
+        # flow fields of the addresses, built lazily and kept in LRU order
+        self._flow_fields = OrderedDict()
+
+    def set_collision(self, coord, collision=True):
+        """Change the collision of a tile, the path caches are rebuilt"""
+
+        self.collision[coord[1], coord[0]] = collision
+        self._update_walkable()
+
+    def get_flow_field(self, address):
+        addr = address if isinstance(address, str) else ":".join(address)
+        with self._flow_lock:
+            field = self._flow_fields.get(addr)
+            if field is not None:
+                self._flow_fields.move_to_end(addr)
+                return field
+        if addr not in self.address_tiles:
+            return None
+        # 在锁外构建，不阻塞其他Agent；同一地址并发构建时结果相同，保留先写入的一份
+        field = FlowField(self.path_finder.walkable, self.address_tiles[addr])
+        with self._flow_lock:
+            field = self._flow_fields.setdefault(addr, field)
+            self._flow_fields.move_to_end(addr)
+            while len(self._flow_fields) > self.max_flow_fields:
+                self._flow_fields.popitem(last=False)
+        return field
+
+    def find_path_to_address(self, src_coord, address):
+        """Find the path to the nearest tile of address from its flow field"""
+
+        field = self.get_flow_field(address)
+        if field is None:
+            return []
+        return field.path(src_coord)
 
     def tile_at(self, coord):
-        return self.tiles[coord[1]][coord[0]]
+        # 与嵌套列表的下标一致，负数坐标从另一侧计数
+        x, y = coord[0], coord[1]
+        if not (-self.maze_width <= x < self.maze_width and -self.maze_height <= y < self.maze_height):
+            raise IndexError("coord {} out of the maze".format(coord))
+        return MazeTile(self, (x % self.maze_width, y % self.maze_height))
+
+    def address_of(self, coord):
+        """Get the address of the tile at coord, from world to the deepest level"""
+
+        address = [self.world]
+        for level, idx in enumerate(self.address_ids[:, coord[1], coord[0]].tolist()):
+            if not idx:
+                break
+            address.append(self.address_names[level][idx])
+        return address
 
     def update_obj(self, coord, obj_event):
         tile = self.tile_at(coord)
@@ -175,20 +467,105 @@ class Maze:
         for c in self.address_tiles[addr]:
             self.tile_at(c).update_events(obj_event)
 
+    def _scope_box(self, coord, config):
+        """Get the x and y ranges of the scope, None if the mode is not supported"""
+
+        if config["mode"] != "box":
+            return None
+        vision_r = config["vision_r"]
+        x_range = (
+            max(coord[0] - vision_r, 0),
+            min(coord[0] + vision_r + 1, self.maze_width),
+        )
+        y_range = (
+            max(coord[1] - vision_r, 0),
+            min(coord[1] + vision_r + 1, self.maze_height),
+        )
+        return x_range, y_range
+
     def get_scope(self, coord, config):
         coords = []
-        vision_r = config["vision_r"]
-        if config["mode"] == "box":
-            x_range = [
-                max(coord[0] - vision_r, 0),
-                min(coord[0] + vision_r + 1, self.maze_width),
-            ]
-            y_range = [
-                max(coord[1] - vision_r, 0),
-                min(coord[1] + vision_r + 1, self.maze_height),
-            ]
-            coords = list(product(list(range(*x_range)), list(range(*y_range))))
-        return [self.tile_at(c) for c in coords]
+        box = self._scope_box(coord, config)
+        if box:
+            coords = list(product(list(range(*box[0])), list(range(*box[1]))))
+        return [MazeTile(self, c) for c in coords]
+
+    def get_scope_events(self, coord, config, arena=None):
+        """Get {coord: events} of the tiles holding events in the scope.
+
+        Only the event tiles of arena are returned if it is given. The tiles
+        are looked up from the cells of event_index overlapping the scope, and
+        come in the order get_scope would visit them.
+        """
+
+        box = self._scope_box(coord, config)
+        if not box:
+            return {}
+        (x_min, x_max), (y_min, y_max) = box
+        if arena is None:
+            indexes = list(self.event_index.values())
+        else:
+            arena = arena if isinstance(arena, str) else ":".join(arena)
+            indexes = [self.event_index.get(arena, {})]
+        size = self.event_cell
+        cells = list(
+            product(
+                range(x_min // size, (x_max - 1) // size + 1),
+                range(y_min // size, (y_max - 1) // size + 1),
+            )
+        )
+        coords = []
+        for index in indexes:
+            for cell in cells:
+                for x, y in index.get(cell, ()):
+                    if x_min <= x < x_max and y_min <= y < y_max:
+                        coords.append((x, y))
+        return {c: self.tile_events[c] for c in sorted(coords)}
+
+    def get_scope_objects(self, coord, config):
+        """Get the addresses of the game objects in the scope, from the address arrays"""
+
+        box = self._scope_box(coord, config)
+        if not box:
+            return []
+        (x_min, x_max), (y_min, y_max) = box
+        # 按get_scope的顺序（先x后y）排列，同一物体只保留一次
+        ids = self.address_ids[:, y_min:y_max, x_min:x_max].transpose(0, 2, 1)
+        ids = ids.reshape(len(self.address_names), -1)
+        ids = ids[:, ids[-1] != 0].T.tolist()
+        return [
+            [self.world] + [names[i] for names, i in zip(self.address_names, key)]
+            for key in dict.fromkeys(map(tuple, ids))
+        ]
+
+    def scope_version(self, coord, config):
+        """Get the version of the scope, which changes whenever an event in it changes"""
+
+        box = self._scope_box(coord, config)
+        if not box:
+            return 0
+        (x_min, x_max), (y_min, y_max) = box
+        return int(self.tile_versions[y_min:y_max, x_min:x_max].sum())
+
+    def arena_of(self, coord):
+        level = self.address_keys.index("arena") + 1
+        return ":".join(self.address_of(coord)[:level])
+
+    def _index_event_tile(self, coord, holding=True):
+        """Add the tile at coord to event_index, or remove it if not holding events"""
+
+        cell = (coord[0] // self.event_cell, coord[1] // self.event_cell)
+        arena = self.arena_of(coord)
+        cells = self.event_index.setdefault(arena, {})
+        if holding:
+            cells.setdefault(cell, set()).add(coord)
+            return
+        tiles = cells.get(cell, set())
+        tiles.discard(coord)
+        if not tiles:
+            cells.pop(cell, None)
+        if not cells:
+            self.event_index.pop(arena, None)
 
     def get_around(self, coord, no_collision=True):
         coords = [
@@ -201,8 +578,8 @@ class Maze:
             coords = [c for c in coords if not self.tile_at(c).collision]
         return coords
 
-    def get_address_tiles(self, address):
+    def get_address_tiles(self, address, rng=None):
         addr = ":".join(address)
         if addr in self.address_tiles:
             return self.address_tiles[addr]
-        return random.choice(self.address_tiles.values())
+        return (rng or random).choice(list(self.address_tiles.values()))
@@ -1,30 +1,37 @@
 """generative_agents.memory.associate"""
 
+import sys
 import datetime
-# Temporarily commented out due to import issues
-# from llama_index.core.retrievers import BaseRetriever
-# from llama_index.core.vector_stores import MetadataFilters, ExactMatchFilter
-# from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
 
-from modules.storage.index import LlamaIndex
+import numpy as np
+
+from modules.storage.index import LlamaIndex, MetadataFilters, ExactMatchFilter
 from modules import utils
 from .event import Event
 
-# Temporary placeholder classes
-class BaseRetriever:
-    pass
 
-class MetadataFilters:
-    pass
+_addresses = {}
+
+
+def _split_address(address):
+    """Split the address string, the parts are interned and shared"""
 
-class ExactMatchFilter:
-    pass
+    parts = _addresses.get(address)
+    if parts is None:
+        parts = tuple(sys.intern(p) for p in address.split(":"))
+        _addresses[sys.intern(address)] = parts
+    return list(parts)
 
-class VectorIndexRetriever:
-    pass
+
+def _to_seconds(date):
+    if isinstance(date, (int, float)):
+        return int(date)
+    return utils.to_epoch(date)
 
 
 class Concept:
+    """A memory node, dates are kept as integer epoch seconds"""
+
     def __init__(
         self,
         describe,
@@ -42,15 +49,28 @@ class Concept:
         self.node_id = node_id
         self.node_type = node_type
         self.event = Event(
-            subject, predicate, object, describe=describe, address=address.split(":")
+            subject, predicate, object, describe=describe, address=_split_address(address)
         )
         self.poignancy = poignancy
-        self.create = utils.to_date(create) if create else utils.get_timer().get_date()
-        if expire:
-            self.expire = utils.to_date(expire)
-        else:
-            self.expire = self.create + datetime.timedelta(days=30)
-        self.access = utils.to_date(access) if access else self.create
+        self._create = _to_seconds(create or utils.get_timer().get_date())
+        self._expire = _to_seconds(expire) if expire else self._create + 30 * 24 * 3600
+        self._access = _to_seconds(access) if access else self._create
+
+    @property
+    def create(self):
+        return utils.from_epoch(self._create)
+
+    @property
+    def expire(self):
+        return utils.from_epoch(self._expire)
+
+    @property
+    def access(self):
+        return utils.from_epoch(self._access)
+
+    @access.setter
+    def access(self, date):
+        self._access = _to_seconds(date)
 
     def abstract(self):
         return {
@@ -87,53 +107,6 @@ class Concept:
         )
 
 
-class AssociateRetriever(BaseRetriever):
-    def __init__(self, config, *args, **kwargs) -> None:
-        self._config = config
-        self._vector_retriever = VectorIndexRetriever(*args, **kwargs)
-        super().__init__()
-
-    def _retrieve(self, query_bundle):
-        """Retrieve nodes given query."""
-
-        nodes = self._vector_retriever.retrieve(query_bundle)
-        if not nodes:
-            return []
-        nodes = sorted(
-            nodes, key=lambda n: utils.to_date(n.metadata["access"]), reverse=True
-        )
-        # get scores
-        fac = self._config["recency_decay"]
-        recency_scores = self._normalize(
-            [fac**i for i in range(1, len(nodes) + 1)], self._config["recency_weight"]
-        )
-        relevance_scores = self._normalize(
-            [n.score for n in nodes], self._config["relevance_weight"]
-        )
-        importance_scores = self._normalize(
-            [n.metadata["poignancy"] for n in nodes], self._config["importance_weight"]
-        )
-        final_scores = {
-            n.id_: r1 + r2 + i
-            for n, r1, r2, i in zip(
-                nodes, recency_scores, relevance_scores, importance_scores
-            )
-        }
-        # re-rank nodes
-        nodes = sorted(nodes, key=lambda n: final_scores[n.id_], reverse=True)
-        nodes = nodes[: self._config["retrieve_max"]]
-        for n in nodes:
-            n.metadata["access"] = utils.get_timer().get_date("%Y%m%d-%H:%M:%S")
-        return nodes
-
-    def _normalize(self, data, factor=1, t_min=0, t_max=1):
-        min_val, max_val = min(data), max(data)
-        diff = max_val - min_val
-        if diff == 0:
-            return [(t_max - t_min) * factor / 2 for _ in data]
-        return [(d - min_val) * (t_max - t_min) * factor / diff + t_min for d in data]
-
-
 class Associate:
     def __init__(
         self,
@@ -147,11 +120,17 @@ class Associate:
         relevance_weight=3,
         importance_weight=2,
         memory=None,
+        ann=None,
+        dtype="float32",
     ):
-        self._index = LlamaIndex(embedding, path)
+        self._index = LlamaIndex(embedding, path, ann=ann, dtype=dtype)
+        self._concepts = {}
         self.memory = memory or {"event": [], "thought": [], "chat": []}
-        self.cleanup_index()
         self.retention = retention
+        self._recent = {}
+        self.cleanup_index()
+        for node_type in self.memory:
+            self._refresh_recent(node_type)
         self.max_memory = max_memory
         self.max_importance = max_importance
         self._retrieve_config = {
@@ -172,10 +151,52 @@ class Associate:
 
     def cleanup_index(self):
         node_ids = self._index.cleanup()
-        self.memory = {
-            n_type: [n for n in nodes if n not in node_ids]
-            for n_type, nodes in self.memory.items()
-        }
+        if node_ids:
+            self._forget(node_ids)
+
+    def _forget(self, node_ids):
+        """Drop node_ids from the memory lists and the concept cache"""
+
+        for node_id in node_ids:
+            self._concepts.pop(node_id, None)
+        removed = set(node_ids)
+        for nodes in self.memory.values():
+            # 记忆按时间从新到旧排列，过期的节点通常位于末尾
+            while nodes and nodes[-1] in removed:
+                removed.discard(nodes.pop())
+        if removed:
+            for n_type, nodes in self.memory.items():
+                if any(n in removed for n in nodes):
+                    self.memory[n_type] = [n for n in nodes if n not in removed]
+        for node_type in self.memory:
+            self._refresh_recent(node_type)
+
+    def _refresh_recent(self, node_type):
+        recent = {}
+        for node_id in self.memory[node_type][: self.retention]:
+            describe = self.find_concept(node_id).describe
+            recent[describe] = recent.get(describe, 0) + 1
+        self._recent[node_type] = recent
+
+    def _push_recent(self, node_type, concept):
+        """Add the newest concept to the recent window, drop the one that left"""
+
+        recent = self._recent.setdefault(node_type, {})
+        recent[concept.describe] = recent.get(concept.describe, 0) + 1
+        memory = self.memory[node_type]
+        if len(memory) > self.retention:
+            describe = self.find_concept(memory[self.retention]).describe
+            recent[describe] -= 1
+            if not recent[describe]:
+                recent.pop(describe)
+
+    def recent_describes(self, *node_types):
+        """Describes of the latest retention nodes of node_types"""
+
+        describes = set()
+        for node_type in node_types:
+            describes.update(self._recent.get(node_type, {}))
+        return describes
 
     def add_node(
         self,
@@ -200,27 +221,46 @@ class Associate:
             "access": create.strftime("%Y%m%d-%H:%M:%S"),
         }
         node = self._index.add_node(event.get_describe(), metadata)
+        concept = self.to_concept(node)
         memory = self.memory[node_type]
         memory.insert(0, node.id_)
+        self._push_recent(node_type, concept)
         if len(memory) >= self.max_memory > 0:
-            self._index.remove_nodes(memory[self.max_memory:])
+            self._index.remove_nodes(memory[self.max_memory - 1:])
+            for node_id in memory[self.max_memory - 1:]:
+                self._concepts.pop(node_id, None)
             self.memory[node_type] = memory[: self.max_memory - 1]
-        return self.to_concept(node)
+            self._refresh_recent(node_type)
+        return concept
 
     def to_concept(self, node):
-        return Concept.from_node(node)
+        concept = self._concepts.get(node.id_)
+        if concept is None:
+            if self._index.has_node(node.id_):
+                create, expire, access = self._index.get_dates(node.id_)
+                metadata = {**node.metadata, "create": create, "expire": expire, "access": access}
+                concept = Concept(node.text, node.id_, **metadata)
+                self._concepts[node.id_] = concept
+            else:
+                concept = Concept.from_node(node)
+        return concept
 
     def find_concept(self, node_id):
-        return self.to_concept(self._index.find_node(node_id))
+        concept = self._concepts.get(node_id)
+        if concept is None:
+            concept = self.to_concept(self._index.find_node(node_id))
+        return concept
+
+    def _type_filters(self, *node_types):
+        # memory中的节点与索引中同类型的节点一致，按类型过滤即可
+        return MetadataFilters(
+            filters=[ExactMatchFilter(key="node_type", value=t) for t in node_types],
+            condition="or",
+        )
 
     def _retrieve_nodes(self, node_type, text=None):
         if text:
-            filters = MetadataFilters(
-                filters=[ExactMatchFilter(key="node_type", value=node_type)]
-            )
-            nodes = self._index.retrieve(
-                text, filters=filters, node_ids=self.memory[node_type]
-            )
+            nodes = self._index.retrieve(text, filters=self._type_filters(node_type))
         else:
             nodes = [self._index.find_node(n) for n in self.memory[node_type]]
         return [self.to_concept(n) for n in nodes[: self.retention]]
@@ -236,30 +276,67 @@ class Associate:
         return self._retrieve_nodes("chat", text)
 
     def retrieve_focus(self, focus, retrieve_max=30, reduce_all=True):
-        def _create_retriever(*args, **kwargs):
-            self._retrieve_config["retrieve_max"] = retrieve_max
-            return AssociateRetriever(self._retrieve_config, *args, **kwargs)
-
-        retrieved = {}
-        node_ids = self.memory["event"] + self.memory["thought"]
-        for text in focus:
-            nodes = self._index.retrieve(
-                text,
-                similarity_top_k=len(node_ids),
-                node_ids=node_ids,
-                retriever_creator=_create_retriever,
+        """Retrieve the events and thoughts for all the focus in one pass.
+
+        All focus are embedded in one batch and scored against the memory in
+        one matmul, each node is scored by recency, relevance and importance.
+        """
+
+        rows, similarity = self._index.similarity(
+            focus, filters=self._type_filters("event", "thought")
+        )
+        ranked = {text: [] for text in focus}
+        if len(rows):
+            config = self._retrieve_config
+            access = self._index.column("access", rows)
+            importance = self._normalize(
+                self._index.column("poignancy", rows), config["importance_weight"]
             )
-            if reduce_all:
-                retrieved.update({n.id_: n for n in nodes})
-            else:
-                retrieved[text] = nodes
+            recency_by_rank = self._normalize(
+                config["recency_decay"] ** np.arange(1, len(rows) + 1),
+                config["recency_weight"],
+            )
+            k = min(retrieve_max, len(rows))
+            for text, scores in zip(focus, similarity):
+                # 按相关度排序后再按访问时间稳定排序，得到近期度的排名
+                order = np.argsort(-scores, kind="stable")
+                order = order[np.argsort(-access[order], kind="stable")]
+                recency = np.empty(len(rows))
+                recency[order] = recency_by_rank
+                final = (
+                    recency
+                    + self._normalize(scores, config["relevance_weight"])
+                    + importance
+                )
+                top = np.argpartition(-final, k - 1)[:k] if k < len(rows) else np.arange(k)
+                ranked[text] = rows[top[np.argsort(-final[top], kind="stable")]]
+            access = utils.get_timer().get_date()
+            touched = self._index.touch(
+                np.unique(np.concatenate(list(ranked.values()))),
+                access.strftime("%Y%m%d-%H:%M:%S"),
+            )
+            for node_id in touched:
+                if node_id in self._concepts:
+                    self._concepts[node_id].access = access
         if reduce_all:
-            return [self.to_concept(v) for v in retrieved.values()]
+            retrieved = {}
+            for top in ranked.values():
+                retrieved.update({row: None for row in top})
+            return [self.to_concept(self._index.node_at(r)) for r in retrieved]
         return {
-            text: [self.to_concept(n) for n in nodes]
-            for text, nodes, in retrieved.items()
+            text: [self.to_concept(self._index.node_at(r)) for r in top]
+            for text, top in ranked.items()
         }
 
+    @staticmethod
+    def _normalize(data, factor=1, t_min=0, t_max=1):
+        data = np.asarray(data, dtype=np.float64)
+        min_val, max_val = data.min(), data.max()
+        diff = max_val - min_val
+        if diff == 0:
+            return np.full(len(data), (t_max - t_min) * factor / 2)
+        return (data - min_val) * (t_max - t_min) * factor / diff + t_min
+
     def get_relation(self, node):
         return {
             "node": node,
@@ -0,0 +1,119 @@
+"""generative_agents.model.llm_cache"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+class LLMCache:
+    """Persistent prompt -> response cache with size bounded LRU eviction.
+
+    Entries live in a sqlite database, so the cache is shared between threads
+    and between processes that point to the same path.
+    """
+
+    def __init__(self, path, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, caller TEXT, response TEXT, access REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_access ON responses(access)"
+        )
+        self._conn.commit()
+        self._entries = self._count()
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0}
+
+    @staticmethod
+    def make_key(provider, model, caller, prompt, **kwargs):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        meta = json.dumps(
+            [provider, model, caller, prompt_hash, kwargs],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(meta.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET access=? WHERE key=?", (time.time(), key)
+            )
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return row[0]
+
+    def put(self, key, response, caller=""):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, caller, response, time.time()),
+            )
+            self._entries += cursor.rowcount
+            if self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # 批量淘汰最久未访问的条目，避免每次写入都淘汰
+        self._entries = self._count()
+        overflow = self._entries - int(self.max_entries * 0.9)
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY access ASC LIMIT ?)",
+            (overflow,),
+        )
+        self._entries -= overflow
+        self._stats["evicted"] += overflow
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._entries = 0
+
+    def get_summary(self):
+        with self._lock:
+            return {"path": self.path, "entries": self._entries, **self._stats}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_llm_cache(config):
+    """Get the shared cache for config, None if cache is not enabled"""
+
+    if not config or not config.get("path"):
+        return None
+    path = os.path.abspath(config["path"])
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = LLMCache(path, config.get("max_entries", 100000))
+        return _caches[path]
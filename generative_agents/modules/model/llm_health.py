@@ -0,0 +1,205 @@
+"""generative_agents.model.llm_health"""
+
+import time
+import random
+import threading
+from collections import deque
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with full jitter for the attempt-th retry"""
+
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RouteHealth:
+    """Rolling latency/error window and circuit breaker of one route.
+
+    The circuit opens after failure_threshold consecutive failures, or when the
+    error rate of the window reaches error_rate. After cooldown seconds a single
+    probe is let through (half open), its result closes or re-opens the circuit.
+    Routes are shared by the models of all agents, every method holds the lock.
+    """
+
+    def __init__(
+        self,
+        name,
+        window=20,
+        failure_threshold=3,
+        error_rate=0.5,
+        min_samples=5,
+        cooldown=30.0,
+        clock=time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_limit = error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self._clock = clock
+        self._latencies = deque(maxlen=window)
+        self._results = deque(maxlen=window)
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._stats = {"success": 0, "failure": 0, "skipped": 0, "opened": 0}
+        self._lock = threading.RLock()
+
+    def available(self):
+        """Check if the route may be tried, without taking the probe slot"""
+
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                return self._clock() - self._opened_at >= self.cooldown
+            return not self._probing
+
+    def acquire(self):
+        """Take the right to call the route, half open routes allow one probe"""
+
+        with self._lock:
+            if not self.available():
+                self._stats["skipped"] += 1
+                return False
+            if self.state != "closed":
+                self.state, self._probing = "half_open", True
+            return True
+
+    def record_success(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self._results.append(True)
+            self._stats["success"] += 1
+            self._failures, self._probing = 0, False
+            self.state = "closed"
+
+    def record_failure(self, latency=None):
+        with self._lock:
+            if latency is not None:
+                self._latencies.append(latency)
+            self._results.append(False)
+            self._stats["failure"] += 1
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._open()
+            elif (
+                len(self._results) >= self.min_samples
+                and self.error_rate >= self.error_rate_limit
+            ):
+                self._open()
+
+    def _open(self):
+        self.state, self._probing = "open", False
+        self._opened_at = self._clock()
+        self._stats["opened"] += 1
+
+    @property
+    def latency(self):
+        """Median latency of the window, None if no sample yet"""
+
+        with self._lock:
+            if not self._latencies:
+                return None
+            return sorted(self._latencies)[len(self._latencies) // 2]
+
+    @property
+    def error_rate(self):
+        with self._lock:
+            if not self._results:
+                return 0.0
+            return self._results.count(False) / len(self._results)
+
+    def get_summary(self):
+        with self._lock:
+            latency = self.latency
+            return {
+                "state": self.state,
+                "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+                "error_rate": round(self.error_rate, 3),
+                **self._stats,
+            }
+
+
+class HealthRouter:
+    """Track the health of routes (providers or models) and order them.
+
+    Unavailable routes are skipped, the available ones are ordered by their
+    median latency penalized by the error rate. Routes without samples keep
+    their priority order and are tried first, so that they get measured.
+    """
+
+    def __init__(self, config=None, clock=time.monotonic):
+        self.config = config or {}
+        self._clock = clock
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def route(self, name):
+        with self._lock:
+            if name not in self._routes:
+                self._routes[name] = RouteHealth(name, clock=self._clock, **self.config)
+            return self._routes[name]
+
+    def order(self, names):
+        def _cost(name):
+            health = self.route(name)
+            if health.latency is None:
+                return 0.0
+            return health.latency * (1 + health.error_rate)
+
+        candidates = [n for n in names if self.route(n).available()]
+        return sorted(candidates, key=_cost)
+
+    def call(self, names, func):
+        """Call func(name) on the healthiest routes until one succeeds"""
+
+        errors = []
+        for name in self.order(names):
+            health = self.route(name)
+            if not health.acquire():
+                continue
+            start = self._clock()
+            try:
+                result = func(name)
+            except Exception as e:
+                health.record_failure(self._clock() - start)
+                errors.append("{}: {}".format(name, e))
+                continue
+            health.record_success(self._clock() - start)
+            return result
+        if not errors:
+            raise Exception("所有路由都处于熔断状态: {}".format(", ".join(names)))
+        raise Exception("所有路由都失败: " + "; ".join(errors))
+
+    def get_summary(self, names=None):
+        with self._lock:
+            routes = dict(self._routes)
+        if names is not None:
+            routes = {n: h for n, h in routes.items() if n in names}
+        return {n: h.get_summary() for n, h in routes.items()}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_health_router(config=None):
+    """Get the router shared by all the llm models of the process.
+
+    Routes are keyed by provider/model, so a circuit opened by one agent is
+    skipped by all the others. config only applies when the router is created.
+    """
+
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = HealthRouter(config)
+        return _router
+
+
+def reset_health_router():
+    global _router
+    with _router_lock:
+        _router = None
@@ -3,9 +3,75 @@
 import time
 import re
 import requests
-import json
 import os
-from urllib.parse import urlencode
+import asyncio
+import threading
+import contextvars
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+from .llm_cache import LLMCache, get_llm_cache
+from .llm_health import backoff_delay, get_health_router
+from .llm_replay import Cassette
+
+
+class HTTPTransport:
+    """Keep-alive connection pool shared by all the requests to one base url"""
+
+    def __init__(self, base_url, max_inflight=8):
+        self.base_url = base_url
+        self.max_inflight = max_inflight
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_inflight)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "inflight": 0, "peak": 0}
+
+    def post(self, url, **kwargs):
+        with self._slots:
+            with self._lock:
+                self._stats["requests"] += 1
+                self._stats["inflight"] += 1
+                self._stats["peak"] = max(self._stats["peak"], self._stats["inflight"])
+            try:
+                return self._session.post(url, **kwargs)
+            finally:
+                with self._lock:
+                    self._stats["inflight"] -= 1
+
+    async def apost(self, url, **kwargs):
+        return await asyncio.to_thread(self.post, url, **kwargs)
+
+    def get_summary(self):
+        with self._lock:
+            return {"base_url": self.base_url, "max_inflight": self.max_inflight, **self._stats}
+
+    def close(self):
+        self._session.close()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(url, max_inflight=8):
+    """Get the shared transport for the base url of url"""
+
+    parsed = urlparse(url)
+    base_url = "{}://{}".format(parsed.scheme, parsed.netloc)
+    with _transports_lock:
+        if base_url not in _transports:
+            _transports[base_url] = HTTPTransport(base_url, max_inflight)
+        return _transports[base_url]
+
+
+def close_transports():
+    with _transports_lock:
+        for transport in _transports.values():
+            transport.close()
+        _transports.clear()
 
 
 class LLMModel:
@@ -13,8 +79,17 @@ class LLMModel:
         self._api_key = config["api_key"]
         self._base_url = config["base_url"]
         self._model = config["model"]
+        self._provider = config.get("provider", self.__class__.__name__)
+        self._max_inflight = config.get("max_inflight", 8)
         self._meta_responses = []
         self._summary = {"total": [0, 0, 0]}
+        self._cache = get_llm_cache(config.get("cache"))
+        self._cache_stats = {"hits": 0, "misses": 0}
+        self._timeout = config.get("timeout", 30)
+        self._backoff = {"base": 1.0, "cap": 10.0, **config.get("retry_backoff", {})}
+        # 健康状态和熔断在进程内所有模型之间共享，按provider/model区分路由
+        self._health = get_health_router(config.get("health"))
+        self._route_names = set()
 
         self._handle = self.setup(config)
         self._enabled = True
@@ -33,12 +108,64 @@ class LLMModel:
         caller="llm_normal",
         **kwargs
     ):
-        response, self._meta_responses = None, []
+        steps = self._completion_steps(prompt, retry, callback, failsafe, caller, kwargs)
+        outcome = None
+        while True:
+            try:
+                delay = steps.send(outcome)
+            except StopIteration as stop:
+                return stop.value
+            if delay:
+                time.sleep(delay)
+            try:
+                outcome = self._completion(prompt, **kwargs)
+            except Exception as e:
+                outcome = e
+
+    async def acompletion(
+        self,
+        prompt,
+        retry=10,
+        callback=None,
+        failsafe=None,
+        caller="llm_normal",
+        **kwargs
+    ):
+        steps = self._completion_steps(prompt, retry, callback, failsafe, caller, kwargs)
+        outcome = None
+        while True:
+            try:
+                delay = steps.send(outcome)
+            except StopIteration as stop:
+                return stop.value
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                outcome = await self._acompletion(prompt, **kwargs)
+            except Exception as e:
+                outcome = e
+
+    def _completion_steps(self, prompt, retry, callback, failsafe, caller, kwargs):
+        """The cache lookup, retry/backoff and summary shared by the completions.
+
+        Yields the delay to wait before every call of the model, and is sent
+        back the response of the call or the exception it raised. Returns the
+        parsed response, or failsafe when all the attempts failed.
+        """
+
+        response, meta_responses = None, []
         self._summary.setdefault(caller, [0, 0, 0])
-        for _ in range(retry):
+        cache_key, response = self._cache_lookup(prompt, callback, caller, kwargs)
+        if response is not None:
+            retry, meta_responses = 0, self._meta_responses
+        delay = 0
+        for attempt in range(retry):
+            outcome = yield delay
             try:
-                meta_response = self._completion(prompt, **kwargs).strip()
-                self._meta_responses.append(meta_response)
+                if isinstance(outcome, Exception):
+                    raise outcome
+                meta_response = outcome.strip()
+                meta_responses.append(meta_response)
                 self._summary["total"][0] += 1
                 self._summary[caller][0] += 1
                 if callback:
@@ -47,21 +174,61 @@ class LLMModel:
                     response = meta_response
             except Exception as e:
                 print(f"LLMModel.completion() caused an error: {e}")
-                time.sleep(5)
+                delay = backoff_delay(attempt, **self._backoff)
                 response = None
                 continue
             if response is not None:
+                self._cache_store(cache_key, meta_response, caller)
                 break
+        self._meta_responses = meta_responses
         pos = 2 if response is None else 1
         self._summary["total"][pos] += 1
         self._summary[caller][pos] += 1
         return response or failsafe
 
+    def _cache_lookup(self, prompt, callback, caller, kwargs):
+        """Find the cached response for prompt, return (cache_key, response)"""
+
+        if not self._cache:
+            return None, None
+        cache_key = LLMCache.make_key(
+            self._provider, self._model, caller, prompt, **kwargs
+        )
+        meta_response = self._cache.get(cache_key)
+        if meta_response is not None:
+            try:
+                response = callback(meta_response) if callback else meta_response
+            except Exception:
+                response = None
+            if response is not None:
+                self._cache_stats["hits"] += 1
+                self._meta_responses = [meta_response]
+                return cache_key, response
+        self._cache_stats["misses"] += 1
+        return cache_key, None
+
+    def _cache_store(self, cache_key, meta_response, caller):
+        if self._cache and cache_key:
+            self._cache.put(cache_key, meta_response, caller)
+
     def _completion(self, prompt, **kwargs):
         raise NotImplementedError(
             "_completion is not support for " + str(self.__class__)
         )
 
+    async def _acompletion(self, prompt, **kwargs):
+        return await asyncio.to_thread(self._completion, prompt, **kwargs)
+
+    def _route_call(self, provider, models, func):
+        """Call func(model) on the healthiest of the provider/model routes"""
+
+        routes = {"{}/{}".format(provider, m): m for m in models}
+        self._route_names.update(routes)
+        return self._health.call(list(routes), lambda r: func(routes[r]))
+
+    def _post(self, url, **kwargs):
+        return get_transport(url, self._max_inflight).post(url, **kwargs)
+
     def is_available(self):
         return self._enabled  # and self._summary["total"][2] <= 10
 
@@ -69,7 +236,15 @@ class LLMModel:
         des = {}
         for k, v in self._summary.items():
             des[k] = "S:{},F:{}/R:{}".format(v[1], v[2], v[0])
-        return {"model": self._model, "summary": des}
+        summary = {"model": self._model, "summary": des}
+        if self._cache:
+            summary["cache"] = "H:{}/M:{}".format(
+                self._cache_stats["hits"], self._cache_stats["misses"]
+            )
+        health = self._health.get_summary(self._route_names)
+        if health:
+            summary["health"] = health
+        return summary
 
     def disable(self):
         self._enabled = False
@@ -82,109 +257,202 @@ class LLMModel:
 class PollinationsLLMModel(LLMModel):
     def setup(self, config):
         self._pai_token = os.getenv('PAI_TOKEN', 'r5bQfseAxxaO7YNc')
+        self._url = config.get("pollinations_url", "https://text.pollinations.ai/openai")
+        # 默认优先级：openai-large → gemini → openai → deepseek，实际顺序由健康状况决定
+        self._models = config.get(
+            "pollinations_models", ['openai-large', 'gemini', 'openai', 'deepseek']
+        )
         return None
 
     def _completion(self, prompt, temperature=0.5):
-        # 按优先级尝试不同模型：openai-large → gemini → openai → deepseek
-        models = ['openai-large', 'gemini', 'openai', 'deepseek']
-        
-        for model in models:
-            try:
-                messages = [{"role": "user", "content": prompt}]
-                
-                body = {
-                    "model": model,
-                    "messages": messages,
-                    "max_tokens": 8192,
-                    "temperature": temperature,
-                    "stream": False,
-                    "token": self._pai_token
-                }
-                
-                response = requests.post(
-                    url='https://text.pollinations.ai/openai',
-                    headers={
-                        'Content-Type': 'application/json',
-                        'Authorization': f'Bearer {self._pai_token}'
-                    },
-                    json=body,
-                    timeout=30
-                )
-                
-                if response.ok:
-                    result = response.json()
-                    if result and 'choices' in result and len(result['choices']) > 0:
-                        content = result['choices'][0]['message']['content']
-                        print(f"Pollinations {model} 成功响应")
-                        return content
-                else:
-                    print(f"Pollinations {model} 失败: HTTP {response.status_code}")
-                    
-            except Exception as e:
-                print(f"Pollinations {model} 异常: {e}")
-                continue
-        
-        # 所有Pollinations模型都失败，抛出异常让上层处理
-        raise Exception("所有Pollinations模型都失败")
+        # 跳过熔断中的模型，优先使用最快的健康模型
+        return self._route_call(
+            "pollinations", self._models, lambda m: self._model_completion(m, prompt, temperature)
+        )
+
+    def _model_completion(self, model, prompt, temperature=0.5):
+        messages = [{"role": "user", "content": prompt}]
+
+        body = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": 8192,
+            "temperature": temperature,
+            "stream": False,
+            "token": self._pai_token
+        }
+
+        response = self._post(
+            self._url,
+            headers={
+                'Content-Type': 'application/json',
+                'Authorization': f'Bearer {self._pai_token}'
+            },
+            json=body,
+            timeout=self._timeout
+        )
+
+        if response.ok:
+            result = response.json()
+            if result and 'choices' in result and len(result['choices']) > 0:
+                return result['choices'][0]['message']['content']
+
+        raise Exception(f"Pollinations {model} 失败: HTTP {response.status_code}")
 
 
 class GLMLLMModel(LLMModel):
     def setup(self, config):
         self._zhipu_api_key = os.getenv('ZHIPUAI_API_KEY', 'c776b1833ad5e38df90756a57b1bcafc.Da0sFSNyQE2BMJEd')
+        self._url = config.get("glm_url", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
+        self._models = [config.get("glm_model", "glm-4-flash-250414")]
         return None
 
     def _completion(self, prompt, temperature=0.5):
+        return self._route_call(
+            "glm", self._models, lambda m: self._model_completion(m, prompt, temperature)
+        )
+
+    def _model_completion(self, model, prompt, temperature=0.5):
         messages = [{"role": "user", "content": prompt}]
-        
+
         body = {
-            "model": "glm-4-flash-250414",
+            "model": model,
             "messages": messages,
             "max_tokens": 8192,
             "temperature": temperature,
             "stream": False
         }
-        
-        response = requests.post(
-            url='https://open.bigmodel.cn/api/paas/v4/chat/completions',
+
+        response = self._post(
+            self._url,
             headers={
                 'Content-Type': 'application/json',
                 'Authorization': f'Bearer {self._zhipu_api_key}'
             },
             json=body,
-            timeout=30
+            timeout=self._timeout
         )
-        
+
         if response.ok:
             result = response.json()
             if result and 'choices' in result and len(result['choices']) > 0:
                 return result['choices'][0]['message']['content']
-        
+
         raise Exception(f"GLM API 失败: HTTP {response.status_code}")
 
 
 class HybridLLMModel(LLMModel):
-    """混合LLM模型，优先使用Pollinations，失败时降级到GLM"""
-    
+    """混合LLM模型，在Pollinations和GLM的所有模型之间按健康状况路由"""
+
     def setup(self, config):
         self._pollinations = PollinationsLLMModel(config)
         self._glm = GLMLLMModel(config)
+        # 路由按优先级排列：先Pollinations的各个模型，最后降级到GLM
+        # 路由名与单独的Pollinations/GLM模型相同，共享同一份健康状态
+        self._routes = {}
+        for provider, llm in [("pollinations", self._pollinations), ("glm", self._glm)]:
+            for model in llm._models:
+                self._routes["{}/{}".format(provider, model)] = (llm, model)
         return None
-    
+
     def _completion(self, prompt, temperature=0.5):
-        # 首先尝试Pollinations（按优先级：openai-large → gemini → openai → deepseek）
+        def _call(route):
+            llm, model = self._routes[route]
+            return llm._model_completion(model, prompt, temperature)
+
+        self._route_names.update(self._routes)
+        return self._health.call(list(self._routes.keys()), _call)
+
+
+_llm_caller = contextvars.ContextVar("llm_caller", default="llm_normal")
+
+
+class ReplayLLMModel(LLMModel):
+    """离线LLM模型，用于可复现的基准测试
+
+    replay: 从录制文件中按caller和prompt回放响应，未录制的prompt直接返回failsafe
+    record: 包装真实模型，把每次响应录制到文件
+    synthetic: 不访问任何服务，直接返回failsafe
+    所有模式都可以通过latency配置人为延迟（秒）
+    """
+
+    modes = ("replay", "record", "synthetic")
+
+    def __init__(self, config):
+        super().__init__({"api_key": "", "base_url": "", "model": "replay", **config})
+
+    def setup(self, config):
+        self._mode = config.get("mode", "replay")
+        assert self._mode in self.modes, "Unexpected replay mode {}, should be in {}".format(
+            self._mode, self.modes
+        )
+        self._latency = config.get("latency", 0.0)
+        self._cassette = Cassette(config["cassette"]) if config.get("cassette") else None
+        assert self._cassette is not None or self._mode == "synthetic", "cassette is required for " + self._mode
+        self._inner = None
+        if self._mode == "record":
+            self._inner = create_llm_model(config["record"])
+        elif "retry_backoff" not in config:
+            # 回放不需要等待
+            self._backoff = {"base": 0.0, "cap": 0.0}
+        return None
+
+    def _is_synthetic(self, prompt, caller):
+        if self._mode == "synthetic":
+            return True
+        return self._mode == "replay" and not self._cassette.has(caller, prompt)
+
+    def _synthetic(self, failsafe, caller):
+        if self._latency:
+            time.sleep(self._latency)
+        self._meta_responses = []
+        self._summary.setdefault(caller, [0, 0, 0])
+        for key in ("total", caller):
+            self._summary[key][0] += 1
+            self._summary[key][1] += 1
+        return failsafe
+
+    def completion(self, prompt, retry=10, callback=None, failsafe=None, caller="llm_normal", **kwargs):
+        if self._is_synthetic(prompt, caller):
+            return self._synthetic(failsafe, caller)
+        token = _llm_caller.set(caller)
         try:
-            return self._pollinations._completion(prompt, temperature)
-        except Exception as e:
-            print(f"Pollinations 服务失败，降级到 GLM: {e}")
-            
-            # 降级到GLM
-            try:
-                result = self._glm._completion(prompt, temperature)
-                print("GLM 服务成功响应")
-                return result
-            except Exception as glm_error:
-                print(f"GLM 服务也失败: {glm_error}")
-                raise Exception("所有AI服务都失败了")
+            return super().completion(
+                prompt, retry=retry, callback=callback, failsafe=failsafe, caller=caller, **kwargs
+            )
+        finally:
+            _llm_caller.reset(token)
+
+    async def acompletion(self, prompt, retry=10, callback=None, failsafe=None, caller="llm_normal", **kwargs):
+        if self._is_synthetic(prompt, caller):
+            return await asyncio.to_thread(self._synthetic, failsafe, caller)
+        token = _llm_caller.set(caller)
+        try:
+            return await super().acompletion(
+                prompt, retry=retry, callback=callback, failsafe=failsafe, caller=caller, **kwargs
+            )
+        finally:
+            _llm_caller.reset(token)
+
+    def _completion(self, prompt, **kwargs):
+        caller = _llm_caller.get()
+        if self._mode == "record":
+            response = self._inner._completion(prompt, **kwargs)
+            self._cassette.put(caller, prompt, response)
+            return response
+        if self._latency:
+            time.sleep(self._latency)
+        response = self._cassette.get(caller, prompt)
+        if response is None:
+            raise Exception("No recorded response for " + caller)
+        return response
+
+    def get_summary(self):
+        summary = super().get_summary()
+        summary["replay"] = {"mode": self._mode}
+        if self._cassette is not None:
+            summary["replay"].update(self._cassette.get_summary())
+        return summary
 
 
 def create_llm_model(llm_config):
@@ -196,9 +464,11 @@ def create_llm_model(llm_config):
         return GLMLLMModel(llm_config)
     elif llm_config["provider"] == "hybrid":
         return HybridLLMModel(llm_config)
+    elif llm_config["provider"] == "replay":
+        return ReplayLLMModel(llm_config)
     else:
         raise NotImplementedError(
-            "llm provider {} is not supported. Only 'pollinations', 'glm', and 'hybrid' are supported.".format(llm_config["provider"])
+            "llm provider {} is not supported. Only 'pollinations', 'glm', 'hybrid' and 'replay' are supported.".format(llm_config["provider"])
         )
     return None
 
@@ -0,0 +1,79 @@
+"""generative_agents.model.llm_replay"""
+
+import os
+import json
+import hashlib
+import threading
+
+
+class Cassette:
+    """Recorded llm responses, keyed by caller and the hash of the prompt.
+
+    Records are appended to a jsonl file. When a key is recorded several times
+    (e.g. the retries of one completion), the responses are replayed in the
+    recorded order and the last one is repeated after that.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._records = {}
+        self._cursor = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "recorded": 0}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        record = json.loads(line)
+                        self._records.setdefault(record["key"], []).append(
+                            record["response"]
+                        )
+
+    @staticmethod
+    def make_key(caller, prompt):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return "{}:{}".format(caller, prompt_hash)
+
+    def get(self, caller, prompt):
+        key = self.make_key(caller, prompt)
+        with self._lock:
+            responses = self._records.get(key)
+            if not responses:
+                self._stats["misses"] += 1
+                return None
+            idx = self._cursor.get(key, 0)
+            self._cursor[key] = idx + 1
+            self._stats["hits"] += 1
+            return responses[min(idx, len(responses) - 1)]
+
+    def has(self, caller, prompt):
+        with self._lock:
+            return self.make_key(caller, prompt) in self._records
+
+    def put(self, caller, prompt, response):
+        key = self.make_key(caller, prompt)
+        record = {"key": key, "caller": caller, "response": response}
+        with self._lock:
+            self._records.setdefault(key, []).append(response)
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._stats["recorded"] += 1
+
+    def rewind(self):
+        with self._lock:
+            self._cursor = {}
+
+    def get_summary(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "keys": len(self._records),
+                **self._stats,
+            }
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,230 @@
+"""generative_agents.pathfinding"""
+
+import heapq
+import threading
+
+import numpy as np
+
+
+class GridPathFinder:
+    """A* search on a 4-connected grid of walkable tiles.
+
+    walkable is a (height, width) bool array. Tiles are addressed by flat
+    index y * width + x. The scratch buffers are allocated once per thread and
+    reused: an entry belongs to the current search only if its stamp equals
+    the search counter, so nothing is cleared between searches. With several
+    goals the heuristic is the distance to their bounding box, which keeps it
+    admissible, and the search stops at the first goal popped. Connected
+    components are labelled up front, so goals that can not be reached from
+    the source are dropped before searching. The labels can be passed in as
+    components, e.g. restored from a cache, to skip the labelling.
+    """
+
+    def __init__(self, walkable, components=None):
+        self.walkable = np.ascontiguousarray(walkable, dtype=bool)
+        self.height, self.width = self.walkable.shape
+        self._walkable = self.walkable.ravel().tolist()
+        if components is None:
+            self._components = self._label_components()
+        else:
+            self._components = np.asarray(components).ravel().tolist()
+        self._local = threading.local()
+        self._stats = {"searches": 0, "expanded": 0, "unreachable": 0}
+
+    def _neighbors(self, idx):
+        x, y = idx % self.width, idx // self.width
+        if x > 0:
+            yield idx - 1
+        if x < self.width - 1:
+            yield idx + 1
+        if y > 0:
+            yield idx - self.width
+        if y < self.height - 1:
+            yield idx + self.width
+
+    def _label_components(self):
+        """Label the connected walkable tiles, 0 for the tiles not walkable"""
+
+        walkable, labels, label = self._walkable, [0] * len(self._walkable), 0
+        for seed, free in enumerate(walkable):
+            if not free or labels[seed]:
+                continue
+            label += 1
+            labels[seed], stack = label, [seed]
+            while stack:
+                for nxt in self._neighbors(stack.pop()):
+                    if walkable[nxt] and not labels[nxt]:
+                        labels[nxt] = label
+                        stack.append(nxt)
+        return labels
+
+    def _reachable(self, start):
+        """Get the components reachable from start, which may not be walkable"""
+
+        if self._walkable[start]:
+            return {self._components[start]}
+        return set(self._components[n] for n in self._neighbors(start)) - {0}
+
+    def _scratch(self):
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None:
+            size = self.width * self.height
+            scratch = [0, [0] * size, [0] * size, [0] * size, [0] * size]
+            self._local.scratch = scratch
+        scratch[0] += 1
+        return scratch
+
+    @property
+    def components(self):
+        return np.array(self._components, dtype=np.int32).reshape(self.height, self.width)
+
+    def in_bounds(self, coord):
+        return 0 <= coord[0] < self.width and 0 <= coord[1] < self.height
+
+    def find_path(self, src_coord, dst_coords):
+        """Find the shortest path from src_coord to the nearest of dst_coords.
+
+        Return the coords from src_coord to the goal, [] if no goal is reachable.
+        """
+
+        width, height, walkable = self.width, self.height, self._walkable
+        if not self.in_bounds(src_coord):
+            return []
+        start = src_coord[1] * width + src_coord[0]
+        goals = set(c[1] * width + c[0] for c in dst_coords if self.in_bounds(c))
+        if start in goals:
+            return [(src_coord[0], src_coord[1])]
+        components = self._reachable(start)
+        goals = set(g for g in goals if self._components[g] in components)
+        if not goals:
+            self._stats["unreachable"] += 1
+            return []
+        x_min = min(g % width for g in goals)
+        x_max = max(g % width for g in goals)
+        y_min = min(g // width for g in goals)
+        y_max = max(g // width for g in goals)
+
+        search, stamp, closed, cost, parent = self._scratch()
+        stamp[start], cost[start], parent[start] = search, 0, -1
+        h = max(x_min - src_coord[0], 0, src_coord[0] - x_max) + max(
+            y_min - src_coord[1], 0, src_coord[1] - y_max
+        )
+        frontier = [(h, h, start)]
+        expanded = 0
+        while frontier:
+            _, _, cur = heapq.heappop(frontier)
+            if closed[cur] == search:
+                continue
+            if cur in goals:
+                self._stats["searches"] += 1
+                self._stats["expanded"] += expanded
+                return self._trace(cur, parent)
+            closed[cur] = search
+            expanded += 1
+            x, y = cur % width, cur // width
+            g = cost[cur] + 1
+            for nxt, nx, ny in (
+                (cur - 1, x - 1, y),
+                (cur + 1, x + 1, y),
+                (cur - width, x, y - 1),
+                (cur + width, x, y + 1),
+            ):
+                if not (0 <= nx < width and 0 <= ny < height) or not walkable[nxt]:
+                    continue
+                if closed[nxt] == search or (stamp[nxt] == search and cost[nxt] <= g):
+                    continue
+                stamp[nxt], cost[nxt], parent[nxt] = search, g, cur
+                h = max(x_min - nx, 0, nx - x_max) + max(y_min - ny, 0, ny - y_max)
+                heapq.heappush(frontier, (g + h, h, nxt))
+        return []
+
+    def _trace(self, cur, parent):
+        width, path = self.width, []
+        while cur != -1:
+            path.append((cur % width, cur // width))
+            cur = parent[cur]
+        return path[::-1]
+
+    def get_summary(self):
+        searches = self._stats["searches"]
+        return {
+            **self._stats,
+            "avg_expanded": round(self._stats["expanded"] / searches, 1) if searches else 0.0,
+        }
+
+
+class FlowField:
+    """Distance from every tile to the nearest of the goals, and the next step.
+
+    The field is built by one reverse breadth first search from all the
+    walkable goals at once, expanded as whole-grid NumPy wavefronts. A path is
+    then read by following the next steps, in O(path length). Both the
+    distances and the next steps are kept as flat int32 arrays, 8 bytes a tile.
+    """
+
+    def __init__(self, walkable, goals):
+        walkable = np.asarray(walkable, dtype=bool)
+        height, width = walkable.shape
+        self.width = width
+        dist = np.full((height, width), -1, dtype=np.int32)
+        frontier = np.zeros((height, width), dtype=bool)
+        for x, y in goals:
+            if 0 <= x < width and 0 <= y < height and walkable[y, x]:
+                frontier[y, x] = True
+        step = 0
+        while frontier.any():
+            dist[frontier] = step
+            grown = np.zeros_like(frontier)
+            grown[1:, :] |= frontier[:-1, :]
+            grown[:-1, :] |= frontier[1:, :]
+            grown[:, 1:] |= frontier[:, :-1]
+            grown[:, :-1] |= frontier[:, 1:]
+            frontier = grown & walkable & (dist < 0)
+            step += 1
+        self.dist = dist
+
+        # 每个瓦片的下一步为距离减一的相邻瓦片，顺序为左右上下
+        unreached = np.iinfo(np.int32).max
+        padded = np.full((height + 2, width + 2), unreached, dtype=np.int64)
+        padded[1:-1, 1:-1] = np.where(dist >= 0, dist, unreached)
+        around = np.stack(
+            [padded[1:-1, :-2], padded[1:-1, 2:], padded[:-2, 1:-1], padded[2:, 1:-1]]
+        )
+        offsets = np.array([-1, 1, -width, width])
+        index = np.arange(height * width).reshape(height, width)
+        valid = (dist > 0) & (around.min(axis=0) == dist - 1)
+        steps = np.where(valid, index + offsets[around.argmin(axis=0)], -1)
+        self._dist = dist.ravel()
+        self._next = steps.astype(np.int32).ravel()
+
+    @property
+    def nbytes(self):
+        return self._dist.nbytes + self._next.nbytes
+
+    def distance(self, coord):
+        return int(self._dist[coord[1] * self.width + coord[0]])
+
+    def path(self, src_coord):
+        """Get the coords from src_coord to the nearest goal, [] if unreachable"""
+
+        width, height = self.width, len(self._dist) // self.width
+        if not (0 <= src_coord[0] < width and 0 <= src_coord[1] < height):
+            return []
+        dist, steps = self._dist, self._next
+        cur = src_coord[1] * width + src_coord[0]
+        path = []
+        if dist[cur] < 0:
+            # 起点不可通行时从最近的可通行相邻瓦片出发
+            x, y = src_coord[0], src_coord[1]
+            around = [
+                y * width + nx for nx in (x - 1, x + 1) if 0 <= nx < width
+            ] + [ny * width + x for ny in (y - 1, y + 1) if 0 <= ny < height]
+            around = [n for n in around if dist[n] >= 0]
+            if not around:
+                return []
+            path.append((src_coord[0], src_coord[1]))
+            cur = min(around, key=lambda n: dist[n])
+        while cur != -1:
+            path.append((cur % width, cur // width))
+            cur = int(steps[cur])
+        return path
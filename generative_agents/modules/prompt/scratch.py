@@ -3,11 +3,11 @@
 import random
 import datetime
 import re
-from string import Template
 
 from modules import utils
 from modules.memory import Event
 from modules.model import parse_llm_output
+from .template import get_template_registry
 
 
 class Scratch:
@@ -16,30 +16,34 @@ class Scratch:
         self.currently = currently
         self.config = config
         self.template_path = "data/prompts"
+        self._templates = get_template_registry(self.template_path)
+        self._base_desc_cache = (None, "")
+        # 随机的failsafe使用独立的随机数生成器，由Agent按步重新设置种子
+        self.rng = random.Random(name)
 
     def build_prompt(self, template, data):
-        with open(f"{self.template_path}/{template}.txt", "r", encoding="utf-8") as file:
-            file_content = file.read()
-
-        template = Template(file_content)
-        filled_content = template.substitute(data)
-
-        return filled_content
+        return self._templates.render(template, data)
 
     def _base_desc(self):
-        return self.build_prompt(
-            "base_desc",
-            {
-                "name": self.name,
-                "age": self.config["age"],
-                "innate": self.config["innate"],
-                "learned": self.config["learned"],
-                "lifestyle": self.config["lifestyle"],
-                "daily_plan": self.config["daily_plan"],
-                "date": utils.get_timer().daily_format_cn(),
-                "currently": self.currently,
-            }
-        )
+        # base_desc only changes with the date, currently and the template itself
+        date = utils.get_timer().daily_format_cn()
+        key = (date, self.currently, self._templates.version("base_desc"))
+        if self._base_desc_cache[0] != key:
+            base_desc = self.build_prompt(
+                "base_desc",
+                {
+                    "name": self.name,
+                    "age": self.config["age"],
+                    "innate": self.config["innate"],
+                    "learned": self.config["learned"],
+                    "lifestyle": self.config["lifestyle"],
+                    "daily_plan": self.config["daily_plan"],
+                    "date": date,
+                    "currently": self.currently,
+                }
+            )
+            self._base_desc_cache = (key, base_desc)
+        return self._base_desc_cache[1]
 
     def prompt_poignancy_event(self, event):
         prompt = self.build_prompt(
@@ -61,7 +65,7 @@ class Scratch:
         return {
             "prompt": prompt,
             "callback": _callback,
-            "failsafe": random.choice(list(range(10))) + 1,
+            "failsafe": self.rng.choice(list(range(10))) + 1,
         }
 
     def prompt_poignancy_chat(self, event):
@@ -84,9 +88,40 @@ class Scratch:
         return {
             "prompt": prompt,
             "callback": _callback,
-            "failsafe": random.choice(list(range(10))) + 1,
+            "failsafe": self.rng.choice(list(range(10))) + 1,
         }
 
+    def prompt_poignancy_batch(self, items):
+        kinds = {"chat": "对话", "event": "事件"}
+        events = "\n".join(
+            "{}. {}：{}".format(idx + 1, kinds.get(e_type, "事件"), event.get_describe())
+            for idx, (e_type, event) in enumerate(items)
+        )
+        prompt = self.build_prompt(
+            "poignancy_batch",
+            {
+                "base_desc": self._base_desc(),
+                "agent": self.name,
+                "number": len(items),
+                "events": events,
+            }
+        )
+
+        def _callback(response):
+            pattern = [
+                "^(\d{1,2})[\.、:： ]+.*评分[:： ]+(\d{1,2})",
+                "^(\d{1,2})[\.、:： ]+(\d{1,2})$",
+            ]
+            outputs = parse_llm_output(response, pattern, mode="match_all")
+            scores = {}
+            for idx, score in outputs:
+                idx, score = int(idx) - 1, int(score)
+                if 0 <= idx < len(items) and 1 <= score <= 10:
+                    scores.setdefault(idx, score)
+            return scores
+
+        return {"prompt": prompt, "callback": _callback, "failsafe": {}, "retry": 2}
+
     def prompt_wake_up(self):
         prompt = self.build_prompt(
             "wake_up",
@@ -246,7 +281,7 @@ class Scratch:
             {
                 "base_desc": self._base_desc(),
                 "agent": self.name,
-                "daily_schedule": "；".join(daily_schedule),
+                "daily_schedule": "；".join(init_schedule),
                 "hourly_schedule": hourly_schedule,
             }
         )
@@ -414,7 +449,7 @@ class Scratch:
             arenas.update(
                 {a: sec for a in spatial.get_leaves(address + [sec]) if a not in arenas}
             )
-        failsafe = random.choice(sectors)
+        failsafe = self.rng.choice(sectors)
 
         def _callback(response):
             patterns = [
@@ -449,7 +484,7 @@ class Scratch:
         )
 
         arenas = spatial.get_leaves(address)
-        failsafe = random.choice(arenas)
+        failsafe = self.rng.choice(arenas)
 
         def _callback(response):
             patterns = [
@@ -474,7 +509,7 @@ class Scratch:
             }
         )
 
-        failsafe = random.choice(objects)
+        failsafe = self.rng.choice(objects)
 
         def _callback(response):
             # pattern = ["The most relevant object from the Objects is: <(.+?)>", "<(.+?)>"]
@@ -962,7 +997,7 @@ class Scratch:
         return {
             "prompt": prompt,
             "callback": _callback,
-            "failsafe": [r.describe for r in random.choices(nodes, k=5)],
+            "failsafe": [r.describe for r in self.rng.choices(nodes, k=5)],
         }
 
     def prompt_retrieve_thought(self, nodes):
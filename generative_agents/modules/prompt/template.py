@@ -0,0 +1,90 @@
+"""generative_agents.prompt.template"""
+
+import os
+import time
+import threading
+from string import Template
+
+
+class TemplateRegistry:
+    """Load and compile all the prompt templates of a folder once.
+
+    A template is reloaded only when the mtime of its file changes, the files
+    are checked at most once every check_interval seconds.
+    """
+
+    def __init__(self, folder, check_interval=1.0):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._templates = {}
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            if os.path.isdir(self.folder):
+                for file_name in sorted(os.listdir(self.folder)):
+                    if file_name.endswith(".txt"):
+                        self._load(file_name[:-4])
+            self._checked = time.monotonic()
+
+    def _load(self, name):
+        path = os.path.join(self.folder, name + ".txt")
+        mtime = os.path.getmtime(path)
+        cached = self._templates.get(name)
+        if cached and cached[0] == mtime:
+            return cached
+        with open(path, "r", encoding="utf-8") as f:
+            self._templates[name] = (mtime, Template(f.read()))
+        return self._templates[name]
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return
+        with self._lock:
+            for name in list(self._templates.keys()):
+                if os.path.exists(os.path.join(self.folder, name + ".txt")):
+                    self._load(name)
+                else:
+                    self._templates.pop(name)
+            self._checked = now
+
+    def get(self, name):
+        """Get the compiled template"""
+
+        self._refresh()
+        cached = self._templates.get(name)
+        if not cached:
+            with self._lock:
+                cached = self._load(name)
+        return cached[1]
+
+    def version(self, name):
+        """Get the version (mtime) of the template"""
+
+        self._refresh()
+        cached = self._templates.get(name)
+        return cached[0] if cached else None
+
+    def render(self, name, data):
+        return self.get(name).substitute(data)
+
+    @property
+    def names(self):
+        return list(self._templates.keys())
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_template_registry(folder="data/prompts"):
+    """Get the process-wide registry of templates in folder"""
+
+    folder = os.path.abspath(folder)
+    with _registries_lock:
+        if folder not in _registries:
+            _registries[folder] = TemplateRegistry(folder)
+        return _registries[folder]
@@ -0,0 +1,83 @@
+"""generative_agents.scheduler"""
+
+import time
+
+from modules import utils
+
+
+class WorldScheduler:
+    """Run the world subsystems once per tick, each at its own cadence.
+
+    A subsystem registered with cadence "step" runs on every tick, "hour" runs
+    on the first tick of every simulated hour and "day" on the first tick of
+    every simulated day. The wall time of every run is recorded per subsystem.
+    """
+
+    cadences = ("step", "hour", "day")
+
+    def __init__(self):
+        self._systems = {}
+        self.step = 0
+
+    def register(self, name, func, cadence="step"):
+        assert cadence in self.cadences, "Unexpected cadence {}, should be in {}".format(
+            cadence, self.cadences
+        )
+        self._systems[name] = {
+            "func": func,
+            "cadence": cadence,
+            "last": None,
+            "calls": 0,
+            "total": 0.0,
+            "max": 0.0,
+            "latest": 0.0,
+        }
+
+    def unregister(self, name):
+        return self._systems.pop(name, None)
+
+    def tick(self):
+        """Run the subsystems that are due, return names of the ran ones"""
+
+        self.step += 1
+        date = utils.get_timer().get_date()
+        keys = {
+            "step": self.step,
+            "hour": (date.year, date.month, date.day, date.hour),
+            "day": (date.year, date.month, date.day),
+        }
+        ran = []
+        for name, system in self._systems.items():
+            key = keys[system["cadence"]]
+            if system["last"] == key:
+                continue
+            system["last"] = key
+            start = time.perf_counter()
+            try:
+                system["func"]()
+            finally:
+                cost = time.perf_counter() - start
+                system["calls"] += 1
+                system["total"] += cost
+                system["latest"] = cost
+                system["max"] = max(system["max"], cost)
+            ran.append(name)
+        return ran
+
+    def get_summary(self):
+        des = {}
+        for name, system in self._systems.items():
+            calls = system["calls"]
+            des[name] = {
+                "cadence": system["cadence"],
+                "calls": calls,
+                "total_ms": round(system["total"] * 1000, 3),
+                "avg_ms": round(system["total"] * 1000 / calls, 3) if calls else 0.0,
+                "max_ms": round(system["max"] * 1000, 3),
+                "latest_ms": round(system["latest"] * 1000, 3),
+            }
+        return {"step": self.step, "systems": des}
+
+    @property
+    def systems(self):
+        return list(self._systems.keys())
@@ -0,0 +1,106 @@
+"""generative_agents.storage.ann"""
+
+import numpy as np
+
+
+class IVFIndex:
+    """Inverted file index (IVF-flat) over normalized vectors.
+
+    The vectors are clustered by spherical k-means and each vector is assigned
+    to the list of its nearest centroid. A query only scores the vectors in the
+    nprobe lists whose centroids are the most similar to it. The index keeps no
+    vectors itself, the owner stores the list of every vector, so inserts and
+    deletes only need assign.
+    """
+
+    def __init__(
+        self,
+        nlist=0,
+        nprobe=8,
+        min_nodes=4096,
+        iterations=8,
+        sample=20000,
+        retrain_growth=4,
+        seed=0,
+    ):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_nodes = min_nodes
+        self.iterations = iterations
+        self.sample = sample
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def lists_num(self, size):
+        return min(size, self.nlist or max(1, int(np.sqrt(size))))
+
+    def needs_training(self, size):
+        if size < self.min_nodes:
+            return False
+        return not self.trained or size > self.trained_size * self.retrain_growth
+
+    def train(self, vectors):
+        """Cluster vectors and return the list of every vector"""
+
+        rng = np.random.default_rng(self.seed)
+        size = len(vectors)
+        sample = vectors
+        if size > self.sample:
+            sample = vectors[np.sort(rng.choice(size, self.sample, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+        k = min(self.lists_num(size), len(sample))
+        centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+        for _ in range(self.iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.flatnonzero(np.bincount(assign, minlength=k) == 0)
+            # 空的簇重新随机选取中心
+            sums[empty] = sample[rng.choice(len(sample), len(empty))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.where(norms > 0, norms, 1)
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = size
+        return self.assign(vectors)
+
+    def assign(self, vectors, chunk=8192):
+        lists = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            scores = vectors[start : start + chunk] @ self.centroids.T
+            lists[start : start + chunk] = np.argmax(scores, axis=1)
+        return lists
+
+    def probe(self, queries, nprobe=None):
+        """Get the nprobe lists closest to each of the queries"""
+
+        scores = np.atleast_2d(queries) @ self.centroids.T
+        nprobe = min(nprobe or self.nprobe, scores.shape[1])
+        if nprobe == scores.shape[1]:
+            return np.arange(nprobe)
+        return np.unique(np.argpartition(-scores, nprobe - 1, axis=1)[:, :nprobe])
+
+    def reset(self):
+        self.centroids = None
+        self.trained_size = 0
+
+    def save(self, file):
+        np.savez(file, centroids=self.centroids, trained_size=self.trained_size)
+
+    def load(self, file):
+        with np.load(file) as data:
+            self.centroids = data["centroids"]
+            self.trained_size = int(data["trained_size"])
+
+    def get_summary(self):
+        return {
+            "trained": self.trained,
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "nprobe": self.nprobe,
+            "trained_size": self.trained_size,
+        }
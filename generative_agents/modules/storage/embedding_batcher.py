@@ -0,0 +1,158 @@
+"""generative_agents.storage.embedding_batcher"""
+
+import time
+import threading
+from concurrent.futures import Future
+
+import requests
+
+
+class EmbeddingBatcher:
+    """Merge the texts submitted by all the agents into batched requests.
+
+    A background worker flushes the queue as one multi-input request once it
+    holds max_batch texts, or once the oldest text waited for max_delay seconds.
+    When the queue only holds the texts of a single submitter (e.g. the serial
+    simulation), it is flushed at once instead of waiting for others.
+    Requests run one at a time, so a rate limited (429) provider that backs off
+    holds back the following batches as well. A batch failed by a rate limit,
+    a server or a transport error fails all its futures, since the model has
+    already backed off. A batch failed for another reason (e.g. a rejected
+    input) is retried one text at a time, so a bad text only fails its own
+    future.
+    """
+
+    def __init__(self, embed_model, max_batch=32, max_delay=0.01):
+        self._embed_model = embed_model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._submits = 0
+        self._stats = {"requests": 0, "texts": 0, "max_batch": 0, "errors": 0, "retried": 0}
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, text):
+        return self.submit_many([text])[0]
+
+    def submit_many(self, texts):
+        futures = [Future() for _ in texts]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("EmbeddingBatcher is closed")
+            now, self._submits = time.monotonic(), self._submits + 1
+            self._queue.extend((now, self._submits, t, f) for t, f in zip(texts, futures))
+            self._cond.notify()
+        return futures
+
+    def _take_batch(self):
+        with self._cond:
+            while True:
+                if self._queue:
+                    wait = self._queue[0][0] + self.max_delay - time.monotonic()
+                    # texts of one submission are contiguous in the queue
+                    alone = self._queue[0][1] == self._queue[-1][1]
+                    if len(self._queue) >= self.max_batch or wait <= 0 or alone or self._closed:
+                        batch = self._queue[: self.max_batch]
+                        self._queue = self._queue[self.max_batch :]
+                        return batch
+                    self._cond.wait(wait)
+                elif self._closed:
+                    return None
+                else:
+                    self._cond.wait()
+
+    def _embed(self, texts):
+        self._stats["requests"] += 1
+        vecs = self._embed_model._get_text_embeddings(texts)
+        assert len(vecs) == len(texts), "Got {} embeddings for {} texts".format(
+            len(vecs), len(texts)
+        )
+        return vecs
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            texts = [t for _, _, t, _ in batch]
+            self._stats["texts"] += len(texts)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(texts))
+            try:
+                vecs = self._embed(texts)
+            except Exception as e:
+                self._stats["errors"] += 1
+                if len(batch) == 1 or _is_transient(e):
+                    for _, _, _, future in batch:
+                        future.set_exception(e)
+                    continue
+                self._retry(batch)
+                continue
+            for (_, _, _, future), vec in zip(batch, vecs):
+                future.set_result(vec)
+
+    def _retry(self, batch):
+        """Embed the texts of a failed batch one at a time"""
+
+        # 逐条重试，只有失败的文本所属的请求会失败；遇到限流或服务故障时不再逐条请求
+        for i, (_, _, text, future) in enumerate(batch):
+            self._stats["retried"] += 1
+            try:
+                future.set_result(self._embed([text])[0])
+            except Exception as e:
+                self._stats["errors"] += 1
+                future.set_exception(e)
+                if _is_transient(e):
+                    for _, _, _, rest in batch[i + 1 :]:
+                        rest.set_exception(e)
+                    return
+
+    def get_summary(self):
+        requests = self._stats["requests"]
+        return {
+            **self._stats,
+            "avg_batch": round(self._stats["texts"] / requests, 2) if requests else 0.0,
+            "pending": len(self._queue),
+        }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+
+def _is_transient(error):
+    """Rate limits, server and transport errors, which fail every text alike"""
+
+    if not isinstance(error, requests.exceptions.RequestException):
+        return False
+    response = error.response
+    return response is None or response.status_code == 429 or response.status_code >= 500
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_embedding_batcher(key, embed_model, config=None):
+    """Get the batcher shared by all the embed models of key"""
+
+    config = config or {}
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = EmbeddingBatcher(
+                embed_model,
+                max_batch=config.get("max_batch", 32),
+                max_delay=config.get("max_delay", 0.01),
+            )
+        return _batchers[key]
+
+
+def get_embedding_batchers():
+    with _batchers_lock:
+        return dict(_batchers)
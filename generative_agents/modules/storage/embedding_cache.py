@@ -0,0 +1,119 @@
+"""generative_agents.storage.embedding_cache"""
+
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content addressed embedding cache shared by all the agents.
+
+    Vectors are kept in an in-memory LRU, in front of an optional sqlite store
+    so that they survive restarts and are shared between processes.
+    """
+
+    def __init__(self, path=None, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        self._conn = None
+        if path:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB)"
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(provider, model, text):
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return "{}:{}:{}".format(provider, model, text_hash)
+
+    def get(self, key):
+        with self._lock:
+            vec = self._memory.get(key)
+            if vec is not None:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                return vec
+            if self._conn:
+                row = self._conn.execute(
+                    "SELECT vector FROM vectors WHERE key=?", (key,)
+                ).fetchone()
+                if row is not None:
+                    vec = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vec)
+                    self._stats["disk_hits"] += 1
+                    return vec
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key, vec):
+        vec = np.asarray(vec, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vec)
+            if self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO vectors VALUES (?, ?)", (key, vec.tobytes())
+                )
+                self._conn.commit()
+
+    def _remember(self, key, vec):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn:
+                self._conn.execute("DELETE FROM vectors")
+                self._conn.commit()
+
+    def get_summary(self):
+        with self._lock:
+            hits = self._stats["hits"] + self._stats["disk_hits"]
+            total = hits + self._stats["misses"]
+            return {
+                "path": self.path,
+                "entries": len(self._memory),
+                **self._stats,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(config=None):
+    """Get the shared cache for config, an in-memory cache if no path is set"""
+
+    config = config or {}
+    path = os.path.abspath(config["path"]) if config.get("path") else None
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = EmbeddingCache(path, config.get("max_entries", 20000))
+        return _caches[path]
+
+
+def get_embedding_caches():
+    with _caches_lock:
+        return list(_caches.values())
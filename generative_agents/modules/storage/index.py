@@ -1,51 +1,163 @@
 """generative_agents.storage.index"""
 
 import os
+import json
 import time
+import zlib
+import heapq
+import asyncio
 import requests
-# Temporarily commented out due to import issues
-# from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-# from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
-# from llama_index.core.schema import TextNode
-# from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
-# from llama_index.core.node_parser import SentenceSplitter
-# from llama_index.core import Settings
-# from llama_index.core.embeddings import BaseEmbedding
+import numpy as np
 
 from modules import utils
+from .embedding_cache import get_embedding_cache
+from .embedding_batcher import get_embedding_batcher
+from .ann import IVFIndex
 
-# Temporary placeholder classes
-class HuggingFaceEmbedding:
-    pass
-
-class VectorIndexRetriever:
-    pass
 
 class TextNode:
-    pass
+    """A text with metadata stored in the index"""
+
+    def __init__(self, text, id_, metadata=None, **kwargs):
+        self.text = text
+        self.id_ = id_
+        self.metadata = metadata or {}
+
+    def to_dict(self):
+        return {"text": self.text, "metadata": self.metadata}
+
+
+class NodeWithScore:
+    """A retrieved node and its similarity score"""
+
+    def __init__(self, node, score):
+        self.node = node
+        self.score = score
+
+    @property
+    def id_(self):
+        return self.node.id_
+
+    @property
+    def text(self):
+        return self.node.text
+
+    @property
+    def metadata(self):
+        return self.node.metadata
+
 
-class VectorStoreIndex:
-    pass
+class ExactMatchFilter:
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
 
-class StorageContext:
-    pass
 
-def load_index_from_storage(*args, **kwargs):
-    pass
+class MetadataFilters:
+    def __init__(self, filters, condition="and"):
+        assert condition in ("and", "or"), "Unexpected condition " + str(condition)
+        self.filters = filters
+        self.condition = condition
 
-class SentenceSplitter:
-    pass
 
-class Settings:
-    pass
+class BaseRetriever:
+    def retrieve(self, query):
+        return self._retrieve(query)
+
+    def _retrieve(self, query):
+        raise NotImplementedError(
+            "_retrieve is not support for " + str(self.__class__)
+        )
+
+
+class VectorIndexRetriever(BaseRetriever):
+    def __init__(self, index, similarity_top_k=5, filters=None, node_ids=None):
+        self._index = index
+        self._similarity_top_k = similarity_top_k
+        self._filters = filters
+        self._node_ids = node_ids
+
+    def _retrieve(self, query):
+        return self._index.search(
+            query, self._similarity_top_k, filters=self._filters, node_ids=self._node_ids
+        )
+
 
 class BaseEmbedding:
-    pass
+    """Base class of the embedding models"""
+
+    def __init__(self):
+        pass
+
+    def get_text_embedding(self, text):
+        return self._get_text_embedding(text)
+
+    def get_text_embeddings(self, texts):
+        return self._get_text_embeddings(texts)
+
+    def get_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def _get_query_embedding(self, query):
+        return self._get_text_embedding(query)
+
+    def _get_text_embedding(self, text):
+        raise NotImplementedError(
+            "_get_text_embedding is not support for " + str(self.__class__)
+        )
+
+    def _get_text_embeddings(self, texts):
+        return [self._get_text_embedding(t) for t in texts]
+
+
+class HuggingFaceEmbedding(BaseEmbedding):
+    """Local sentence-transformers model, loaded on the first use"""
+
+    def __init__(self, model_name="sentence-transformers/all-MiniLM-L6-v2"):
+        super().__init__()
+        self._model_name = model_name
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self._model = SentenceTransformer(self._model_name)
+        return self._model
+
+    def _get_text_embedding(self, text):
+        return self._load().encode(text, normalize_embeddings=True).tolist()
+
+    def _get_text_embeddings(self, texts):
+        return self._load().encode(list(texts), normalize_embeddings=True).tolist()
+
+
+class HashEmbedding(BaseEmbedding):
+    """Offline embedding of hashed character uni-grams and bi-grams.
+
+    It needs no model or network and is deterministic, which makes it suitable
+    for tests and benchmarks, the similarity is purely lexical.
+    """
+
+    def __init__(self, dim=384):
+        super().__init__()
+        self._dim = dim
+
+    def _get_text_embedding(self, text):
+        vec = np.zeros(self._dim, dtype=np.float32)
+        grams = list(text) + [text[i : i + 2] for i in range(len(text) - 1)]
+        for gram in grams:
+            code = zlib.crc32(gram.encode("utf-8"))
+            vec[code % self._dim] += 1.0 if code & 0x80000000 else -1.0
+        return vec.tolist()
 
 
 class GLMEmbedding(BaseEmbedding):
     """GLM Embedding implementation"""
-    
+
+    max_inputs = 64  # 单次请求最多的文本数
+    retry_delay = 1  # 限流和请求异常时的基础退避时间（秒）
+
     def __init__(self, model_name="embedding-3", base_url="https://open.bigmodel.cn/api/paas/v4", api_key=""):
         super().__init__()
         self._model_name = model_name
@@ -58,13 +170,27 @@ class GLMEmbedding(BaseEmbedding):
     
     async def _aget_query_embedding(self, query: str):
         """Get embedding for a single query (async version)"""
-        return self._get_text_embedding(query)
+        return await self._aget_text_embedding(query)
     
     def _get_text_embedding(self, text: str):
         """Get embedding for a single text with retry mechanism"""
+        return self._request([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        """Get embeddings for multiple texts, one request per max_inputs texts"""
+        embeddings = []
+        for start in range(0, len(texts), self.max_inputs):
+            embeddings.extend(self._request(texts[start : start + self.max_inputs]))
+        return embeddings
+
+    def _request(self, texts):
+        """Embed texts in one request, back off and retry on rate limit.
+
+        Failures raise requests exceptions: HTTPError carries the response,
+        so callers can tell rate limits and server errors from bad inputs.
+        """
         max_retries = 3
-        base_delay = 1  # 基础延迟时间（秒）
-        
+
         for attempt in range(max_retries + 1):
             try:
                 response = requests.post(
@@ -75,54 +201,65 @@ class GLMEmbedding(BaseEmbedding):
                     },
                     json={
                         "model": self._model_name,
-                        "input": text
+                        "input": texts[0] if len(texts) == 1 else list(texts)
                     },
                     timeout=30
                 )
-                
-                if response.ok:
-                    result = response.json()
-                    if result and 'data' in result and len(result['data']) > 0:
-                        return result['data'][0]['embedding']
-                
-                # 如果是 429 错误且还有重试次数，则等待后重试
-                if response.status_code == 429 and attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)  # 指数退避
-                    print(f"GLM API 速率限制，等待 {delay} 秒后重试 (尝试 {attempt + 1}/{max_retries + 1})")
-                    time.sleep(delay)
-                    continue
-                
-                # 其他错误或最后一次尝试失败
-                raise Exception(f"GLM Embedding API 失败: HTTP {response.status_code}")
-                
             except requests.exceptions.RequestException as e:
                 if attempt < max_retries:
-                    delay = base_delay * (2 ** attempt)
+                    delay = self.retry_delay * (2 ** attempt)
                     print(f"GLM API 请求异常，等待 {delay} 秒后重试: {e}")
                     time.sleep(delay)
                     continue
-                else:
-                    raise Exception(f"GLM Embedding API 请求失败: {e}")
-        
-        raise Exception("GLM Embedding API 重试次数已用完")
-    
-    def _get_text_embeddings(self, texts):
-        """Get embeddings for multiple texts"""
-        embeddings = []
-        for text in texts:
-            embeddings.append(self._get_text_embedding(text))
-        return embeddings
-    
+                raise requests.exceptions.RequestException(f"GLM Embedding API 请求失败: {e}") from e
+
+            if response.ok:
+                result = response.json()
+                if result and len(result.get('data', [])) == len(texts):
+                    data = sorted(result['data'], key=lambda d: d.get('index', 0))
+                    return [d['embedding'] for d in data]
+
+            # 如果是 429 错误且还有重试次数，则等待后重试
+            if response.status_code == 429 and attempt < max_retries:
+                delay = self.retry_delay * (2 ** attempt)  # 指数退避
+                print(f"GLM API 速率限制，等待 {delay} 秒后重试 (尝试 {attempt + 1}/{max_retries + 1})")
+                time.sleep(delay)
+                continue
+
+            # 其他错误或最后一次尝试失败
+            raise requests.exceptions.HTTPError(
+                f"GLM Embedding API 失败: HTTP {response.status_code}", response=response
+            )
+
     async def _aget_text_embedding(self, text: str):
         """Get embedding for a single text (async version)"""
-        return self._get_text_embedding(text)
+        return await asyncio.to_thread(self._get_text_embedding, text)
     
     async def _aget_text_embeddings(self, texts):
         """Get embeddings for multiple texts (async version)"""
-        embeddings = []
-        for text in texts:
-            embeddings.append(self._get_text_embedding(text))
-        return embeddings
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+
+class BatchedEmbedding(BaseEmbedding):
+    """Send the texts through the shared micro-batcher of the model"""
+
+    def __init__(self, batcher):
+        super().__init__()
+        self._batcher = batcher
+
+    def _get_text_embedding(self, text):
+        return self._batcher.submit(text).result()
+
+    def _get_text_embeddings(self, texts):
+        return [f.result() for f in self._batcher.submit_many(texts)]
+
+    async def _aget_text_embedding(self, text):
+        return await asyncio.wrap_future(self._batcher.submit(text))
+
+    async def _aget_text_embeddings(self, texts):
+        return await asyncio.gather(
+            *[asyncio.wrap_future(f) for f in self._batcher.submit_many(texts)]
+        )
 
 
 class FallbackEmbedding(BaseEmbedding):
@@ -154,58 +291,316 @@ class FallbackEmbedding(BaseEmbedding):
     
     def _get_text_embeddings(self, texts):
         """Get embeddings for multiple texts"""
-        embeddings = []
-        for text in texts:
-            embeddings.append(self._get_text_embedding(text))
-        return embeddings
+        if not self.fallback_active:
+            try:
+                return self.primary_embedding._get_text_embeddings(texts)
+            except Exception as e:
+                print(f"主要 embedding 失败，切换到降级模式: {e}")
+                self.fallback_active = True
+        return self.fallback_embedding._get_text_embeddings(texts)
     
     async def _aget_text_embedding(self, text: str):
         """Get embedding for a single text (async version)"""
-        return self._get_text_embedding(text)
+        return await asyncio.to_thread(self._get_text_embedding, text)
     
     async def _aget_text_embeddings(self, texts):
         """Get embeddings for multiple texts (async version)"""
-        embeddings = []
-        for text in texts:
-            embeddings.append(self._get_text_embedding(text))
-        return embeddings
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
 
 
-class LlamaIndex:
-    def __init__(self, embedding_config, path=None):
-        self._config = {"max_nodes": 0}
-        
-        # 创建降级 embedding（HuggingFace 作为备用）
-        fallback_embedding = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        
-        if embedding_config["provider"] == "hugging_face":
-            embed_model = HuggingFaceEmbedding(model_name=embedding_config["model"])
-        elif embedding_config["provider"] == "glm":
-            primary_embedding = GLMEmbedding(
-                model_name=embedding_config["model"],
-                base_url=embedding_config["base_url"],
-                api_key=embedding_config["api_key"],
+class CachedEmbedding(BaseEmbedding):
+    """Serve the embeddings of a model from the shared embedding cache"""
+
+    def __init__(self, embed_model, provider, model_name, cache):
+        super().__init__()
+        self._embed_model = embed_model
+        self._provider = provider
+        self._model_name = model_name
+        self._cache = cache
+
+    def _key(self, text):
+        return self._cache.make_key(self._provider, self._model_name, text)
+
+    def _get_text_embedding(self, text):
+        key = self._key(text)
+        vec = self._cache.get(key)
+        if vec is None:
+            vec = self._embed_model._get_text_embedding(text)
+            self._cache.put(key, vec)
+        return vec
+
+    def _get_text_embeddings(self, texts):
+        keys = [self._key(t) for t in texts]
+        vecs = [self._cache.get(k) for k in keys]
+        missing = [i for i, v in enumerate(vecs) if v is None]
+        if missing:
+            computed = self._embed_model._get_text_embeddings([texts[i] for i in missing])
+            for i, vec in zip(missing, computed):
+                self._cache.put(keys[i], vec)
+                vecs[i] = vec
+        return vecs
+
+
+def create_embedding(embedding_config):
+    """Create embedding model"""
+
+    cache = get_embedding_cache(embedding_config.get("cache"))
+    if embedding_config["provider"] == "hugging_face":
+        embed_model = HuggingFaceEmbedding(model_name=embedding_config["model"])
+        if embedding_config.get("batch"):
+            batcher = get_embedding_batcher(
+                ("hugging_face", embedding_config["model"]), embed_model, embedding_config["batch"]
             )
-            # 使用带有降级策略的 embedding
-            embed_model = FallbackEmbedding(primary_embedding, fallback_embedding)
-        else:
-            raise NotImplementedError(
-                "embedding provider {} is not supported. Only 'hugging_face' and 'glm' are supported.".format(embedding_config["provider"])
+            embed_model = BatchedEmbedding(batcher)
+        return CachedEmbedding(embed_model, "hugging_face", embedding_config["model"], cache)
+    if embedding_config["provider"] == "glm":
+        primary_embedding = GLMEmbedding(
+            model_name=embedding_config["model"],
+            base_url=embedding_config["base_url"],
+            api_key=embedding_config["api_key"],
+        )
+        # 所有Agent共享一个批处理队列，把多个文本合并为一次请求
+        batch_config = embedding_config.get("batch", {})
+        if batch_config is not False:
+            batcher = get_embedding_batcher(
+                ("glm", embedding_config["base_url"], embedding_config["model"]),
+                primary_embedding,
+                batch_config,
             )
+            primary_embedding = BatchedEmbedding(batcher)
+        # 使用带有降级策略的 embedding（HuggingFace 作为备用）
+        fallback_model = "sentence-transformers/all-MiniLM-L6-v2"
+        fallback_embedding = HuggingFaceEmbedding(model_name=fallback_model)
+        # 主要与降级 embedding 分别缓存，保证缓存的向量与实际模型一致
+        return FallbackEmbedding(
+            CachedEmbedding(primary_embedding, "glm", embedding_config["model"], cache),
+            CachedEmbedding(fallback_embedding, "hugging_face", fallback_model, cache),
+        )
+    if embedding_config["provider"] == "hash":
+        dim = embedding_config.get("dim", 384)
+        return CachedEmbedding(HashEmbedding(dim=dim), "hash", str(dim), cache)
+    raise NotImplementedError(
+        "embedding provider {} is not supported. Only 'hugging_face', 'glm' and 'hash' are supported.".format(embedding_config["provider"])
+    )
+
+
+class LlamaIndex:
+    """Vector index of the memory nodes of one agent.
+
+    Embeddings are normalized and kept in a contiguous float32 matrix, one row
+    per node, so a retrieval is a single matrix-vector product followed by a
+    masked top-k selection. Removed rows are filled with the last row.
+    The node_type code, poignancy and dates (as epoch seconds) of the nodes are
+    kept as numeric columns aligned with the rows. Nodes are also kept in a
+    min-heap of expire and a max-heap of create, so cleanup only pops the due
+    ones, removed nodes are dropped from the heaps lazily.
 
-        Settings.embed_model = embed_model
-        Settings.node_parser = SentenceSplitter(chunk_size=512, chunk_overlap=64)
-        Settings.num_output = 1024
-        Settings.context_window = 4096
+    On disk the index is a snapshot (nodes.json, embeddings.npy, columns.npz)
+    followed by an append-only log: nodes.log holds one json op per line and
+    embeddings.log the raw rows of the added nodes. save only appends
+    the ops since the last save, the snapshot is rewritten once the log grows
+    past the number of nodes. Both embedding files are read with np.memmap.
+    The rows of embeddings.npy stay mapped (copy on write) as the base of the
+    matrix, the rows added after it are kept in an in-memory tail; the two are
+    merged into the next snapshot, which becomes the new base.
+
+    With ann set, candidate sets of at least ann["min_nodes"] nodes are
+    searched through an IVFIndex, the list of every row is kept as a column.
+
+    The embeddings are stored as dtype: float32, float16 or int8 with a scale
+    per row. They are dequantized block by block while scoring.
+    """
+
+    columns = {
+        "node_type": np.int32,
+        "poignancy": np.float32,
+        "create": np.float64,
+        "expire": np.float64,
+        "access": np.float64,
+        "ann_list": np.int32,
+        "scale": np.float32,
+    }
+    dtypes = ("float32", "float16", "int8")
+    compact_min = 1024
+    score_block = 4096
+
+    def __init__(self, embedding_config, path=None, ann=None, dtype="float32"):
+        assert dtype in self.dtypes, "dtype should be one of " + ", ".join(self.dtypes)
+        self._config = {"max_nodes": 0}
+        self._embed_model = create_embedding(embedding_config)
+        self._ann = IVFIndex(**ann) if ann is not None else None
+        self._dtype = np.dtype(dtype)
+        self._nodes = {}
+        self._row_ids = []
+        self._rows = {}
+        # rows below len(self._base) live in the mapped snapshot, the others in
+        # self._matrix, the in-memory tail
+        self._base = None
+        self._matrix = None
+        self._columns = {k: np.zeros(0, dtype=t) for k, t in self.columns.items()}
+        self._type_codes = {}
+        self._expire_heap, self._create_heap = [], []
+        # ops since the last save, and the size of the log on disk
+        self._pending = []
+        self._log_lines, self._log_rows = 0, 0
+        self._needs_snapshot = False
         if path and os.path.exists(path):
-            self._index = load_index_from_storage(
-                StorageContext.from_defaults(persist_dir=path),
-                show_progress=True,
+            self._load(path)
+        self._path = path
+
+    def _embed(self, text):
+        vec = np.asarray(self._embed_model.get_text_embedding(text), dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _type_code(self, node_type):
+        if node_type not in self._type_codes:
+            self._type_codes[node_type] = len(self._type_codes) + 1
+        return self._type_codes[node_type]
+
+    @property
+    def _dim(self):
+        matrix = self._base if self._base is not None else self._matrix
+        return None if matrix is None else matrix.shape[1]
+
+    @property
+    def _base_rows(self):
+        return 0 if self._base is None else len(self._base)
+
+    def _reserve(self, dim, count=1):
+        size = len(self._row_ids)
+        if self._dim is None:
+            capacity = max(16, count)
+            self._matrix = np.zeros((capacity, dim), dtype=self._dtype)
+            self._columns = {k: np.zeros(capacity, dtype=t) for k, t in self.columns.items()}
+        elif self._dim != dim:
+            raise ValueError(
+                "embedding dim {} does not match the index dim {}".format(dim, self._dim)
             )
-            self._config = utils.load_dict(os.path.join(path, "index_config.json"))
+        tail = max(size - self._base_rows, 0)
+        if size + count > self._base_rows + len(self._matrix):
+            capacity = max(16, len(self._matrix) * 2, size + count - self._base_rows)
+            matrix = np.zeros((capacity, dim), dtype=self._dtype)
+            matrix[:tail] = self._matrix[:tail]
+            self._matrix = matrix
+        if size + count > len(self._columns["scale"]):
+            capacity = max(16, len(self._columns["scale"]) * 2, size + count)
+            for key, column in self._columns.items():
+                self._columns[key] = np.zeros(capacity, dtype=column.dtype)
+                self._columns[key][:size] = column[:size]
+
+    def _row(self, row):
+        base = self._base_rows
+        return self._base[row] if row < base else self._matrix[row - base]
+
+    def _set_row(self, row, stored):
+        base = self._base_rows
+        if row < base:
+            self._base[row] = stored
         else:
-            self._index = VectorStoreIndex([], show_progress=True)
-        self._path = path
+            self._matrix[row - base] = stored
+
+    def _segments(self, rows):
+        """Split rows into the parts kept in the base and in the tail.
+
+        rows is a slice from 0 or an array of rows. Return a list of
+        (positions, matrix, local rows); a slice is split into slices, so the
+        mapped base is read in place.
+        """
+
+        base = self._base_rows
+        if isinstance(rows, slice):
+            split = min(rows.stop, base)
+            parts = [
+                (slice(0, split), self._base, slice(0, split)),
+                (slice(split, rows.stop), self._matrix, slice(0, rows.stop - split)),
+            ]
+            return [p for p in parts if p[0].stop > p[0].start]
+        rows = np.asarray(rows)
+        in_base = rows < base
+        parts = [
+            (in_base, self._base, rows[in_base]),
+            (~in_base, self._matrix, rows[~in_base] - base),
+        ]
+        return [p for p in parts if len(p[2])]
+
+    def _set_columns(self, row, metadata):
+        self._columns["node_type"][row] = self._type_code(metadata.get("node_type"))
+        self._columns["poignancy"][row] = metadata.get("poignancy", 0)
+        for key in ("create", "expire", "access"):
+            self._columns[key][row] = utils.to_epoch(metadata.get(key))
+
+    def _quantize(self, vectors):
+        """Convert float32 vectors to the storage dtype, return (stored, scales)"""
+
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._dtype == np.int8:
+            scales = np.abs(vectors).max(axis=-1) / 127
+            scales = np.where(scales > 0, scales, 1).astype(np.float32)
+            stored = np.rint(vectors / scales[..., None]).astype(np.int8)
+            return stored, scales
+        return vectors.astype(self._dtype), np.ones(vectors.shape[:-1], dtype=np.float32)
+
+    @staticmethod
+    def _dequantize(stored, scales):
+        vectors = np.asarray(stored, dtype=np.float32)
+        if stored.dtype == np.int8:
+            vectors = vectors * scales[..., None]
+        return vectors
+
+    def get_vectors(self, rows=None):
+        """Get the float32 embeddings of rows, all the rows by default"""
+
+        if self._dim is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        if rows is None:
+            rows = slice(0, len(self._row_ids))
+        scales = self._columns["scale"][rows]
+        vectors = np.empty((len(scales), self._dim), dtype=np.float32)
+        for pos, matrix, local in self._segments(rows):
+            vectors[pos] = self._dequantize(matrix[local], scales[pos])
+        return vectors
+
+    def _scores(self, queries, rows):
+        """Similarity of the normalized queries to the nodes at rows"""
+
+        size = len(rows)
+        if size == len(self._row_ids):
+            # 候选为全部节点时按切片读取，避免复制整个矩阵
+            rows = slice(0, size)
+        scores = np.empty(queries.shape[:-1] + (size,), dtype=np.float32)
+        for pos, matrix, local in self._segments(rows):
+            if self._dtype == np.float32:
+                scores[..., pos] = queries @ matrix[local].T
+                continue
+            positions = np.arange(size)[pos]
+            if isinstance(local, slice):
+                local = range(local.start, local.stop)
+            for start in range(0, len(local), self.score_block):
+                block = local[start : start + self.score_block]
+                if isinstance(block, range):
+                    block = slice(block.start, block.stop)
+                vectors = matrix[block].astype(np.float32)
+                scores[..., positions[start : start + len(vectors)]] = queries @ vectors.T
+        if self._dtype == np.int8:
+            scores *= self._columns["scale"][rows]
+        return scores
+
+    def _insert(self, node, vec):
+        self._reserve(vec.shape[0])
+        row = len(self._row_ids)
+        stored, self._columns["scale"][row] = self._quantize(vec)
+        self._set_row(row, stored)
+        self._set_columns(row, node.metadata)
+        if self._ann and self._ann.trained:
+            self._columns["ann_list"][row] = self._ann.assign(vec[None])[0]
+        self._row_ids.append(node.id_)
+        self._rows[node.id_] = row
+        self._nodes[node.id_] = node
+        if "expire" in node.metadata:
+            heapq.heappush(self._expire_heap, (self._columns["expire"][row], node.id_))
+        if "create" in node.metadata:
+            heapq.heappush(self._create_heap, (-self._columns["create"][row], node.id_))
 
     def add_node(
         self,
@@ -215,31 +610,51 @@ class LlamaIndex:
         exclude_embedding_keys=None,
         id=None,
     ):
+        metadata = metadata or {}
+        id = id or "node_" + str(self._config["max_nodes"])
+        self._config["max_nodes"] += 1
         while True:
             try:
-                metadata = metadata or {}
-                exclude_llm_keys = exclude_llm_keys or list(metadata.keys())
-                exclude_embedding_keys = exclude_embedding_keys or list(metadata.keys())
-                id = id or "node_" + str(self._config["max_nodes"])
-                self._config["max_nodes"] += 1
-                node = TextNode(
-                    text=text,
-                    id_=id,
-                    metadata=metadata,
-                    excluded_llm_metadata_keys=exclude_llm_keys,
-                    excluded_embed_metadata_keys=exclude_embedding_keys,
-                )
-                self._index.insert_nodes([node])
-                return node
+                vec = self._embed(text)
+                break
             except Exception as e:
                 print(f"LlamaIndex.add_node() caused an error: {e}")
                 time.sleep(5)
+        if self._dim is not None and self._dim != vec.shape[0]:
+            self._reindex()
+        node = TextNode(text=text, id_=id, metadata=metadata)
+        self._insert(node, vec)
+        self._pending.append(("add", id))
+        return node
+
+    def _reindex(self):
+        """Embed all the nodes again, used when the embedding model changed"""
+
+        nodes = [self._nodes[i] for i in self._row_ids]
+        self._nodes, self._row_ids, self._rows = {}, [], {}
+        self._base, self._matrix = None, None
+        if self._ann:
+            self._ann.reset()
+        for node in nodes:
+            self._insert(node, self._embed(node.text))
+        self._needs_snapshot = True
+
+    def prefetch(self, texts):
+        """Embed texts in one batch ahead of add_node/retrieve, the vectors are cached"""
+
+        texts = list(dict.fromkeys(t for t in texts if t))
+        if len(texts) < 2:
+            return
+        try:
+            self._embed_model.get_text_embeddings(texts)
+        except Exception as e:
+            print(f"LlamaIndex.prefetch() caused an error: {e}")
 
     def has_node(self, node_id):
-        return node_id in self._index.docstore.docs
+        return node_id in self._nodes
 
     def find_node(self, node_id):
-        return self._index.docstore.docs[node_id]
+        return self._nodes[node_id]
 
     def get_nodes(self, filter=None):
         def _check(node):
@@ -247,21 +662,178 @@ class LlamaIndex:
                 return True
             return filter(node)
 
-        return [n for n in self._index.docstore.docs.values() if _check(n)]
+        return [n for n in self._nodes.values() if _check(n)]
 
     def remove_nodes(self, node_ids, delete_from_docstore=True):
-        self._index.delete_nodes(node_ids, delete_from_docstore=delete_from_docstore)
+        removed = [i for i in node_ids if self._remove(i)]
+        if removed:
+            self._pending.append(("remove", removed))
+
+    def _remove(self, node_id):
+        row = self._rows.pop(node_id, None)
+        if row is None:
+            return False
+        self._nodes.pop(node_id)
+        last = len(self._row_ids) - 1
+        if row != last:
+            moved = self._row_ids[last]
+            self._set_row(row, self._row(last))
+            for column in self._columns.values():
+                column[row] = column[last]
+            self._row_ids[row] = moved
+            self._rows[moved] = row
+        self._row_ids.pop()
+        return True
 
     def cleanup(self):
-        now, remove_ids = utils.get_timer().get_date(), []
-        for node_id, node in self._index.docstore.docs.items():
-            create = utils.to_date(node.metadata["create"])
-            expire = utils.to_date(node.metadata["expire"])
-            if create > now or expire < now:
-                remove_ids.append(node_id)
+        """Remove the expired and the future-dated nodes, return their ids"""
+
+        now, remove_ids = utils.to_epoch(utils.get_timer().get_date()), {}
+        while self._expire_heap and self._expire_heap[0][0] < now:
+            _, node_id = heapq.heappop(self._expire_heap)
+            if node_id in self._rows:
+                remove_ids[node_id] = True
+        while self._create_heap and -self._create_heap[0][0] > now:
+            _, node_id = heapq.heappop(self._create_heap)
+            if node_id in self._rows:
+                remove_ids[node_id] = True
+        remove_ids = list(remove_ids.keys())
         self.remove_nodes(remove_ids)
+        self._compact_heaps()
         return remove_ids
 
+    def _compact_heaps(self):
+        # 惰性删除的条目过多时重建堆
+        size = len(self._row_ids)
+        if len(self._expire_heap) + len(self._create_heap) <= 4 * size + 64:
+            return
+        self._expire_heap = [
+            (self._columns["expire"][self._rows[i]], i)
+            for _, i in self._expire_heap
+            if i in self._rows
+        ]
+        self._create_heap = [
+            (-self._columns["create"][self._rows[i]], i)
+            for _, i in self._create_heap
+            if i in self._rows
+        ]
+        heapq.heapify(self._expire_heap)
+        heapq.heapify(self._create_heap)
+
+    def _filter_mask(self, filters, size):
+        masks = []
+        for f in filters.filters:
+            if f.key == "node_type":
+                code = self._type_codes.get(f.value, -1)
+                masks.append(self._columns["node_type"][:size] == code)
+            else:
+                masks.append(
+                    np.fromiter(
+                        (self._nodes[i].metadata.get(f.key) == f.value for i in self._row_ids),
+                        dtype=bool,
+                        count=size,
+                    )
+                )
+        if not masks:
+            return np.ones(size, dtype=bool)
+        if filters.condition == "or":
+            return np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    def _candidates(self, filters=None, node_ids=None, queries=None):
+        size = len(self._row_ids)
+        mask = None
+        if filters:
+            mask = self._filter_mask(filters, size)
+        if node_ids is not None:
+            rows = [self._rows[i] for i in node_ids if i in self._rows]
+            id_mask = np.zeros(size, dtype=bool)
+            id_mask[rows] = True
+            mask = id_mask if mask is None else mask & id_mask
+        rows = np.flatnonzero(mask) if mask is not None else np.arange(size)
+        if queries is not None and self._ann and len(rows) >= self._ann.min_nodes:
+            rows = rows[self._probe(queries)[self._columns["ann_list"][rows]]]
+        return rows
+
+    def _probe(self, queries):
+        """Get the mask of the ann lists probed by queries"""
+
+        size = len(self._row_ids)
+        if self._ann.needs_training(size):
+            self._columns["ann_list"][:size] = self._ann.train(self.get_vectors())
+        probed = np.zeros(len(self._ann.centroids), dtype=bool)
+        probed[self._ann.probe(queries)] = True
+        return probed
+
+    def similarity(self, texts, filters=None, node_ids=None):
+        """Embed texts in one batch and score them against the candidate nodes.
+
+        Return (rows, scores), scores[i, j] is the similarity of texts[i] to the
+        node at rows[j]. With an ann index, the candidates of large sets are the
+        nodes in the lists probed by any of texts.
+        """
+
+        if not self._row_ids or not texts:
+            rows = np.zeros(0, dtype=np.int64)
+            return rows, np.zeros((len(texts), 0), dtype=np.float32)
+        queries = np.asarray(self._embed_model.get_text_embeddings(list(texts)), dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+        rows = self._candidates(filters, node_ids, queries)
+        return rows, self._scores(queries, rows)
+
+    def search(self, text, similarity_top_k=5, filters=None, node_ids=None):
+        """Find the top k nodes most similar to text"""
+
+        if not self._row_ids or similarity_top_k <= 0:
+            return []
+        return self.search_vector(self._embed(text), similarity_top_k, filters, node_ids)
+
+    def search_vector(self, vec, similarity_top_k=5, filters=None, node_ids=None):
+        """Find the top k nodes most similar to the normalized vec"""
+
+        if not self._row_ids or similarity_top_k <= 0:
+            return []
+        vec = np.asarray(vec, dtype=np.float32)
+        candidates = self._candidates(filters, node_ids, vec)
+        if not len(candidates):
+            return []
+        scores = self._scores(vec, candidates)
+        k = min(similarity_top_k, len(candidates))
+        if k < len(candidates):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            NodeWithScore(self._nodes[self._row_ids[candidates[i]]], float(scores[i]))
+            for i in top
+        ]
+
+    def column(self, key, rows):
+        return self._columns[key][rows]
+
+    def get_dates(self, node_id):
+        """Get the (create, expire, access) epoch seconds of the node"""
+
+        row = self._rows[node_id]
+        return tuple(int(self._columns[k][row]) for k in ("create", "expire", "access"))
+
+    def node_at(self, row):
+        return self._nodes[self._row_ids[row]]
+
+    def touch(self, rows, access=None):
+        """Update the access time of the nodes at rows"""
+
+        access = access or utils.get_timer().get_date("%Y%m%d-%H:%M:%S")
+        for row in rows:
+            self.node_at(row).metadata["access"] = access
+        self._columns["access"][rows] = utils.to_epoch(access)
+        node_ids = [self._row_ids[r] for r in rows]
+        if node_ids:
+            self._pending.append(("touch", node_ids, access))
+        return node_ids
+
     def retrieve(
         self,
         text,
@@ -273,7 +845,7 @@ class LlamaIndex:
         try:
             retriever_creator = retriever_creator or VectorIndexRetriever
             return retriever_creator(
-                self._index,
+                self,
                 similarity_top_k=similarity_top_k,
                 filters=filters,
                 node_ids=node_ids,
@@ -282,37 +854,237 @@ class LlamaIndex:
             # print(f"LlamaIndex.retrieve() caused an error: {e}")
             return []
 
-    def query(
-        self,
-        text,
-        similarity_top_k=5,
-        text_qa_template=None,
-        refine_template=None,
-        filters=None,
-        query_creator=None,
-    ):
-        kwargs = {
-            "similarity_top_k": similarity_top_k,
-            "text_qa_template": text_qa_template,
-            "refine_template": refine_template,
-            "filters": filters,
-        }
-        while True:
-            try:
-                if query_creator:
-                    query_engine = query_creator(retriever=self._index.as_retriever(**kwargs))
-                else:
-                    query_engine = self._index.as_query_engine(**kwargs)
-                return query_engine.query(text)
-            except Exception as e:
-                print(f"LlamaIndex.query() caused an error: {e}")
-                time.sleep(5)
+    def _load(self, path):
+        nodes_file = os.path.join(path, "nodes.json")
+        config_file = os.path.join(path, "index_config.json")
+        if os.path.exists(config_file):
+            self._config = utils.load_dict(config_file)
+        self._type_codes = dict(self._config.pop("type_codes", {}))
+        if os.path.exists(nodes_file):
+            self._load_snapshot(path)
+        else:
+            for node_id, record, vec in self._load_legacy(path):
+                node = TextNode(record["text"], node_id, record["metadata"])
+                if vec is None:
+                    vec = self._embed(node.text)
+                self._insert(node, np.asarray(vec, dtype=np.float32))
+            self._needs_snapshot = True
+        self._replay_log(path)
+
+    def _load_snapshot(self, path):
+        data = utils.load_dict(os.path.join(path, "nodes.json"))
+        if not data:
+            return
+        node_ids = list(data.keys())
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="c")
+        size = len(node_ids)
+        self._columns = {k: np.zeros(size, dtype=t) for k, t in self.columns.items()}
+        self._columns["scale"][:] = 1
+        self._row_ids = node_ids
+        self._rows = {i: row for row, i in enumerate(node_ids)}
+        self._nodes = {i: TextNode(data[i]["text"], i, data[i]["metadata"]) for i in node_ids}
+        columns_file = os.path.join(path, "columns.npz")
+        if os.path.exists(columns_file):
+            with np.load(columns_file) as columns:
+                for key in self.columns:
+                    if key in columns:
+                        self._columns[key][:size] = columns[key]
+            ann_file = os.path.join(path, "ann.npz")
+            if self._ann and os.path.exists(ann_file):
+                self._ann.load(ann_file)
+        else:
+            for row, node_id in enumerate(node_ids):
+                self._set_columns(row, self._nodes[node_id].metadata)
+        if embeddings.dtype == self._dtype:
+            # 快照不读入内存，写时复制映射为基础部分，新增的行写入内存中的尾部
+            self._base = embeddings
+            self._matrix = np.zeros((0, embeddings.shape[1]), dtype=self._dtype)
+        else:
+            # 存储精度变化时逐块转换，下次保存时写入新的快照
+            self._matrix = np.zeros((size, embeddings.shape[1]), dtype=self._dtype)
+            for start in range(0, size, self.score_block):
+                block = slice(start, min(start + self.score_block, size))
+                vectors = self._dequantize(embeddings[block], self._columns["scale"][block])
+                self._matrix[block], self._columns["scale"][block] = self._quantize(vectors)
+            self._needs_snapshot = True
+        expire, create = self._columns["expire"][:size].tolist(), self._columns["create"][:size].tolist()
+        self._expire_heap = [
+            (expire[r], i) for r, i in enumerate(node_ids) if "expire" in self._nodes[i].metadata
+        ]
+        self._create_heap = [
+            (-create[r], i) for r, i in enumerate(node_ids) if "create" in self._nodes[i].metadata
+        ]
+        heapq.heapify(self._expire_heap)
+        heapq.heapify(self._create_heap)
+
+    def _replay_log(self, path):
+        """Apply the ops appended since the snapshot, a torn tail is dropped"""
+
+        log_file = os.path.join(path, "nodes.log")
+        if not os.path.exists(log_file):
+            return
+        vectors_file = os.path.join(path, "embeddings.log")
+        dim = self._config.get("dim", 0)
+        dtype = np.dtype(self._config.get("dtype", "float32"))
+        vectors = np.zeros((0, dim), dtype=dtype)
+        if dim and os.path.exists(vectors_file):
+            rows = os.path.getsize(vectors_file) // (dtype.itemsize * dim)
+            if rows:
+                vectors = np.memmap(vectors_file, dtype=dtype, mode="r", shape=(rows, dim))
+        with open(log_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    self._needs_snapshot = True
+                    break
+                if op["op"] == "add":
+                    if op["row"] >= len(vectors):
+                        self._needs_snapshot = True
+                        break
+                    self._remove(op["id"])
+                    node = TextNode(op["text"], op["id"], op["metadata"])
+                    scale = np.asarray(op.get("scale", 1), dtype=np.float32)
+                    self._insert(node, self._dequantize(vectors[op["row"]], scale))
+                    self._config["max_nodes"] = max(self._config["max_nodes"], op["max_nodes"])
+                elif op["op"] == "remove":
+                    for node_id in op["ids"]:
+                        self._remove(node_id)
+                elif op["op"] == "touch":
+                    rows = [self._rows[i] for i in op["ids"] if i in self._rows]
+                    for row in rows:
+                        self.node_at(row).metadata["access"] = op["access"]
+                    self._columns["access"][rows] = utils.to_epoch(op["access"])
+                self._log_lines += 1
+        self._log_rows = len(vectors)
+        del vectors
+
+    def _load_legacy(self, path):
+        """Read the storage persisted by llama_index"""
+
+        docstore_file = os.path.join(path, "docstore.json")
+        if not os.path.exists(docstore_file):
+            return []
+        docs = utils.load_dict(docstore_file).get("docstore/data", {})
+        vector_file = os.path.join(path, "default__vector_store.json")
+        vectors = {}
+        if os.path.exists(vector_file):
+            vectors = utils.load_dict(vector_file).get("embedding_dict", {})
+        records = []
+        for node_id, doc in docs.items():
+            data = doc["__data__"]
+            vec = vectors.get(node_id)
+            if vec is not None:
+                vec = np.asarray(vec, dtype=np.float32)
+                norm = np.linalg.norm(vec)
+                vec = vec / norm if norm > 0 else vec
+            records.append((node_id, {"text": data["text"], "metadata": data["metadata"]}, vec))
+        return records
 
     def save(self, path=None):
+        """Append the changes since the last save, or write a new snapshot"""
+
         path = path or self._path
-        self._index.storage_context.persist(path)
-        utils.save_dict(self._config, os.path.join(path, "index_config.json"))
+        if path != self._path:
+            return self._save_snapshot(path)
+        if (
+            self._needs_snapshot
+            or not os.path.exists(os.path.join(path, "nodes.json"))
+            or (self._dim is not None and self._config.get("dim") != self._dim)
+            or self._config.get("dtype", "float32") != self._dtype.name
+            or self._log_lines > max(self.compact_min, len(self._row_ids))
+        ):
+            self._save_snapshot(path)
+            for name in ("nodes.log", "embeddings.log"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+            self._pending = []
+            self._log_lines, self._log_rows = 0, 0
+            self._needs_snapshot = False
+        elif self._pending:
+            self._append_log(path)
+
+    def _save_config(self, path):
+        if self._dim is not None:
+            self._config["dim"] = self._dim
+        self._config["dtype"] = self._dtype.name
+        config = {**self._config, "type_codes": self._type_codes}
+        utils.save_dict(config, os.path.join(path, "index_config.json"))
+
+    def _save_snapshot(self, path):
+        os.makedirs(path, exist_ok=True)
+        size, dim = len(self._row_ids), self._dim
+        # 先写临时文件再替换，中断时旧快照和日志仍然完整
+        nodes_file = os.path.join(path, "nodes.json")
+        utils.save_dict({i: self._nodes[i].to_dict() for i in self._row_ids}, nodes_file + ".tmp")
+        embeddings_file = os.path.join(path, "embeddings.npy")
+        if not size:
+            with open(embeddings_file + ".tmp", "wb") as f:
+                np.save(f, np.zeros((0, dim or 0), dtype=self._dtype if dim else np.float32))
+        else:
+            # 基础部分和尾部在写入时合并
+            embeddings = np.lib.format.open_memmap(
+                embeddings_file + ".tmp", mode="w+", dtype=self._dtype, shape=(size, dim)
+            )
+            for pos, matrix, local in self._segments(slice(0, size)):
+                embeddings[pos] = matrix[local]
+            embeddings.flush()
+            del embeddings
+        with open(os.path.join(path, "columns.npz.tmp"), "wb") as f:
+            np.savez(f, **{k: c[:size] for k, c in self._columns.items()})
+        names = ["nodes.json", "embeddings.npy", "columns.npz"]
+        if self._ann and self._ann.trained:
+            with open(os.path.join(path, "ann.npz.tmp"), "wb") as f:
+                self._ann.save(f)
+            names.append("ann.npz")
+        elif os.path.exists(os.path.join(path, "ann.npz")):
+            os.remove(os.path.join(path, "ann.npz"))
+        self._save_config(path)
+        rebase = size and path == self._path
+        if rebase:
+            # 替换前释放旧快照的映射
+            self._base, self._matrix = None, None
+        for name in names:
+            os.replace(os.path.join(path, name + ".tmp"), os.path.join(path, name))
+        if rebase:
+            self._base = np.load(embeddings_file, mmap_mode="c")
+            self._matrix = np.zeros((0, dim), dtype=self._dtype)
+
+    def _append_log(self, path):
+        lines, vectors = [], []
+        for op in self._pending:
+            if op[0] == "add":
+                row = self._rows.get(op[1])
+                if row is None:
+                    continue
+                node = self._nodes[op[1]]
+                line = {
+                    "op": "add",
+                    "id": node.id_,
+                    "text": node.text,
+                    "metadata": node.metadata,
+                    "row": self._log_rows + len(vectors),
+                    "max_nodes": self._config["max_nodes"],
+                }
+                if self._dtype == np.int8:
+                    line["scale"] = float(self._columns["scale"][row])
+                lines.append(line)
+                vectors.append(self._row(row))
+            elif op[0] == "remove":
+                lines.append({"op": "remove", "ids": op[1]})
+            else:
+                lines.append({"op": "touch", "ids": op[1], "access": op[2]})
+        # 向量先于日志写入，日志中的add总能找到对应的向量
+        if vectors:
+            with open(os.path.join(path, "embeddings.log"), "ab") as f:
+                f.write(np.asarray(vectors, dtype=self._dtype).tobytes())
+        with open(os.path.join(path, "nodes.log"), "a", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        self._log_lines += len(lines)
+        self._log_rows += len(vectors)
+        self._pending = []
 
     @property
     def nodes_num(self):
-        return len(self._index.docstore.docs)
+        return len(self._nodes)
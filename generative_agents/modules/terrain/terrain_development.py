@@ -62,6 +62,7 @@ class BuildingType(Enum):
     ROAD = "road"                   # 道路
     HIGHWAY = "highway"             # 高速公路
     BRIDGE = "bridge"               # 桥梁
+    WALL = "wall"                   # 城墙
     PARK = "park"                   # 公园
     SCHOOL = "school"               # 学校
     UNIVERSITY = "university"       # 大学
@@ -478,10 +479,11 @@ class TerrainDevelopmentEngine:
             offset_x, offset_y = config["center_offset"]
             center_x, center_y = self.width // 2 + offset_x, self.height // 2 + offset_y
             radius = config["radius"]
+            extent = int(math.ceil(radius))
             
             # 找到区域内的所有瓦片
-            for x in range(max(0, center_x - radius), min(self.width, center_x + radius)):
-                for y in range(max(0, center_y - radius), min(self.height, center_y + radius)):
+            for x in range(max(0, center_x - extent), min(self.width, center_x + extent)):
+                for y in range(max(0, center_y - extent), min(self.height, center_y + extent)):
                     distance = math.sqrt((x - center_x)**2 + (y - center_y)**2)
                     if distance <= radius and (x, y) in self.terrain_map:
                         tile = self.terrain_map[(x, y)]
@@ -1157,7 +1159,7 @@ class TerrainDevelopmentEngine:
                        self.buildings[b].building_type == BuildingType.PARK]
         green_reduction = len(green_spaces) * 0.1
         
-        tile.pollution = max(0.0, min(1.0, traffic_pollution + industrial_pollution - green_reduction))
+        tile.pollution_level = max(0.0, min(1.0, traffic_pollution + industrial_pollution - green_reduction))
     
     def _calculate_crime_rate(self, tile: TerrainTile, x: int, y: int):
         """计算犯罪率"""
@@ -1176,7 +1178,7 @@ class TerrainDevelopmentEngine:
         density_factor = tile.traffic_density * 0.2
         
         # 污染高的区域犯罪率高
-        pollution_factor = tile.pollution * 0.2
+        pollution_factor = tile.pollution_level * 0.2
         
         # 警察局降低犯罪率
         police_reduction = len(police_stations) * 0.15
@@ -1226,7 +1228,7 @@ class TerrainDevelopmentEngine:
         happiness += len(education) * 0.06
         
         # 污染降低幸福度
-        happiness -= tile.pollution * 0.3
+        happiness -= tile.pollution_level * 0.3
         
         # 犯罪率降低幸福度
         happiness -= tile.crime_rate * 0.4
@@ -1244,7 +1246,7 @@ class TerrainDevelopmentEngine:
         
         # 计算平均指标
         avg_traffic = sum(tile.traffic_density for tile in self.terrain_map.values()) / total_tiles
-        avg_pollution = sum(tile.pollution for tile in self.terrain_map.values()) / total_tiles
+        avg_pollution = sum(tile.pollution_level for tile in self.terrain_map.values()) / total_tiles
         avg_crime = sum(tile.crime_rate for tile in self.terrain_map.values()) / total_tiles
         avg_happiness = sum(tile.happiness_index for tile in self.terrain_map.values()) / total_tiles
         avg_land_value = sum(tile.land_value for tile in self.terrain_map.values()) / total_tiles
@@ -1259,7 +1261,7 @@ class TerrainDevelopmentEngine:
                     "avg_development": sum(t.development_level for t in district_tiles) / len(district_tiles),
                     "building_count": sum(len(t.buildings) for t in district_tiles),
                     "avg_traffic": sum(t.traffic_density for t in district_tiles) / len(district_tiles),
-                    "avg_pollution": sum(t.pollution for t in district_tiles) / len(district_tiles),
+                    "avg_pollution": sum(t.pollution_level for t in district_tiles) / len(district_tiles),
                     "avg_crime": sum(t.crime_rate for t in district_tiles) / len(district_tiles),
                     "avg_happiness": sum(t.happiness_index for t in district_tiles) / len(district_tiles)
                 }
@@ -0,0 +1,57 @@
+"""generative_agents.utils.profile"""
+
+import time
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    """Record wall time, llm time and llm calls of named phases.
+
+    The llm time is charged to the innermost running phase. The latest round
+    (started by begin) and the totals since creation are kept separately.
+    """
+
+    def __init__(self):
+        self._stack = []
+        self._latest = {}
+        self._total = {}
+
+    def begin(self):
+        self._latest = {}
+
+    @contextmanager
+    def phase(self, name):
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self._record(name, wall=time.perf_counter() - start, calls=1)
+
+    def add_llm(self, cost, calls=1):
+        if self._stack:
+            self._record(self._stack[-1], llm=cost, llm_calls=calls)
+
+    def _record(self, name, wall=0.0, calls=0, llm=0.0, llm_calls=0):
+        for phases in (self._latest, self._total):
+            record = phases.setdefault(name, [0, 0.0, 0.0, 0])
+            record[0] += calls
+            record[1] += wall
+            record[2] += llm
+            record[3] += llm_calls
+
+    @staticmethod
+    def _format(phases):
+        des = {}
+        for name, (calls, wall, llm, llm_calls) in phases.items():
+            des[name] = {
+                "calls": calls,
+                "wall_ms": round(wall * 1000, 3),
+                "llm_ms": round(llm * 1000, 3),
+                "llm_calls": llm_calls,
+            }
+        return des
+
+    def get_summary(self, latest=True):
+        return self._format(self._latest if latest else self._total)
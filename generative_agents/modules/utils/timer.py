@@ -11,6 +11,23 @@ def to_date(date_str, date_format="%Y%m%d-%H:%M:%S"):
     return datetime.datetime.strptime(date_str, date_format)
 
 
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch(date):
+    """Convert the date (or date string) to integer epoch seconds, no timezone involved"""
+
+    if not date:
+        return 0
+    if isinstance(date, str):
+        date = to_date(date)
+    return int((date - _EPOCH).total_seconds())
+
+
+def from_epoch(seconds):
+    return _EPOCH + datetime.timedelta(seconds=int(seconds))
+
+
 def daily_duration(date, mode="minute"):
     duration = date.hour % 24
     if mode == "hour":
@@ -73,8 +73,10 @@ class SimulateServer:
         for i in range(self.start_step, self.start_step + step):
             title = "Simulate Step[{}/{}, time: {}]".format(i+1, self.start_step + step, timer.get_date())
             self.logger.info("\n" + utils.split_line(title, "="))
+            results = self.game.agents_think(self.agent_status)
+            self.logger.debug(utils.block_msg("world ticks", self.game.scheduler.get_summary()["systems"]))
             for name, status in self.agent_status.items():
-                plan = self.game.agent_think(name, status)["plan"]
+                plan = results[name]["plan"]
                 agent = self.game.get_agent(name)
                 if name not in self.config["agents"]:
                     self.config["agents"][name] = {}
@@ -167,10 +169,17 @@ parser.add_argument("--step", type=int, default=10, help="The simulate step")
 parser.add_argument("--stride", type=int, default=10, help="The step stride in minute")
 parser.add_argument("--verbose", type=str, default="debug", help="The verbose level")
 parser.add_argument("--log", type=str, default="", help="Name of the log file")
-args = parser.parse_args()
+parser.add_argument("--workers", type=int, default=1, help="Number of agents thinking in parallel")
+parser.add_argument("--seed", type=int, default=0, help="Seed of the random generators of agents")
+parser.add_argument("--llm_cache", type=str, default="", help="Path of the persistent llm response cache (disabled if empty)")
+parser.add_argument("--embedding_cache", type=str, default="", help="Path of the persistent embedding cache (in memory only if empty)")
+parser.add_argument("--llm_replay", type=str, default="", choices=["", "replay", "record", "synthetic"], help="Run with the offline replay llm in this mode")
+parser.add_argument("--llm_cassette", type=str, default="", help="Path of the recorded llm responses for --llm_replay")
+parser.add_argument("--llm_latency", type=float, default=0.0, help="Artificial latency in seconds of the replay llm")
 
 
 if __name__ == "__main__":
+    args = parser.parse_args()
     checkpoints_path = "results/checkpoints"
 
     name = args.name
@@ -197,6 +206,25 @@ if __name__ == "__main__":
     else:
         sim_config = get_config(start_time, args.stride, personas)
         start_step = 0
+    sim_config["workers"] = args.workers
+    sim_config.setdefault("seed", args.seed)
+    if args.llm_cache:
+        llm_config = sim_config.setdefault("agent_base", {}).setdefault("think", {}).setdefault("llm", {})
+        llm_config["cache"] = {"path": args.llm_cache}
+    if args.embedding_cache:
+        associate_config = sim_config.setdefault("agent_base", {}).setdefault("associate", {})
+        associate_config.setdefault("embedding", {})["cache"] = {"path": args.embedding_cache}
+    if args.llm_replay:
+        think_config = sim_config.setdefault("agent_base", {}).setdefault("think", {})
+        replay_config = {
+            "provider": "replay",
+            "mode": args.llm_replay,
+            "cassette": args.llm_cassette,
+            "latency": args.llm_latency,
+        }
+        if args.llm_replay == "record":
+            replay_config["record"] = think_config.get("llm", {})
+        think_config["llm"] = replay_config
 
     static_root = "frontend/static"
 
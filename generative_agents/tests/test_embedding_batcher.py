@@ -0,0 +1,134 @@
+"""
+Embedding批处理测试模块
+使用本地HTTP桩服务验证跨Agent合并请求、429退避、限流时整批失败、失败批次的逐条重试以及单个请求的立即发送
+"""
+
+import unittest
+import json
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.storage.embedding_batcher import EmbeddingBatcher
+from modules.storage.index import BatchedEmbedding, GLMEmbedding
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        with server.lock:
+            server.batches.append(len(texts))
+            limited = server.rate_limited > 0
+            server.rate_limited -= 1
+        time.sleep(server.delay)
+        if limited or "bad" in texts:
+            self.send_response(429 if limited else 400)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = [
+            {"index": i, "embedding": [float(len(t)), float(i)]}
+            for i, t in reversed(list(enumerate(texts)))
+        ]
+        content = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestEmbeddingBatcher(unittest.TestCase):
+    """Embedding批处理测试"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.batches, self.server.rate_limited = [], 0
+        self.server.delay = 0.0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.model = GLMEmbedding(
+            base_url="http://127.0.0.1:{}".format(self.server.server_port), api_key="test"
+        )
+        self.model.retry_delay = 0.01
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_merge_agents(self):
+        # 第一个请求进行中时，其余Agent的文本在队列中合并
+        self.server.delay = 0.05
+        batcher = EmbeddingBatcher(self.model, max_batch=32, max_delay=0.05)
+        embedding = BatchedEmbedding(batcher)
+        texts = ["文本" * (i + 1) for i in range(16)]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            vecs = list(pool.map(embedding.get_text_embedding, texts))
+        batcher.close()
+
+        self.assertEqual([v[0] for v in vecs], [float(len(t)) for t in texts])
+        self.assertLessEqual(len(self.server.batches), 2)
+        self.assertEqual(batcher.get_summary()["texts"], 16)
+
+    def test_rate_limit_backoff(self):
+        self.server.rate_limited = 1
+        batcher = EmbeddingBatcher(self.model, max_batch=4, max_delay=0.01)
+        vecs = BatchedEmbedding(batcher).get_text_embeddings(["a", "bb", "ccc"])
+        batcher.close()
+        self.assertEqual([v[0] for v in vecs], [1.0, 2.0, 3.0])
+        # 第一次请求被限流，退避后重试同一批文本
+        self.assertEqual(self.server.batches, [3, 3])
+
+    def test_rate_limit_fails_batch(self):
+        # 退避重试后仍被限流时整批失败，不再逐条请求
+        self.server.rate_limited = 4
+        batcher = EmbeddingBatcher(self.model, max_batch=4, max_delay=0.01)
+        futures = batcher.submit_many(["a", "bb", "ccc"])
+        for future in futures:
+            with self.assertRaises(Exception):
+                future.result()
+        batcher.close()
+        self.assertEqual(self.server.batches, [3, 3, 3, 3])
+        self.assertEqual(batcher.get_summary()["retried"], 0)
+
+    def test_lone_submit_flush(self):
+        batcher = EmbeddingBatcher(self.model, max_batch=32, max_delay=1.0)
+        embedding = BatchedEmbedding(batcher)
+        start = time.monotonic()
+        for text in ["a", "bb", "ccc"]:
+            embedding.get_text_embedding(text)
+        elapsed = time.monotonic() - start
+        batcher.close()
+        # 没有其他提交者时不等待max_delay
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(self.server.batches, [1, 1, 1])
+
+    def test_retry_failed_batch(self):
+        self.server.delay = 0.05
+        batcher = EmbeddingBatcher(self.model, max_batch=32, max_delay=0.05)
+        texts = ["a", "bad", "ccc", "dddd"]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            futures = [pool.submit(batcher.submit(t).result) for t in texts]
+        batcher.close()
+
+        # 只有坏文本失败，其余文本逐条重试后成功
+        with self.assertRaises(Exception):
+            futures[1].result()
+        self.assertEqual([futures[i].result()[0] for i in (0, 2, 3)], [1.0, 3.0, 4.0])
+        summary = batcher.get_summary()
+        self.assertEqual(summary["errors"], 2)
+        self.assertGreater(summary["retried"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Embedding缓存测试模块
+验证内存LRU、磁盘持久化以及跨Agent共享
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.storage.embedding_cache import EmbeddingCache
+from modules.storage.index import CachedEmbedding, HashEmbedding
+
+
+class CountingEmbedding(HashEmbedding):
+    def __init__(self):
+        super().__init__(dim=8)
+        self.texts = []
+
+    def _get_text_embedding(self, text):
+        self.texts.append(text)
+        return super()._get_text_embedding(text)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Embedding缓存测试"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_lru_and_disk(self):
+        path = os.path.join(self.folder, "embedding.db")
+        cache = EmbeddingCache(path, max_entries=2)
+        keys = [cache.make_key("hash", "8", t) for t in ["a", "b", "c"]]
+        for idx, key in enumerate(keys):
+            cache.put(key, [float(idx)] * 8)
+        self.assertEqual(cache.get_summary()["entries"], 2)
+        # 被淘汰出内存的向量从磁盘读取
+        self.assertEqual(cache.get(keys[0]).tolist(), [0.0] * 8)
+        self.assertEqual(cache.get_summary()["disk_hits"], 1)
+        cache.close()
+
+        reopened = EmbeddingCache(path)
+        self.assertEqual(reopened.get(keys[2]).tolist(), [2.0] * 8)
+        self.assertIsNone(reopened.get(cache.make_key("hash", "8", "d")))
+        self.assertEqual(reopened.get_summary()["hit_rate"], 0.5)
+        reopened.close()
+
+    def test_shared_between_agents(self):
+        cache = EmbeddingCache()
+        model = CountingEmbedding()
+        agent_a = CachedEmbedding(model, "hash", "8", cache)
+        agent_b = CachedEmbedding(model, "hash", "8", cache)
+        vec = agent_a.get_text_embedding("简 正在 做早餐")
+        self.assertEqual(list(agent_b.get_text_embedding("简 正在 做早餐")), list(vec))
+        vecs = agent_b.get_text_embeddings(["简 正在 做早餐", "汤姆 正在 卖菜"])
+        self.assertEqual(len(vecs), 2)
+        self.assertEqual(model.texts, ["简 正在 做早餐", "汤姆 正在 卖菜"])
+        # 不同模型的向量不共享
+        other = CachedEmbedding(model, "hash", "other", cache)
+        other.get_text_embedding("简 正在 做早餐")
+        self.assertEqual(len(model.texts), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+LLM响应缓存测试模块
+验证缓存命中、LRU淘汰、回调失败时的回退以及多线程访问
+"""
+
+import unittest
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.model.llm_cache import LLMCache, get_llm_cache
+from modules.model.llm_model import LLMModel
+
+
+class EchoLLMModel(LLMModel):
+    def setup(self, config):
+        self.calls = 0
+        return None
+
+    def _completion(self, prompt, temperature=0.5):
+        self.calls += 1
+        return f"{prompt}@{temperature}"
+
+
+class TestLLMCache(unittest.TestCase):
+    """LLM响应缓存测试"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, "llm_cache.db")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def _create_model(self):
+        return EchoLLMModel(
+            {
+                "provider": "echo",
+                "api_key": "",
+                "base_url": "",
+                "model": "echo",
+                "cache": {"path": self.path},
+            }
+        )
+
+    def test_hit_and_miss(self):
+        model = self._create_model()
+        self.assertEqual(model.completion("a", caller="wake_up"), "a@0.5")
+        self.assertEqual(model.completion("a", caller="wake_up"), "a@0.5")
+        self.assertEqual(model.completion("a", caller="wake_up", temperature=0.1), "a@0.1")
+        self.assertEqual(model.completion("a", caller="other"), "a@0.5")
+        self.assertEqual(model.calls, 3)
+        self.assertEqual(model.get_summary()["cache"], "H:1/M:3")
+        self.assertEqual(model.meta_responses, ["a@0.5"])
+
+        # 新进程（新模型实例）复用磁盘上的缓存
+        resumed = self._create_model()
+        self.assertEqual(resumed.completion("a", caller="wake_up"), "a@0.5")
+        self.assertEqual(resumed.calls, 0)
+
+    def test_invalid_cached_response(self):
+        model = self._create_model()
+        model.completion("a", caller="wake_up")
+
+        # 缓存的响应无法通过回调解析时，重新请求模型
+        parsed = []
+
+        def _callback(response):
+            parsed.append(response)
+            assert len(parsed) > 1
+            return response.upper()
+
+        self.assertEqual(model.completion("a", caller="wake_up", callback=_callback), "A@0.5")
+        self.assertEqual(model.calls, 2)
+
+    def test_async_matches_sync(self):
+        # 同步和异步共用缓存、重试和统计
+        def _callback(response):
+            parsed.append(response)
+            assert len(parsed) % 2 == 0
+            return response.upper()
+
+        summaries = []
+        for name in ("sync", "async"):
+            parsed = []
+            model = self._create_model()
+            model._backoff = {"base": 0.0, "cap": 0.0}
+            prompt = "{}".format(name)
+            if name == "sync":
+                results = [model.completion(prompt, caller="wake_up", callback=_callback)
+                           for _ in range(2)]
+            else:
+                results = [asyncio.run(model.acompletion(prompt, caller="wake_up", callback=_callback))
+                           for _ in range(2)]
+            self.assertEqual(results, [prompt.upper() + "@0.5"] * 2)
+            # 第一次回调失败后重试，第二次缓存的响应回调失败后重新请求
+            self.assertEqual(model.calls, 3)
+            self.assertEqual(model.meta_responses, [prompt + "@0.5"])
+            summaries.append(model.get_summary())
+        self.assertEqual(summaries[0], summaries[1])
+
+    def test_lru_eviction(self):
+        cache = LLMCache(os.path.join(self.folder.name, "lru.db"), max_entries=10)
+        for i in range(10):
+            cache.put(f"k{i}", f"v{i}")
+        self.assertEqual(cache.get("k0"), "v0")
+        cache.put("k10", "v10")
+        summary = cache.get_summary()
+        self.assertLessEqual(summary["entries"], 10)
+        self.assertEqual(cache.get("k0"), "v0")
+        self.assertIsNone(cache.get("k1"))
+        cache.close()
+
+    def test_concurrent_access(self):
+        cache = get_llm_cache({"path": self.path})
+        errors = []
+
+        def _work(idx):
+            try:
+                for i in range(50):
+                    cache.put(f"{idx}-{i}", str(i))
+                    self.assertEqual(cache.get(f"{idx}-{i}"), str(i))
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=_work, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(cache.get_summary()["entries"], 400)
+        self.assertIs(get_llm_cache({"path": self.path}), cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+LLM健康路由测试模块
+使用注入故障和延迟的假模型验证熔断、半开探测和最快模型选择
+"""
+
+import unittest
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.model.llm_model import LLMModel
+from modules.model.llm_health import (
+    HealthRouter,
+    backoff_delay,
+    get_health_router,
+    reset_health_router,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLLMModel(LLMModel):
+    """按模型注入延迟和故障的假模型，延迟通过推进假时钟模拟"""
+
+    def setup(self, config):
+        self._clock = FakeClock()
+        self._health = HealthRouter(config.get("health"), clock=self._clock)
+        self._models = list(config["latency"].keys())
+        self.latency = dict(config["latency"])
+        self.failing = set()
+        self.calls = []
+        return None
+
+    def _completion(self, prompt, temperature=0.5):
+        return self._route_call("fake", self._models, lambda m: self._model_completion(m, prompt))
+
+    def _model_completion(self, model, prompt):
+        self.calls.append(model)
+        self._clock.now += self.latency[model]
+        if model in self.failing:
+            raise Exception(f"{model} 故障")
+        return f"{model}: {prompt}"
+
+
+class SharedFakeLLMModel(FakeLLMModel):
+    """使用进程内共享路由的假模型"""
+
+    def setup(self, config):
+        super().setup(config)
+        self._health = get_health_router()
+        return None
+
+
+class TestLLMHealth(unittest.TestCase):
+    """LLM健康路由测试"""
+
+    def setUp(self):
+        reset_health_router()
+
+    def tearDown(self):
+        reset_health_router()
+
+    def _create_model(self, model_cls=FakeLLMModel):
+        return model_cls(
+            {
+                "api_key": "",
+                "base_url": "",
+                "model": "fake",
+                "latency": {"slow": 2.0, "fast": 0.5, "spare": 1.0},
+                "health": {"failure_threshold": 2, "cooldown": 10.0},
+                "retry_backoff": {"base": 0.0, "cap": 0.0},
+            }
+        )
+
+    def test_choose_fastest(self):
+        model = self._create_model()
+        for i in range(3):
+            model.completion(f"p{i}")
+        # 未测量的模型先按优先级依次测量，之后始终选择最快的模型
+        self.assertEqual(model.calls, ["slow", "fast", "spare"])
+        self.assertEqual(model.completion("p"), "fast: p")
+
+    def test_circuit_open_and_probe(self):
+        model = self._create_model()
+        model.failing.add("fast")
+        model.completion("warmup")
+        model.calls = []
+        self.assertEqual(model.completion("p1", retry=1), "spare: p1")
+        self.assertEqual(model.completion("p2", retry=1), "spare: p2")
+        self.assertEqual(model._health.route("fake/fast").state, "open")
+
+        # 熔断期间直接跳过故障模型
+        model.calls = []
+        model.completion("p3", retry=1)
+        self.assertNotIn("fast", model.calls)
+
+        # 冷却结束后放行一次探测，成功则恢复
+        model.failing.clear()
+        model._clock.now += 10.0
+        self.assertEqual(model.completion("p4", retry=1), "fast: p4")
+        self.assertEqual(model._health.route("fake/fast").state, "closed")
+        self.assertEqual(
+            set(model.get_summary()["health"]), {"fake/slow", "fake/fast", "fake/spare"}
+        )
+
+    def test_shared_between_models(self):
+        first = self._create_model(SharedFakeLLMModel)
+        second = self._create_model(SharedFakeLLMModel)
+        self.assertIs(first._health, second._health)
+        first.failing.update(first.latency)
+        first.completion("p1", retry=1)
+        first.completion("p2", retry=1)
+        self.assertEqual(first._health.route("fake/slow").state, "open")
+
+        # 另一个Agent的模型直接跳过已熔断的模型，不再逐个等待超时
+        self.assertEqual(second.completion("p3", retry=1, failsafe="failsafe"), "failsafe")
+        self.assertEqual(second.calls, [])
+
+    def test_concurrent_records(self):
+        health = HealthRouter({"failure_threshold": 10 ** 6, "window": 10 ** 6}).route("m")
+
+        def _record():
+            for _ in range(2000):
+                health.record_success(0.1)
+                health.record_failure(0.1)
+
+        threads = [threading.Thread(target=_record) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        summary = health.get_summary()
+        self.assertEqual(summary["success"], 16000)
+        self.assertEqual(summary["failure"], 16000)
+
+    def test_half_open_single_probe(self):
+        router = HealthRouter({"failure_threshold": 1, "cooldown": 5.0}, clock=FakeClock())
+        health = router.route("m")
+        health.record_failure()
+        self.assertFalse(health.acquire())
+        router._clock.now = 5.0
+        self.assertTrue(health.acquire())
+        self.assertEqual(health.state, "half_open")
+        self.assertFalse(health.acquire())
+        health.record_failure()
+        self.assertEqual(health.state, "open")
+
+    def test_backoff_delay(self):
+        for attempt in range(8):
+            delay = backoff_delay(attempt, base=1.0, cap=10.0)
+            self.assertGreaterEqual(delay, 0.0)
+            self.assertLessEqual(delay, min(10.0, 2 ** attempt))
+
+
+if __name__ == '__main__':
+    unittest.main()
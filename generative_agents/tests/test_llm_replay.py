@@ -0,0 +1,66 @@
+"""
+离线回放LLM测试模块
+验证录制、回放以及合成模式
+"""
+
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.model.llm_model import create_llm_model
+
+
+class EchoLLM:
+    def __init__(self):
+        self.calls = 0
+
+    def _completion(self, prompt, **kwargs):
+        self.calls += 1
+        return "回应{}: {}".format(self.calls, prompt)
+
+
+class TestLLMReplay(unittest.TestCase):
+    """离线回放LLM测试"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cassette = os.path.join(self.folder, "llm.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _create_model(self, mode, **config):
+        config.update({"provider": "replay", "mode": mode, "cassette": self.cassette})
+        return create_llm_model(config)
+
+    def test_record_and_replay(self):
+        recorder = self._create_model("record", record={"provider": "replay", "mode": "synthetic"})
+        recorder._inner = EchoLLM()
+        # 第一次响应被callback拒绝，重试的响应同样被录制
+        callback = lambda r: r if r.startswith("回应2") else None
+        self.assertEqual(recorder.completion("问题", callback=callback, caller="chat"), "回应2: 问题")
+        self.assertEqual(recorder.completion("问题", caller="wake_up"), "回应3: 问题")
+
+        player = self._create_model("replay")
+        self.assertEqual(player.completion("问题", callback=callback, caller="chat"), "回应2: 问题")
+        self.assertEqual(player.meta_responses, ["回应1: 问题", "回应2: 问题"])
+        self.assertEqual(player.completion("问题", caller="wake_up"), "回应3: 问题")
+        # 未录制的prompt直接返回failsafe
+        self.assertEqual(player.completion("新问题", caller="chat", failsafe="嗯"), "嗯")
+        self.assertEqual(player.get_summary()["replay"]["keys"], 2)
+
+    def test_synthetic_latency(self):
+        model = create_llm_model({"provider": "replay", "mode": "synthetic", "latency": 0.05})
+        start = time.time()
+        self.assertEqual(model.completion("问题", failsafe=[1, 2], caller="plan"), [1, 2])
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(model.get_summary()["summary"]["plan"], "S:1,F:0/R:1")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+LLM传输层测试模块
+使用本地HTTP桩服务验证连接复用、并发上限和异步调用
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.model.llm_model import GLMLLMModel, close_transports, get_transport
+from modules.model.llm_health import reset_health_router
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.connections.add(self.client_address)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+        content = "echo: " + body["messages"][0]["content"]
+        data = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLLMTransport(unittest.TestCase):
+    """LLM传输层测试"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.connections, self.server.active, self.server.peak = set(), 0, 0
+        self.server.delay = 0.0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/v4/chat/completions".format(self.server.server_port)
+
+    def tearDown(self):
+        close_transports()
+        reset_health_router()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _create_model(self, max_inflight=8):
+        return GLMLLMModel(
+            {
+                "api_key": "",
+                "base_url": "",
+                "model": "stub",
+                "glm_url": self.url,
+                "max_inflight": max_inflight,
+            }
+        )
+
+    def test_keep_alive(self):
+        model = self._create_model()
+        for i in range(5):
+            self.assertEqual(model.completion(f"p{i}", caller="test"), f"echo: p{i}")
+        self.assertEqual(len(self.server.connections), 1)
+        self.assertIs(get_transport(self.url), get_transport(self.url + "?other"))
+
+    def test_acompletion_with_inflight_cap(self):
+        self.server.delay = 0.1
+        model = self._create_model(max_inflight=2)
+
+        async def _run():
+            return await asyncio.gather(
+                *[model.acompletion(f"p{i}", caller="test") for i in range(6)]
+            )
+
+        outputs = asyncio.run(_run())
+        self.assertEqual(outputs, [f"echo: p{i}" for i in range(6)])
+        self.assertLessEqual(self.server.peak, 2)
+        summary = get_transport(self.url).get_summary()
+        self.assertEqual(summary["requests"], 6)
+        self.assertEqual(summary["peak"], 2)
+        self.assertIn("S:6", model.get_summary()["summary"]["test"])
+
+
+if __name__ == '__main__':
+    unittest.main()
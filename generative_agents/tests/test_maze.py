@@ -0,0 +1,173 @@
+"""
+地图测试模块
+验证紧凑存储的Maze：瓦片视图的地址、碰撞与事件，稀疏的事件存储与事件索引，以及二进制缓存
+"""
+
+import unittest
+import os
+import sys
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules import utils
+from modules.maze import Maze, Tile, MazeTile
+from modules.memory.event import Event
+
+
+MAZE_PATH = os.path.join(os.path.dirname(__file__), "..", "frontend/static/assets/village/maze.json")
+
+
+class TestMaze(unittest.TestCase):
+    """紧凑地图测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = utils.load_dict(MAZE_PATH)
+
+    def setUp(self):
+        self.maze = Maze(self.config, None)
+
+    def test_tiles_match_config(self):
+        world, keys = self.config["world"], self.config["tile_address_keys"]
+        for tile_config in self.config["tiles"][::20]:
+            coord = tuple(tile_config["coord"])
+            expected = Tile(coord, world, keys, tile_config.get("address"), tile_config.get("collision", False))
+            tile = self.maze.tile_at(coord)
+            self.assertIsInstance(tile, MazeTile)
+            self.assertEqual(tile, expected)
+            self.assertEqual(tile.address, expected.address)
+            self.assertEqual(tile.collision, expected.collision)
+            self.assertEqual(tile.address_map, expected.address_map)
+            self.assertEqual(tile.get_addresses(), expected.get_addresses())
+            self.assertEqual([str(e) for e in tile.get_events()], [str(e) for e in expected.get_events()])
+            for key in keys:
+                self.assertEqual(tile.has_address(key), expected.has_address(key))
+        # 配置不会被修改，可以重复建立地图
+        self.assertIn("coord", self.config["tiles"][0])
+
+    def test_sparse_events(self):
+        coord = (50, 40)
+        self.assertEqual(self.maze.tile_at(coord).address, [self.config["world"]])
+        self.assertNotIn(coord, self.maze.tile_events)
+        event = Event("伊莎贝拉", "正在", "散步", address=self.maze.tile_at(coord).get_address())
+        self.maze.tile_at(coord).add_event(event)
+        self.maze.tile_at(coord).add_event(event)
+        self.assertEqual(list(self.maze.tile_at(coord).get_events()), [event])
+        self.maze.tile_at(coord).remove_events(subject="伊莎贝拉")
+        self.assertNotIn(coord, self.maze.tile_events)
+        self.assertTrue(self.maze.tile_at(coord).is_empty)
+
+    def test_collision_and_scope(self):
+        coord = (72, 14)
+        self.maze.tile_at(coord).collision = True
+        self.assertTrue(self.maze.collision[14, 72])
+        self.assertNotIn(coord, self.maze.find_path((70, 14), (74, 14)))
+        scope = self.maze.get_scope(coord, {"mode": "box", "vision_r": 8})
+        self.assertEqual(len(scope), 17 * 17)
+        self.assertEqual(self.maze.tile_at((-1, 0)).coord, (self.maze.maze_width - 1, 0))
+        with self.assertRaises(IndexError):
+            self.maze.tile_at((self.maze.maze_width, 0))
+
+
+class TestEventIndex(unittest.TestCase):
+    """事件索引与视野查询测试"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.config = utils.load_dict(MAZE_PATH)
+
+    def setUp(self):
+        self.maze = Maze(self.config, None)
+        self.scope = {"mode": "box", "vision_r": 8}
+
+    def _scan(self, coord, arena):
+        # 原有的逐瓦片扫描
+        return {
+            tile.coord: dict(tile.events)
+            for tile in self.maze.get_scope(coord, self.scope)
+            if tile.events and tile.get_address("arena") == arena
+        }
+
+    def test_scope_matches_scan(self):
+        random.seed(0)
+        walkable = [(x, y) for y, x in zip(*self.maze.path_finder.walkable.nonzero())]
+        for i, coord in enumerate(random.sample(walkable, 20)):
+            self.maze.tile_at(coord).add_event(Event("agent_" + str(i), "此时", "散步"))
+        for coord in random.sample(walkable, 50) + [(0, 0)]:
+            arena = self.maze.tile_at(coord).get_address("arena")
+            scope_events = self.maze.get_scope_events(coord, self.scope, arena=arena)
+            self.assertEqual(list(scope_events.items()), list(self._scan(coord, arena).items()))
+            objects = [t.address for t in self.maze.get_scope(coord, self.scope) if t.has_address("game_object")]
+            self.assertEqual(
+                self.maze.get_scope_objects(coord, self.scope), [list(a) for a in dict.fromkeys(map(tuple, objects))]
+            )
+
+    def test_index_and_versions(self):
+        coord = (50, 40)
+        arena = self.maze.arena_of(coord)
+        version = self.maze.scope_version(coord, self.scope)
+        self.maze.tile_at(coord).add_event(Event("伊莎贝拉", "此时", "散步"))
+        self.assertIn(coord, self.maze.get_scope_events(coord, self.scope, arena=arena))
+        self.assertGreater(self.maze.scope_version(coord, self.scope), version)
+
+        # 同一事件不会重复添加，版本不变；其他区域的版本不受影响
+        version = self.maze.scope_version(coord, self.scope)
+        far_version = self.maze.scope_version((120, 80), self.scope)
+        self.maze.tile_at(coord).add_event(Event("伊莎贝拉", "此时", "散步"))
+        self.assertEqual(self.maze.scope_version(coord, self.scope), version)
+        self.maze.tile_at(coord).update_events(Event("伊莎贝拉", "此时", "跑步"))
+        self.assertGreater(self.maze.scope_version(coord, self.scope), version)
+        self.assertEqual(self.maze.scope_version((120, 80), self.scope), far_version)
+
+        self.maze.tile_at(coord).remove_events(subject="伊莎贝拉")
+        self.assertNotIn(coord, self.maze.get_scope_events(coord, self.scope))
+        indexed = [c for cells in self.maze.event_index.values() for tiles in cells.values() for c in tiles]
+        self.assertEqual(sorted(indexed), sorted(self.maze.tile_events))
+
+
+class TestMazeCache(unittest.TestCase):
+    """地图二进制缓存测试"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "maze.json")
+        shutil.copy(MAZE_PATH, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_cache_round_trip(self):
+        parsed = Maze.load(self.path)
+        self.assertTrue(os.path.exists(Maze.cache_path(self.path)))
+        self.assertIsNotNone(Maze.read_cache(self.path))
+        cached = Maze.load(self.path)
+        self.assertEqual(cached.address_tiles, parsed.address_tiles)
+        self.assertTrue((cached.collision == parsed.collision).all())
+        self.assertEqual(cached.path_finder._components, parsed.path_finder._components)
+        for coord in [(72, 14), (50, 40), (0, 0)]:
+            self.assertEqual(cached.tile_at(coord).address, parsed.tile_at(coord).address)
+            self.assertEqual(
+                [str(e) for e in cached.tile_at(coord).get_events()],
+                [str(e) for e in parsed.tile_at(coord).get_events()],
+            )
+        self.assertEqual(cached.find_path((72, 14), (50, 40)), parsed.find_path((72, 14), (50, 40)))
+
+    def test_cache_invalidation(self):
+        Maze.load(self.path)
+        # 只修改时间变化时按内容校验，仍然有效
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNotNone(Maze.read_cache(self.path))
+        config = utils.load_dict(self.path)
+        config["tiles"] = [t for t in config["tiles"] if t.get("address", [None])[0] != "伊莎贝拉的公寓"]
+        utils.save_dict(config, self.path)
+        self.assertIsNone(Maze.read_cache(self.path))
+        maze = Maze.load(self.path)
+        self.assertNotIn("the Ville:伊莎贝拉的公寓", maze.address_tiles)
+        self.assertNotIn("the Ville:伊莎贝拉的公寓", Maze.load(self.path).address_tiles)
+
+
+if __name__ == '__main__':
+    unittest.main()
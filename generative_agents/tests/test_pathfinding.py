@@ -0,0 +1,132 @@
+"""
+寻路测试模块
+验证A*最短路径、多目标搜索、不可达目标以及与经典地图的集成
+"""
+
+import unittest
+import os
+import sys
+import random
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules import utils
+from modules.maze import Maze
+from modules.pathfinding import GridPathFinder, FlowField
+
+
+GRID = [
+    "..........",
+    ".####.###.",
+    ".#......#.",
+    ".#.####.#.",
+    "...#..#...",
+    "####..####",
+    "..........",
+]
+
+
+def bfs_length(walkable, src, dst):
+    height, width = walkable.shape
+    queue, seen = deque([(src, 1)]), {src}
+    while queue:
+        (x, y), length = queue.popleft()
+        if (x, y) == dst:
+            return length
+        for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= nx < width and 0 <= ny < height and walkable[ny, nx] and (nx, ny) not in seen:
+                seen.add((nx, ny))
+                queue.append(((nx, ny), length + 1))
+    return 0
+
+
+class TestPathFinding(unittest.TestCase):
+    """A*寻路测试"""
+
+    def setUp(self):
+        self.walkable = np.array([[c == "." for c in row] for row in GRID])
+        self.finder = GridPathFinder(self.walkable)
+
+    def _check_path(self, path, src):
+        self.assertEqual(path[0], src)
+        for (x1, y1), (x2, y2) in zip(path, path[1:]):
+            self.assertEqual(abs(x1 - x2) + abs(y1 - y2), 1)
+            self.assertTrue(self.walkable[y2, x2])
+
+    def test_shortest_path(self):
+        coords = [(x, y) for y, x in zip(*self.walkable.nonzero())]
+        random.seed(0)
+        # 重复使用同一组缓冲区
+        for _ in range(50):
+            src, dst = random.sample(coords, 2)
+            path = self.finder.find_path(src, [dst])
+            self.assertEqual(len(path), bfs_length(self.walkable, src, dst))
+            if path:
+                self._check_path(path, src)
+                self.assertEqual(path[-1], dst)
+
+    def test_multi_target(self):
+        # (9, 6)所在区域不可达，(9, 4)比(2, 2)更远
+        path = self.finder.find_path((0, 0), [(9, 6), (9, 4), (2, 2)])
+        self._check_path(path, (0, 0))
+        self.assertEqual(path[-1], (2, 2))
+        self.assertEqual(len(path), bfs_length(self.walkable, (0, 0), (2, 2)))
+        self.assertEqual(self.finder.find_path((4, 4), [(4, 4), (0, 0)]), [(4, 4)])
+
+    def test_unreachable(self):
+        # 被墙围住的区域、碰撞瓦片和地图外的目标都直接返回空路径
+        self.assertEqual(self.finder.find_path((0, 0), [(2, 1)]), [])
+        self.assertEqual(self.finder.find_path((0, 0), [(20, 20)]), [])
+        walkable = self.walkable.copy()
+        walkable[4, 0:3] = False
+        self.assertEqual(GridPathFinder(walkable).find_path((0, 0), [(0, 6)]), [])
+
+    def test_flow_field(self):
+        goals = [(2, 2), (9, 4), (9, 6)]
+        field = FlowField(self.walkable, goals)
+        for y, x in zip(*self.walkable.nonzero()):
+            path = field.path((x, y))
+            expected = self.finder.find_path((x, y), goals)
+            self.assertEqual(len(path), len(expected))
+            if path:
+                self._check_path(path, (x, y))
+                self.assertIn(path[-1], goals)
+                self.assertEqual(field.distance((x, y)), len(path) - 1)
+        # 从不可通行的瓦片出发
+        self.assertEqual(field.path((1, 1))[:2], [(1, 1), (0, 1)])
+        # 距离和下一步都以int32数组保存
+        self.assertEqual(field.nbytes, self.walkable.size * 8)
+
+    def test_maze_find_path(self):
+        maze_path = os.path.join(os.path.dirname(__file__), "..", "frontend/static/assets/village/maze.json")
+        maze = Maze(utils.load_dict(maze_path), None)
+        tiles = list(maze.address_tiles["the Ville:亚瑟的公寓:主人房:床"])
+        src = (72, 14)
+        path = maze.find_path_any(src, tiles)
+        self.assertIn(path[-1], tiles)
+        self.assertEqual(len(path), min(len(maze.find_path(src, t)) or 10**6 for t in tiles))
+        for (x, y) in path[1:]:
+            self.assertFalse(maze.tile_at((x, y)).collision)
+
+        # 流场路径与A*长度一致，碰撞变化后流场失效
+        address = "the Ville:亚瑟的公寓:主人房:床"
+        self.assertEqual(len(maze.find_path_to_address(src, address)), len(path))
+        self.assertIs(maze.get_flow_field(address), maze.get_flow_field(address.split(":")))
+        maze.set_collision(path[len(path) // 2])
+        flow_path = maze.find_path_to_address(src, address)
+        self.assertNotIn(path[len(path) // 2], flow_path)
+        self.assertEqual(len(flow_path), len(maze.find_path_any(src, tiles)))
+
+        # 流场按LRU淘汰
+        maze.max_flow_fields = 2
+        addresses = list(maze.address_tiles)[:3]
+        for addr in addresses + addresses[1:2]:
+            maze.get_flow_field(addr)
+        self.assertEqual(list(maze._flow_fields), [addresses[2], addresses[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
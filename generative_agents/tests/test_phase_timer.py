@@ -0,0 +1,47 @@
+"""
+认知阶段计时测试模块
+验证阶段耗时、LLM耗时归属以及本轮与累计统计
+"""
+
+import unittest
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules.utils import PhaseTimer
+
+
+class TestPhaseTimer(unittest.TestCase):
+    """认知阶段计时测试"""
+
+    def test_llm_charged_to_innermost_phase(self):
+        timer = PhaseTimer()
+        timer.begin()
+        with timer.phase("make_plan"):
+            time.sleep(0.02)
+            timer.add_llm(0.01)
+            with timer.phase("chat"):
+                timer.add_llm(0.005)
+        timer.add_llm(1.0)
+
+        summary = timer.get_summary()
+        self.assertEqual(set(summary.keys()), {"make_plan", "chat"})
+        self.assertEqual(summary["make_plan"]["llm_calls"], 1)
+        self.assertEqual(summary["make_plan"]["llm_ms"], 10.0)
+        self.assertEqual(summary["chat"]["llm_ms"], 5.0)
+        self.assertGreaterEqual(summary["make_plan"]["wall_ms"], 20.0)
+
+    def test_latest_and_total(self):
+        timer = PhaseTimer()
+        for _ in range(3):
+            timer.begin()
+            with timer.phase("percept"):
+                pass
+        self.assertEqual(timer.get_summary()["percept"]["calls"], 1)
+        self.assertEqual(timer.get_summary(latest=False)["percept"]["calls"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+"""
+批量重要性评分测试模块
+验证poignancy_batch响应的解析、failsafe，以及Agent在批量评分失败或缺项时逐条评分
+"""
+
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules import utils
+from modules.agent import Agent
+from modules.memory.event import Event
+from modules.model.llm_model import LLMModel
+from modules.model.llm_health import reset_health_router
+
+
+class FakeLLMModel(LLMModel):
+    """按顺序返回预设响应的假模型"""
+
+    def setup(self, config):
+        self.responses = list(config["responses"])
+        return None
+
+    def _completion(self, prompt, **kwargs):
+        return self.responses.pop(0) if self.responses else "无法评分"
+
+
+def create_llm(*responses):
+    return FakeLLMModel(
+        {
+            "api_key": "",
+            "base_url": "",
+            "model": "fake",
+            "responses": responses,
+            "retry_backoff": {"base": 0.0, "cap": 0.0},
+        }
+    )
+
+
+class TestPoignancyBatchPrompt(unittest.TestCase):
+    """批量评分prompt与响应解析测试"""
+
+    def setUp(self):
+        from modules.prompt.scratch import Scratch
+
+        self.cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+        utils.set_timer("20240213-09:30")
+        self.scratch = Scratch(
+            "测试",
+            "在画画",
+            {"age": 25, "innate": "友好", "learned": "画画", "lifestyle": "早睡", "daily_plan": "画画"},
+        )
+        self.items = [
+            ("event", Event("小明", "正在", "散步")),
+            ("chat", Event("测试", "对话", "小明", describe="关于分手的对话")),
+            ("event", Event("小红", "正在", "唱歌")),
+        ]
+
+    def tearDown(self):
+        reset_health_router()
+        os.chdir(self.cwd)
+
+    def _parse(self, response):
+        return self.scratch.prompt_poignancy_batch(self.items)["callback"](response)
+
+    def test_prompt(self):
+        prompt = self.scratch.prompt_poignancy_batch(self.items)
+        self.assertIn("1. 事件：小明 正在 散步", prompt["prompt"])
+        self.assertIn("2. 对话：测试 关于分手的对话", prompt["prompt"])
+        self.assertIn("3. 事件：小红 正在 唱歌", prompt["prompt"])
+        self.assertEqual(prompt["failsafe"], {})
+
+    def test_numbering(self):
+        self.assertEqual(self._parse("1. 评分：2\n2. 评分：9\n3. 评分：4"), {0: 2, 1: 9, 2: 4})
+        self.assertEqual(self._parse("3、评分: 5\n1: 3\n2 7"), {0: 3, 1: 7, 2: 5})
+        # 重复的序号只取第一个评分
+        self.assertEqual(self._parse("1. 评分：2\n1. 评分：8"), {0: 2})
+
+    def test_invalid_scores(self):
+        response = "1. 评分：0\n2. 评分：11\n3. 评分：很高\n3. 评分：6"
+        self.assertEqual(self._parse(response), {2: 6})
+
+    def test_missing_and_extra_items(self):
+        self.assertEqual(self._parse("2. 评分：5"), {1: 5})
+        self.assertEqual(self._parse("1. 评分：5\n4. 评分：7\n0. 评分：3"), {0: 5})
+
+    def test_failsafe(self):
+        with self.assertRaises(AssertionError):
+            self._parse("这些事件都很普通")
+        # 无法解析的响应重试后返回空的failsafe
+        llm = create_llm("这些事件都很普通", "无法评分")
+        prompt = self.scratch.prompt_poignancy_batch(self.items)
+        self.assertEqual(llm.completion(**prompt, caller="poignancy_batch"), {})
+        self.assertEqual(llm.responses, [])
+
+
+class FakeIndex:
+    def __init__(self):
+        self.prefetched = []
+
+    def prefetch(self, texts):
+        self.prefetched.extend(texts)
+
+
+class FakeAssociate:
+    def __init__(self):
+        self.index = FakeIndex()
+        self.nodes = []
+
+    def add_node(self, e_type, event, poignancy, **kwargs):
+        self.nodes.append((e_type, event.get_describe(), poignancy))
+        return self.nodes[-1]
+
+
+class TestAddConcepts(unittest.TestCase):
+    """Agent批量评分的逐条降级测试"""
+
+    def setUp(self):
+        self.agent = Agent.__new__(Agent)
+        self.agent.name = "测试"
+        self.agent.associate = FakeAssociate()
+        self.agent.logger = utils.create_io_logger("error")
+        self.agent.calls = []
+        self.batch_scores = {}
+        self.agent.completion = self._completion
+        self.items = [
+            ("event", Event("小明", "正在", "散步")),
+            ("event", Event("小刚", "此时", "空闲")),
+            ("chat", Event("测试", "对话", "小明", describe="关于分手的对话")),
+            ("event", Event("小红", "正在", "唱歌")),
+        ]
+
+    def _completion(self, func_hint, *args):
+        self.agent.calls.append(func_hint)
+        if func_hint == "poignancy_batch":
+            self.assertEqual([e.get_describe() for _, e in args[0]], [
+                "小明 正在 散步", "测试 关于分手的对话", "小红 正在 唱歌"
+            ])
+            return self.batch_scores
+        return {"poignancy_event": 3, "poignancy_chat": 8}[func_hint]
+
+    def test_batch_scores(self):
+        self.batch_scores = {0: 4, 1: 9, 2: 2}
+        nodes = self.agent._add_concepts(self.items)
+        self.assertEqual([n[2] for n in nodes], [4, 1, 9, 2])
+        self.assertEqual(self.agent.calls, ["poignancy_batch"])
+        self.assertEqual(len(self.agent.associate.index.prefetched), 4)
+
+    def test_partial_scores(self):
+        self.batch_scores = {1: 9}
+        nodes = self.agent._add_concepts(self.items)
+        self.assertEqual([n[2] for n in nodes], [3, 1, 9, 3])
+        self.assertEqual(
+            self.agent.calls, ["poignancy_batch", "poignancy_event", "poignancy_event"]
+        )
+
+    def test_batch_failed(self):
+        self.batch_scores = {}
+        nodes = self.agent._add_concepts(self.items)
+        self.assertEqual([n[2] for n in nodes], [3, 1, 8, 3])
+        self.assertEqual(
+            self.agent.calls,
+            ["poignancy_batch", "poignancy_event", "poignancy_chat", "poignancy_event"],
+        )
+
+    def test_single_item(self):
+        nodes = self.agent._add_concepts(self.items[2:3])
+        self.assertEqual([n[2] for n in nodes], [8])
+        self.assertEqual(self.agent.calls, ["poignancy_chat"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Prompt模板注册表测试模块
+验证模板编译缓存、按mtime重新加载以及base_desc缓存
+"""
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules import utils
+from modules.prompt.template import TemplateRegistry
+
+
+class TestTemplateRegistry(unittest.TestCase):
+    """Prompt模板注册表测试"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self._write("hello", "你好，${name}")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name, content, mtime=None):
+        path = os.path.join(self.folder, name + ".txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        if mtime:
+            os.utime(path, (mtime, mtime))
+
+    def test_compiled_once(self):
+        registry = TemplateRegistry(self.folder, check_interval=60)
+        template = registry.get("hello")
+        self.assertIs(registry.get("hello"), template)
+        self.assertEqual(registry.render("hello", {"name": "小明"}), "你好，小明")
+        self.assertEqual(registry.names, ["hello"])
+
+    def test_reload_on_mtime(self):
+        registry = TemplateRegistry(self.folder, check_interval=0)
+        version = registry.version("hello")
+        self._write("hello", "再见，${name}", mtime=version + 10)
+        self.assertEqual(registry.render("hello", {"name": "小明"}), "再见，小明")
+        self.assertNotEqual(registry.version("hello"), version)
+
+
+class TestBaseDescCache(unittest.TestCase):
+    """base_desc缓存测试"""
+
+    def test_invalidate_on_currently(self):
+        from modules.prompt.scratch import Scratch
+
+        cwd = os.getcwd()
+        os.chdir(os.path.join(os.path.dirname(__file__), '..'))
+        try:
+            utils.set_timer("20240213-09:30")
+            scratch = Scratch(
+                "测试",
+                "在画画",
+                {"age": 25, "innate": "友好", "learned": "画画", "lifestyle": "早睡", "daily_plan": "画画"},
+            )
+            first = scratch._base_desc()
+            self.assertIs(scratch._base_desc(), first)
+            scratch.currently = "在散步"
+            self.assertIn("在散步", scratch._base_desc())
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    unittest.main()
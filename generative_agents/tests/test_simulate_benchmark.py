@@ -0,0 +1,44 @@
+"""
+模拟基准测试的冒烟测试
+验证基准使用实际存在的角色目录，离线运行一步并输出报告
+"""
+
+import unittest
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from benchmarks import simulate
+
+
+class TestSimulateBenchmark(unittest.TestCase):
+    """模拟基准冒烟测试"""
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.chdir(ROOT)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+
+    def test_find_agents(self):
+        agents = simulate.find_agents()
+        self.assertTrue(agents)
+        self.assertEqual(simulate.parse_args([]).agents, len(agents))
+        for name in agents:
+            path = os.path.join(simulate.agents_root, name, "agent.json")
+            self.assertTrue(os.path.isfile(path))
+
+    def test_one_step(self):
+        args = simulate.parse_args(["--agents", "2", "--step", "1"])
+        report = simulate.run_benchmark(args)
+        self.assertEqual(report["config"]["agents"], 2)
+        self.assertEqual(report["config"]["llm_mode"], "synthetic")
+        self.assertGreater(report["elapsed_s"], 0)
+        self.assertGreater(report["llm_calls"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
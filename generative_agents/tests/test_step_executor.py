@@ -0,0 +1,206 @@
+"""
+并行思考执行器测试模块
+验证Agent分组、结果顺序以及对话记录的合并顺序
+"""
+
+import unittest
+import os
+import sys
+import copy
+import json
+import time
+import random
+import shutil
+import tempfile
+import threading
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from modules import utils
+from modules.executor import StepExecutor
+from modules.game import Game
+
+
+class FakeAgent:
+    def __init__(self, name, coord, conversation, vision_r=8):
+        self.name = name
+        self.coord = coord
+        self.percept_config = {"vision_r": vision_r}
+        self.conversation = conversation
+        self._pending_conversation = []
+
+    def flush_conversation(self):
+        for key, record in self._pending_conversation:
+            self.conversation.setdefault(key, []).append(record)
+        self._pending_conversation = []
+
+
+class FakeGame:
+    def __init__(self, coords, delay=0.0):
+        self.conversation = {}
+        self.agents = {
+            n: FakeAgent(n, c, self.conversation) for n, c in coords.items()
+        }
+        self.delay = delay
+        self.threads = set()
+        self.calls = []
+
+    def get_agent(self, name):
+        return self.agents[name]
+
+    def prepare_think(self, name, status):
+        self.calls.append(("prepare", name))
+        self.agents[name].coord = status["coord"]
+        return {}
+
+    def think_agent(self, name, status, events=None):
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        self.agents[name]._pending_conversation.append(("step", name))
+        return {"plan": {"name": name}, "info": {}}
+
+    def commit_think(self, name, result):
+        self.calls.append(("commit", name))
+        self.get_agent(name).flush_conversation()
+
+
+class TestStepExecutor(unittest.TestCase):
+    """并行思考执行器测试"""
+
+    def setUp(self):
+        self.coords = {
+            "a": [10, 10],
+            "b": [80, 80],
+            "c": [12, 15],
+            "d": [40, 40],
+        }
+
+    def _status(self):
+        return {n: {"coord": c, "path": []} for n, c in self.coords.items()}
+
+    def test_group_agents(self):
+        game = FakeGame(self.coords)
+        executor = StepExecutor(game, workers=4)
+        groups = executor.group_agents(list(self.coords.keys()))
+        self.assertEqual(groups, [["a", "c"], ["b"], ["d"]])
+
+    def test_serial_fallback(self):
+        game = FakeGame(self.coords)
+        results = StepExecutor(game, workers=1).run(self._status())
+        self.assertEqual(list(results.keys()), ["a", "b", "c", "d"])
+        self.assertEqual(game.conversation["step"], ["a", "b", "c", "d"])
+
+    def test_parallel_is_ordered(self):
+        game = FakeGame(self.coords, delay=0.1)
+        executor = StepExecutor(game, workers=4)
+        start = time.time()
+        results = executor.run(self._status())
+        elapsed = time.time() - start
+        executor.shutdown()
+
+        self.assertEqual(list(results.keys()), ["a", "b", "c", "d"])
+        self.assertEqual(game.conversation["step"], ["a", "b", "c", "d"])
+        self.assertEqual(
+            game.calls,
+            [("prepare", n) for n in "abcd"] + [("commit", n) for n in "abcd"],
+        )
+        # a和c在同一组中串行执行，其余组并行
+        self.assertLess(elapsed, 0.35)
+        self.assertGreater(len(game.threads), 1)
+
+
+class TestStepExecutorGame(unittest.TestCase):
+    """真实Game上串行与并行思考的结果一致"""
+
+    agents_root = "frontend/static/assets/village/agents"
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        os.chdir(ROOT)
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        os.chdir(self.cwd)
+
+    def _config(self, workers):
+        with open("data/config.json", "r", encoding="utf-8") as f:
+            agent_base = json.load(f)["agent"]
+        agent_base["think"]["llm"] = {"provider": "replay", "mode": "synthetic"}
+        agent_base["associate"]["embedding"] = {"provider": "hash"}
+        agents = {}
+        for name in sorted(os.listdir(self.agents_root)):
+            path = os.path.join(self.agents_root, name, "agent.json")
+            if os.path.isfile(path) and "spatial" in utils.load_dict(path):
+                agents[name] = {"config_path": os.path.join("assets/village/agents", name, "agent.json")}
+        return {
+            "map_type": "classic",
+            "maze": {"path": "assets/village/maze.json"},
+            "agent_base": agent_base,
+            "agents": dict(list(agents.items())[:10]),
+            "workers": workers,
+            "seed": 7,
+            "storage_root": os.path.join(self.folder, str(workers)),
+        }
+
+    def _create_game(self, workers):
+        utils.set_timer(start="20240213-09:30")
+        config = self._config(workers)
+        game = Game("test-executor", "frontend/static", config, {}, logger=utils.create_io_logger("error"))
+        game.reset_game()
+        return game
+
+    def _simulate(self, workers, step=6):
+        # 全局random只在串行阶段使用，思考阶段使用Agent各自的随机数生成器
+        random.seed(0)
+        game = self._create_game(workers)
+        status = {
+            n: {"coord": a.coord, "path": []} for n, a in game.agents.items()
+        }
+        for _ in range(step):
+            results = game.agents_think(status)
+            for n, result in results.items():
+                if result["plan"].get("path"):
+                    status[n] = {"coord": result["plan"]["path"][-1], "path": []}
+            utils.get_timer().forward(10)
+        game.executor.shutdown()
+        state = {
+            n: {
+                "coord": list(a.coord),
+                "action": a.action.abstract(),
+                "associate": a.associate.abstract(),
+                "agent": a.to_dict(),
+            }
+            for n, a in game.agents.items()
+        }
+        return json.loads(json.dumps(state, default=str)), copy.deepcopy(game.conversation)
+
+    def test_parallel_matches_serial(self):
+        serial = self._simulate(1)
+        parallel = self._simulate(8)
+        self.assertEqual(parallel, serial)
+
+    def test_web_server_steps(self):
+        # 网页服务每一步先推进tick，再逐个调用agent_think
+        game = self._create_game(1)
+        states = {n: [] for n in game.agents}
+        for name, agent in game.agents.items():
+            def _reseed(seed, step, agent=agent, reseed=agent.reseed):
+                reseed(seed, step)
+                states[agent.name].append(agent.rng.getstate())
+
+            agent.reseed = _reseed
+        status = {n: {"coord": a.coord, "path": []} for n, a in game.agents.items()}
+        for _ in range(2):
+            game.tick()
+            for name in game.agents:
+                game.agent_think(name, status[name])
+            utils.get_timer().forward(10)
+        game.executor.shutdown()
+        for name, (first, second) in states.items():
+            self.assertNotEqual(first, second)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+"""
+向量索引测试模块
+验证节点的增删、按类型过滤的检索、持久化以及旧存档的读取
+"""
+
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules import utils
+from modules.memory.associate import Associate
+from modules.memory.event import Event
+from modules.storage.index import LlamaIndex, MetadataFilters, ExactMatchFilter
+
+
+class TestVectorIndex(unittest.TestCase):
+    """向量索引测试"""
+
+    def setUp(self):
+        utils.set_timer("20240213-09:30")
+        self.folder = tempfile.mkdtemp()
+        self.embedding = {"provider": "hash"}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _metadata(self, node_type):
+        return {
+            "node_type": node_type,
+            "create": "20240213-09:00:00",
+            "expire": "20240313-09:00:00",
+        }
+
+    def test_retrieve_with_filters(self):
+        index = LlamaIndex(self.embedding)
+        index.add_node("简 正在 厨房 做早餐", self._metadata("event"))
+        index.add_node("汤姆 正在 市场 卖菜", self._metadata("event"))
+        index.add_node("简 觉得 早餐 很好吃", self._metadata("thought"))
+
+        nodes = index.retrieve("简 做早餐", similarity_top_k=2)
+        self.assertEqual([n.id_ for n in nodes], ["node_0", "node_2"])
+        self.assertGreaterEqual(nodes[0].score, nodes[1].score)
+
+        filters = MetadataFilters(filters=[ExactMatchFilter(key="node_type", value="thought")])
+        nodes = index.retrieve("简 做早餐", filters=filters)
+        self.assertEqual([n.id_ for n in nodes], ["node_2"])
+        nodes = index.retrieve("简 做早餐", node_ids=["node_1"])
+        self.assertEqual([n.id_ for n in nodes], ["node_1"])
+
+        index.remove_nodes(["node_0"])
+        self.assertEqual(index.nodes_num, 2)
+        nodes = index.retrieve("简 做早餐", similarity_top_k=5)
+        self.assertEqual([n.id_ for n in nodes], ["node_2", "node_1"])
+
+    def test_save_and_load(self):
+        path = os.path.join(self.folder, "associate")
+        index = LlamaIndex(self.embedding, path)
+        for i in range(20):
+            index.add_node(f"事件 {i}", self._metadata("event"))
+        index.remove_nodes(["node_3", "node_7"])
+        index.save()
+
+        loaded = LlamaIndex(self.embedding, path)
+        self.assertEqual(loaded.nodes_num, 18)
+        self.assertEqual(loaded.add_node("事件 20").id_, "node_20")
+        self.assertEqual(loaded.retrieve("事件 15", similarity_top_k=1)[0].id_, "node_15")
+
+    def test_append_log(self):
+        path = os.path.join(self.folder, "log")
+        index = LlamaIndex(self.embedding, path)
+        for i in range(5):
+            index.add_node(f"事件 {i}", self._metadata("event"))
+        index.save()
+        snapshot = os.path.getmtime(os.path.join(path, "nodes.json"))
+
+        # 增量保存只追加日志，快照保持不变
+        index.add_node("事件 5", self._metadata("thought"))
+        index.remove_nodes(["node_1"])
+        index.touch([index._rows["node_2"]], "20240214-08:00:00")
+        index.save()
+        self.assertEqual(os.path.getmtime(os.path.join(path, "nodes.json")), snapshot)
+        with open(os.path.join(path, "nodes.log"), encoding="utf-8") as f:
+            self.assertEqual([json.loads(l)["op"] for l in f], ["add", "remove", "touch"])
+
+        # 写入中断的日志尾部被丢弃
+        with open(os.path.join(path, "nodes.log"), "a", encoding="utf-8") as f:
+            f.write('{"op": "remo')
+        loaded = LlamaIndex(self.embedding, path)
+        self.assertEqual(sorted(loaded._row_ids), ["node_0", "node_2", "node_3", "node_4", "node_5"])
+        self.assertEqual(loaded.find_node("node_2").metadata["access"], "20240214-08:00:00")
+        self.assertEqual(loaded.get_dates("node_2"), index.get_dates("node_2"))
+        self.assertEqual(loaded.retrieve("事件 5", similarity_top_k=1)[0].id_, "node_5")
+        self.assertEqual(loaded.add_node("事件 6").id_, "node_6")
+
+        # 压缩后日志被清空
+        loaded.save()
+        self.assertFalse(os.path.exists(os.path.join(path, "nodes.log")))
+        self.assertEqual(LlamaIndex(self.embedding, path).nodes_num, 6)
+
+    def test_mapped_snapshot(self):
+        texts = [f"主题{i % 7} 事件{i}" for i in range(40)]
+        for dtype in ["float32", "int8"]:
+            path = os.path.join(self.folder, "mapped_" + dtype)
+            index = LlamaIndex(self.embedding, path, dtype=dtype)
+            exact = LlamaIndex(self.embedding, dtype=dtype)
+            for text in texts[:30]:
+                index.add_node(text, self._metadata("event"))
+                exact.add_node(text, self._metadata("event"))
+            index.save()
+            snapshot = np.load(os.path.join(path, "embeddings.npy"))
+
+            # 快照保持映射，新增的行写入内存中的尾部，删除不修改快照文件
+            loaded = LlamaIndex(self.embedding, path, dtype=dtype)
+            self.assertIsInstance(loaded._base, np.memmap)
+            for text in texts[30:]:
+                loaded.add_node(text, self._metadata("event"))
+                exact.add_node(text, self._metadata("event"))
+            self.assertEqual(len(loaded._base), 30)
+            removed = ["node_2", "node_25", "node_33"]
+            loaded.remove_nodes(removed)
+            exact.remove_nodes(removed)
+            np.testing.assert_array_equal(np.load(os.path.join(path, "embeddings.npy")), snapshot)
+            np.testing.assert_array_equal(loaded.get_vectors(), exact.get_vectors())
+            for text in ["主题3 事件3", "主题5 事件36"]:
+                self.assertEqual(
+                    [(n.id_, n.score) for n in loaded.search(text, 5)],
+                    [(n.id_, n.score) for n in exact.search(text, 5)],
+                )
+
+            # 保存快照时合并，新快照成为基础部分
+            loaded._needs_snapshot = True
+            loaded.save()
+            self.assertEqual(len(loaded._base), 37)
+            self.assertEqual(len(loaded._matrix), 0)
+            np.testing.assert_array_equal(loaded.get_vectors(), exact.get_vectors())
+            reloaded = LlamaIndex(self.embedding, path, dtype=dtype)
+            np.testing.assert_array_equal(reloaded.get_vectors(), exact.get_vectors())
+
+    def test_ann_search(self):
+        path = os.path.join(self.folder, "ann")
+        index = LlamaIndex(self.embedding, path, ann={"nlist": 8, "nprobe": 8, "min_nodes": 100})
+        for i in range(300):
+            index.add_node(f"主题{i % 10} 事件{i}", self._metadata("event"))
+        # 探测全部列表时与精确检索一致
+        scores = index._matrix[: index.nodes_num] @ index._embed("主题3 事件3")
+        retrieved = [n.score for n in index.search("主题3 事件3", 10)]
+        np.testing.assert_allclose(retrieved, np.sort(scores)[::-1][:10], rtol=1e-5)
+        self.assertTrue(index._ann.trained)
+
+        # 删除和插入后节点仍在其所属的列表中，只探测一个列表也能找到自身
+        index._ann.nprobe = 1
+        index.remove_nodes(["node_{}".format(i) for i in range(0, 300, 3)])
+        for i in range(300, 320):
+            index.add_node(f"主题{i % 10} 事件{i}", self._metadata("event"))
+        for node_id in ["node_4", "node_299", "node_310"]:
+            text = index.find_node(node_id).text
+            self.assertEqual(index.search(text, 1)[0].id_, node_id)
+
+        index.save()
+        loaded = LlamaIndex(self.embedding, path, ann={"nprobe": 1, "min_nodes": 100})
+        self.assertEqual(loaded._ann.get_summary()["lists"], 8)
+        self.assertEqual(loaded.search("主题7 事件317", 1)[0].id_, "node_317")
+
+    def test_quantized_storage(self):
+        texts = [f"主题{i % 7} 事件{i}" for i in range(200)]
+        exact = LlamaIndex(self.embedding)
+        for text in texts:
+            exact.add_node(text, self._metadata("event"))
+        for dtype in ["float16", "int8"]:
+            path = os.path.join(self.folder, dtype)
+            index = LlamaIndex(self.embedding, path, dtype=dtype)
+            for text in texts:
+                index.add_node(text, self._metadata("event"))
+            self.assertEqual(index._matrix.dtype, np.dtype(dtype))
+            np.testing.assert_allclose(index.get_vectors(), exact.get_vectors(), atol=0.02)
+            for text in ["主题3 事件3", "主题5 事件150"]:
+                expected = exact.search(text, 1)[0]
+                self.assertEqual(index.search(text, 1)[0].id_, expected.id_)
+                self.assertAlmostEqual(index.search(text, 1)[0].score, expected.score, delta=0.02)
+
+            # 快照与增量日志都以量化后的精度保存
+            index.save()
+            index.add_node("主题1 新事件", self._metadata("event"))
+            index.save()
+            loaded = LlamaIndex(self.embedding, path, dtype=dtype)
+            np.testing.assert_array_equal(loaded.get_vectors(), index.get_vectors())
+            self.assertEqual(np.load(os.path.join(path, "embeddings.npy")).dtype, np.dtype(dtype))
+
+        # 以其他精度加载时转换已有的存档
+        converted = LlamaIndex(self.embedding, os.path.join(self.folder, "int8"))
+        self.assertEqual(converted._matrix.dtype, np.float32)
+        np.testing.assert_allclose(converted.get_vectors(), index.get_vectors(), atol=1e-6)
+
+    def test_load_legacy_storage(self):
+        path = os.path.join(self.folder, "legacy")
+        os.makedirs(path)
+        docs = {
+            "node_0": {"__data__": {"id_": "node_0", "text": "简 正在 睡觉", "metadata": self._metadata("event")}},
+        }
+        with open(os.path.join(path, "docstore.json"), "w", encoding="utf-8") as f:
+            json.dump({"docstore/data": docs}, f, ensure_ascii=False)
+        index = LlamaIndex(self.embedding, path)
+        self.assertEqual(index.find_node("node_0").text, "简 正在 睡觉")
+        self.assertEqual(index.retrieve("睡觉")[0].id_, "node_0")
+
+    def test_associate_retrieve(self):
+        associate = Associate(os.path.join(self.folder, "a"), self.embedding)
+        associate.add_node("event", Event("简", "正在", "做早餐", address=["厨房"]), 5)
+        associate.add_node("thought", Event("简", "觉得", "早餐很好吃", address=["厨房"]), 3)
+        associate.add_node("chat", Event("简", "对话", "汤姆", address=["厨房"]), 2)
+        self.assertEqual(len(associate.retrieve_events("做早餐")), 1)
+        focus = associate.retrieve_focus(["简 的早餐"])
+        self.assertEqual(sorted(c.node_type for c in focus), ["event", "thought"])
+
+    def test_retrieve_focus_scoring(self):
+        associate = Associate(os.path.join(self.folder, "f"), self.embedding)
+        objects = ["做早餐", "卖菜", "画画", "散步", "读书", "写诗", "整理店铺", "喝咖啡"]
+        for i, obj in enumerate(objects):
+            utils.get_timer().forward(10)
+            node_type = "thought" if i % 3 == 0 else "event"
+            associate.add_node(node_type, Event("简", "正在", obj, address=["家"]), i % 5 + 1)
+        config = associate._retrieve_config
+
+        # 逐条计算的参考实现：按相关度排序，再按访问时间排序得到近期度
+        nodes = associate.index.retrieve("简 正在 画画", similarity_top_k=len(objects))
+        nodes = sorted(nodes, key=lambda n: n.metadata["access"], reverse=True)
+        recency = associate._normalize(
+            [config["recency_decay"] ** i for i in range(1, len(nodes) + 1)], config["recency_weight"]
+        )
+        relevance = associate._normalize([n.score for n in nodes], config["relevance_weight"])
+        importance = associate._normalize(
+            [n.metadata["poignancy"] for n in nodes], config["importance_weight"]
+        )
+        scores = {n.id_: a + b + c for n, a, b, c in zip(nodes, recency, relevance, importance)}
+        expected = sorted(scores, key=lambda i: scores[i], reverse=True)[:3]
+
+        retrieved = associate.retrieve_focus(["简 正在 画画", "简 喝咖啡"], retrieve_max=3, reduce_all=False)
+        self.assertEqual([c.node_id for c in retrieved["简 正在 画画"]], expected)
+        self.assertEqual(len(retrieved["简 喝咖啡"]), 3)
+        now = utils.get_timer().get_date("%Y%m%d-%H:%M:%S")
+        self.assertEqual(associate.index.find_node(expected[0]).metadata["access"], now)
+
+
+    def test_cleanup_due_nodes(self):
+        import datetime
+
+        associate = Associate(os.path.join(self.folder, "c"), self.embedding)
+        now = utils.get_timer().get_date()
+        for i in range(6):
+            associate.add_node(
+                "event",
+                Event("简", "正在", f"事件{i}", address=["家"]),
+                1,
+                create=now,
+                expire=now + datetime.timedelta(hours=i + 1),
+            )
+        associate.add_node(
+            "thought", Event("简", "计划", "明天", address=["家"]), 1,
+            create=now + datetime.timedelta(days=1),
+        )
+        associate.cleanup_index()
+        # 创建时间晚于当前时间的节点被清理
+        self.assertEqual(associate.index.nodes_num, 6)
+        self.assertEqual(associate.memory["thought"], [])
+
+        utils.get_timer().forward(150)
+        associate.cleanup_index()
+        self.assertEqual(associate.memory["event"], ["node_5", "node_4", "node_3", "node_2"])
+        self.assertEqual(associate.index.nodes_num, 4)
+        self.assertEqual(associate.index.cleanup(), [])
+
+
+    def test_concept_cache(self):
+        associate = Associate(os.path.join(self.folder, "k"), self.embedding)
+        concept = associate.add_node("event", Event("简", "正在", "做早餐", address=["家", "厨房"]), 5)
+        self.assertIs(associate.find_concept(concept.node_id), concept)
+        self.assertEqual(concept.event.address, ["家", "厨房"])
+        self.assertEqual(concept.create, utils.get_timer().get_date())
+
+        utils.get_timer().forward(30)
+        retrieved = associate.retrieve_focus(["做早餐"])
+        self.assertIs(retrieved[0], concept)
+        self.assertEqual(concept.access, utils.get_timer().get_date())
+
+        utils.get_timer().forward(60 * 24 * 31)
+        associate.cleanup_index()
+        self.assertEqual(associate._concepts, {})
+
+    def test_recent_describes(self):
+        associate = Associate(os.path.join(self.folder, "k"), self.embedding, retention=2)
+        for obj in ["做早餐", "吃早餐", "洗碗"]:
+            associate.add_node("event", Event("简", "正在", obj, address=["家"]), 3)
+        associate.add_node("chat", Event("简", "对话", "汤姆", address=["家"]), 2)
+        expected = set(
+            c.describe for c in associate.retrieve_events() + associate.retrieve_chats()
+        )
+        self.assertEqual(associate.recent_describes("event", "chat"), expected)
+        self.assertNotIn("简 正在 做早餐", expected)
+
+        # 重新加载后窗口从memory重建
+        loaded = Associate(
+            os.path.join(self.folder, "k"), self.embedding, retention=2, **associate.to_dict()
+        )
+        self.assertEqual(loaded.recent_describes("event", "chat"), expected)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
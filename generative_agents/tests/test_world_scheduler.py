@@ -0,0 +1,59 @@
+"""
+世界调度器测试模块
+验证各子系统按步、按小时、按天的节奏运行
+"""
+
+import unittest
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from modules import utils
+from modules.scheduler import WorldScheduler
+
+
+class TestWorldScheduler(unittest.TestCase):
+    """世界调度器测试"""
+
+    def setUp(self):
+        self.timer = utils.set_timer("20240213-00:00")
+        self.scheduler = WorldScheduler()
+        self.calls = {"step": 0, "hour": 0, "day": 0}
+        for cadence in self.calls:
+            self.scheduler.register(cadence, self._counter(cadence), cadence)
+
+    def _counter(self, cadence):
+        def _count():
+            self.calls[cadence] += 1
+        return _count
+
+    def test_cadence(self):
+        # 10分钟一步，共模拟两天
+        for _ in range(6 * 48):
+            self.scheduler.tick()
+            self.timer.forward(10)
+        self.assertEqual(self.calls["step"], 288)
+        self.assertEqual(self.calls["hour"], 48)
+        self.assertEqual(self.calls["day"], 2)
+
+    def test_same_time_runs_once(self):
+        self.scheduler.tick()
+        self.scheduler.tick()
+        self.assertEqual(self.calls, {"step": 2, "hour": 1, "day": 1})
+
+    def test_summary(self):
+        self.scheduler.tick()
+        summary = self.scheduler.get_summary()
+        self.assertEqual(summary["step"], 1)
+        self.assertEqual(set(summary["systems"].keys()), {"step", "hour", "day"})
+        self.assertEqual(summary["systems"]["day"]["cadence"], "day")
+        self.assertEqual(summary["systems"]["day"]["calls"], 1)
+
+    def test_invalid_cadence(self):
+        with self.assertRaises(AssertionError):
+            self.scheduler.register("bad", lambda: None, "minute")
+
+
+if __name__ == '__main__':
+    unittest.main()
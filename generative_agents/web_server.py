@@ -109,6 +109,8 @@ class RealTimeSimulation:
         
         # 如果有游戏实例，使用真实的AI思考逻辑
         if self.game_instance:
+            # 每一步推进一次世界系统（环境、地形、经济、协作）
+            self.game_instance.tick()
             for name in list(self.agent_status.keys()):
                 try:
                     # 调用agent的真实思考逻辑